@@ -5,7 +5,9 @@ import sys
 
 def main() -> None:
     """Run administrative tasks."""
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sea_battle.settings')
+    # The tests run on SQLite and in-memory backends, the server settings need PostgreSQL and Redis
+    default_settings = 'sea_battle.loadtest_settings' if sys.argv[1:2] == ['test'] else 'sea_battle.settings'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', default_settings)
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
@@ -0,0 +1,59 @@
+from sea_battle.settings import *  # noqa: F401, F403
+from sea_battle.settings import BASE_DIR, SECRET_KEY, LEADERBOARD, MATCHMAKING, RATE_LIMIT
+
+SECRET_KEY = SECRET_KEY or 'loadtest'
+
+DEBUG = False
+
+# Two in-memory shards keep the battle affinity routing in use
+CHANNEL_LAYERS = {
+    alias: {
+        "BACKEND": "channels.layers.InMemoryChannelLayer",
+    } for alias in ("default", "battle-0", "battle-1")
+}
+
+BATTLE_CHANNEL_LAYERS = ["battle-0", "battle-1"]
+
+BATTLE_STATE_STORE = {
+    "BACKEND": "sea_battle_app.battle_state.ShardedBattleStateStore",
+    "CONFIG": {
+        "shards": [
+            {
+                "BACKEND": "sea_battle_app.battle_state.InMemoryBattleStateStore",
+            },
+        ] * 2,
+    },
+}
+
+PLAYER_SLOTS = {
+    "BACKEND": "sea_battle_app.player_slots.BattleRowSlots",
+}
+
+# All clients of the load test share one IP
+RATE_LIMIT = {
+    **RATE_LIMIT,
+    "BACKEND": "sea_battle_app.rate_limit.InMemoryRateLimiter",
+    "CONFIG": {},
+    "IP_RATE": 1_000_000,
+    "IP_BURST": 1_000_000,
+}
+
+LEADERBOARD = {
+    **LEADERBOARD,
+    "RANKING": {
+        "BACKEND": "sea_battle_app.leaderboard.InMemoryRanking",
+    },
+}
+
+MATCHMAKING = {
+    **MATCHMAKING,
+    "BACKEND": "sea_battle_app.matchmaking.InMemoryMatchmakingQueue",
+    "CONFIG": {},
+}
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': str(BASE_DIR / 'loadtest.sqlite3'),
+    }
+}
@@ -58,6 +58,11 @@ WSGI_APPLICATION = 'sea_battle.wsgi.application'
 
 ASGI_APPLICATION = 'sea_battle.asgi.application'
 
+# Redis instances that battles are spread over by address, e.g. '127.0.0.1:6379,127.0.0.1:6380'.
+# Both players of a battle and its state are kept on the same instance
+BATTLE_SHARDS = [(host, int(port)) for host, port in
+                 (shard.split(':') for shard in os.getenv('BATTLE_SHARDS', '127.0.0.1:6379').split(','))]
+
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
@@ -65,6 +70,131 @@ CHANNEL_LAYERS = {
             "hosts": [("127.0.0.1", 6379)],
         },
     },
+    **{
+        f"battle-{i}": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {
+                "hosts": [shard],
+            },
+        } for i, shard in enumerate(BATTLE_SHARDS)
+    },
+}
+
+BATTLE_CHANNEL_LAYERS = [f"battle-{i}" for i in range(len(BATTLE_SHARDS))]
+
+BATTLE_STATE_STORE = {
+    "BACKEND": "sea_battle_app.battle_state.ShardedBattleStateStore",
+    "CONFIG": {
+        "shards": [
+            {
+                "BACKEND": "sea_battle_app.battle_state.RedisBattleStateStore",
+                "CONFIG": {
+                    "host": host,
+                    "port": port,
+                },
+            } for host, port in BATTLE_SHARDS
+        ],
+    },
+}
+
+MATCHMAKING = {
+    "BACKEND": "sea_battle_app.matchmaking.RedisMatchmakingQueue",
+    "CONFIG": {
+        "host": "127.0.0.1",
+        "port": 6379,
+    },
+    "PAIRING_INTERVAL": 0,
+    "MAX_PAIRS_PER_BATCH": 100,
+    # Pair players searching in the same process first, see 'matchmaking.colocate_pairs'
+    "PREFER_COLOCATED": False,
+}
+
+RECONNECTION_GRACE_PERIOD = 60
+
+# 'BattleRowSlots' keeps players on the battle row and takes a slot by one conditional UPDATE
+PLAYER_SLOTS = {
+    "BACKEND": "sea_battle_app.player_slots.PlayerRowSlots",
+}
+
+METRICS = {
+    "ENABLED": True,
+    "SAMPLE_RATE": 1.0,
+}
+
+BOT = {
+    "IDLE_TIMEOUT": 300,
+}
+
+SPECTATORS = {
+    "ENABLED": True,
+    "FLUSH_INTERVAL": 0.2,
+}
+
+# Frames per second with bursts for every connection and for all connections from one IP.
+# Error replies to rejected and malformed frames are limited the same way, a connection that exceeds
+# the limit of such violations is closed
+RATE_LIMIT = {
+    "BACKEND": "sea_battle_app.rate_limit.RedisRateLimiter",
+    "CONFIG": {
+        "host": "127.0.0.1",
+        "port": 6379,
+    },
+    "ENABLED": True,
+    "CONNECTION_RATE": 10,
+    "CONNECTION_BURST": 30,
+    "IP_RATE": 100,
+    "IP_BURST": 300,
+    "ERROR_REPLY_RATE": 1,
+    "ERROR_REPLY_BURST": 5,
+    "VIOLATION_RATE": 1,
+    "VIOLATION_BURST": 20,
+}
+
+REAPER = {
+    "UNJOINED_AFTER": 3600,
+    "FINISHED_AFTER": 3600,
+    # It must be longer than any battle, because battles in progress are reaped as well
+    "ABANDONED_AFTER": 86400,
+    "BATCH_SIZE": 1000,
+    # Reap in every server process every 'INTERVAL' seconds, 0 leaves reaping to the 'reapbattles' command
+    "INTERVAL": 0,
+}
+
+# The largest bulk creation or the first round of a tournament and battles per INSERT query
+BULK_CREATION = {
+    "MAX_BATTLES": 10000,
+    "BATCH_SIZE": 1000,
+}
+
+# Bulk creation and tournaments are created by admins only, and their requests are throttled
+REST_FRAMEWORK = {
+    "DEFAULT_THROTTLE_RATES": {
+        "bulk_creation": "10/hour",
+    },
+}
+
+# Results of battles of authenticated users are written by batches, pages of the leaderboard are cached.
+# 'RANKING' keeps users in the leaderboard order to read their ranks, 'manage.py rankplayers' fills it from the database
+LEADERBOARD = {
+    "RANKING": {
+        "BACKEND": "sea_battle_app.leaderboard.RedisRanking",
+        "CONFIG": {
+            "host": "127.0.0.1",
+            "port": 6379,
+        },
+    },
+    "BATCH_SIZE": 100,
+    "FLUSH_INTERVAL": 1,
+    "INITIAL_RATING": 1000,
+    "WIN_POINTS": 25,
+    "LOSS_POINTS": 20,
+    "PAGE_SIZE": 50,
+    "CACHE_TIMEOUT": 10,
+}
+
+MOVE_LOG = {
+    "BATCH_SIZE": 500,
+    "FLUSH_INTERVAL": 1,
 }
 
 DATABASES = {
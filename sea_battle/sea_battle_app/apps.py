@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class SeaBattleAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'sea_battle_app'
+
+    def ready(self) -> None:
+        from sea_battle_app import metrics  # noqa: F401 connects the query counter to new database connections
+        from sea_battle_app import tournaments  # noqa: F401 copies results of battles into tournament brackets
@@ -1,11 +1,15 @@
-from copy import deepcopy
-from dataclasses import dataclass
+import random
+from dataclasses import dataclass, field as dataclass_field
 from enum import Enum
-from typing import NamedTuple, Union, Optional, Any, Callable
+from typing import NamedTuple, Union, Optional, Any, Callable, Iterator, Iterable, Sequence
 
 ShipCoordinates = list[list[int]]
 
-PlayerInfoAsDict = dict[str, Union[list[list[int]], Optional[list[ShipCoordinates]]]]
+PlayerInfoAsDict = dict[str, Union[int, list[int]]]
+
+FIELD_SIZE = 10
+
+SHIPS_SIZES = (4, 3, 3, 2, 2, 2, 1, 1, 1, 1)
 
 
 class BattleLogicException(Exception):
@@ -18,17 +22,168 @@ class CellState(Enum):
     nothing = 3
 
 
+def get_cell_index(x: int, y: int) -> int:
+    """The function that returns the bit index of the cell in the bitboard masks"""
+
+    return x * FIELD_SIZE + y
+
+
+def _get_halo_mask(cell_index: int) -> int:
+    x, y = divmod(cell_index, FIELD_SIZE)
+    mask = 0
+    for i in (-1, 0, 1):
+        for j in (-1, 0, 1):
+            new_x, new_y = x + i, y + j
+            if 0 <= new_x < FIELD_SIZE and 0 <= new_y < FIELD_SIZE:
+                mask |= 1 << get_cell_index(new_x, new_y)
+    return mask
+
+
+HALO_MASKS = tuple(_get_halo_mask(cell_index) for cell_index in range(FIELD_SIZE * FIELD_SIZE))
+
+
+def iter_cells(mask: int) -> Iterator[int]:
+    """The function that yields indexes of the set bits of the mask in ascending order"""
+
+    while mask:
+        lowest_bit = mask & -mask
+        yield lowest_bit.bit_length() - 1
+        mask ^= lowest_bit
+
+
+def coords_to_mask(ship_coords: ShipCoordinates) -> int:
+    mask = 0
+    for x, y in ship_coords:
+        if type(x) != int or type(y) != int:
+            raise TypeError('ship coordinates must be integers')
+        mask |= 1 << get_cell_index(x, y)
+    return mask
+
+
+def mask_to_coords(mask: int) -> ShipCoordinates:
+    return [list(divmod(cell_index, FIELD_SIZE)) for cell_index in iter_cells(mask)]
+
+
+def get_halo(mask: int) -> int:
+    """The function that returns the mask of the cells adjacent to the mask cells (the cells themselves included)"""
+
+    halo = 0
+    for cell_index in iter_cells(mask):
+        halo |= HALO_MASKS[cell_index]
+    return halo
+
+
+def _get_forbidden_masks_by_ship() -> dict[int, int]:
+    """The function that maps every correctly placed ship mask to the mask of the cells adjacent to it"""
+
+    forbidden_masks = {}
+    for size in range(1, 5):
+        for x in range(FIELD_SIZE):
+            for y in range(FIELD_SIZE):
+                for ship_coords in ([[x, y + i] for i in range(size)], [[x + i, y] for i in range(size)]):
+                    if all(coord < FIELD_SIZE for cell_coord in ship_coords for coord in cell_coord):
+                        ship = coords_to_mask(ship_coords)
+                        forbidden_masks[ship] = get_halo(ship) & ~ship
+    return forbidden_masks
+
+
+FORBIDDEN_MASKS_BY_SHIP = _get_forbidden_masks_by_ship()
+
+
+def get_ship_placements(size: int, field_size: int = FIELD_SIZE) -> list[tuple[int, int]]:
+    """
+    The function that returns '(ship mask, ship and halo mask)' pairs of every placement of the ship on the field
+
+    The bit index of the cell is 'x * field_size + y', so 'sample_fleet' can be checked on a smaller field
+    """
+
+    def get_mask(cells: Iterable[tuple[int, int]]) -> int:
+        return sum(1 << x * field_size + y for x, y in set(cells) if 0 <= x < field_size and 0 <= y < field_size)
+
+    placements = {}
+    for x in range(field_size):
+        for y in range(field_size):
+            for ship_cells in ([(x, y + i) for i in range(size)], [(x + i, y) for i in range(size)]):
+                if max(max(cell) for cell in ship_cells) < field_size:
+                    halo_cells = ((ship_x + i, ship_y + j) for ship_x, ship_y in ship_cells
+                                  for i in (-1, 0, 1) for j in (-1, 0, 1))
+                    placements[get_mask(ship_cells)] = get_mask(halo_cells)
+    return list(placements.items())
+
+
+PLACEMENTS_BY_SIZE = {size: get_ship_placements(size) for size in range(1, 5)}
+
+FLEET_PLACEMENTS = tuple(PLACEMENTS_BY_SIZE[size] for size in SHIPS_SIZES)
+
+
+@dataclass
+class Bitboard:
+    """
+    The compact state of the player's field
+
+    Every mask holds one bit per cell, the bit index is 'x * 10 + y'.
+    'ships' contains occupancy masks of the living ships only,
+    'shots' is the number of shots taken at the field
+    """
+
+    hit: int = 0
+    missed: int = 0
+    ships: list[int] = dataclass_field(default_factory=list)
+    shots: int = 0
+
+    def as_dict(self) -> PlayerInfoAsDict:
+        return {'hit': self.hit, 'missed': self.missed, 'ships': self.ships, 'shots': self.shots}
+
+    @staticmethod
+    def from_dict(data: PlayerInfoAsDict) -> 'Bitboard':
+        return Bitboard(data['hit'], data['missed'], list(data['ships']), data['shots'])  # type: ignore
+
+    def get_cell_state(self, cell_index: int) -> CellState:
+        cell_mask = 1 << cell_index
+        if self.hit & cell_mask:
+            return CellState.hit
+        if self.missed & cell_mask:
+            return CellState.missed
+        return CellState.nothing
+
+    def field_as_int(self) -> list[list[int]]:
+        return [[self.get_cell_state(get_cell_index(x, y)).value for y in range(FIELD_SIZE)]
+                for x in range(FIELD_SIZE)]
+
+    def cells_as_int(self, mask: int) -> list[list[int]]:
+        """The method that returns '[x, y, cell state]' of every cell of the mask"""
+
+        return [[*divmod(cell_index, FIELD_SIZE), self.get_cell_state(cell_index).value]
+                for cell_index in iter_cells(mask)]
+
+
 @dataclass
 class PlayerInfo:
-    field: list[list[CellState]]
-    ships_coordinates: list[ShipCoordinates]
+    """The adapter that provides the list-based interface to the player's bitboard"""
+
+    board: Bitboard = dataclass_field(default_factory=Bitboard)
+
+    @property
+    def field(self) -> list[list[CellState]]:
+        return [[CellState(cell) for cell in cell_row] for cell_row in self.board.field_as_int()]
+
+    @property
+    def ships_coordinates(self) -> list[ShipCoordinates]:
+        return [mask_to_coords(ship) for ship in self.board.ships]
+
+    @ships_coordinates.setter
+    def ships_coordinates(self, ships_coordinates: list[ShipCoordinates]) -> None:
+        self.board.ships = [coords_to_mask(ship_coords) for ship_coords in ships_coordinates]
 
     def field_as_int(self) -> list[list[int]]:
-        return [[cell if isinstance(cell, int) else cell.value for cell in cell_row]
-                for cell_row in self.field]
+        return self.board.field_as_int()
 
     def as_dict(self) -> PlayerInfoAsDict:
-        return {'field': self.field_as_int(), 'ships_coordinates': self.ships_coordinates}
+        return self.board.as_dict()
+
+    @staticmethod
+    def from_dict(data: PlayerInfoAsDict) -> 'PlayerInfo':
+        return PlayerInfo(Bitboard.from_dict(data))
 
 
 class BattleInfo(NamedTuple):
@@ -36,9 +191,9 @@ class BattleInfo(NamedTuple):
     second_player: PlayerInfo
 
     @staticmethod
-    def from_dict(data: dict[str, dict]) -> 'BattleInfo':
-        first_player = PlayerInfo(**data['first_player'])
-        second_player = PlayerInfo(**data['second_player'])
+    def from_dict(data: dict[str, PlayerInfoAsDict]) -> 'BattleInfo':
+        first_player = PlayerInfo.from_dict(data['first_player'])
+        second_player = PlayerInfo.from_dict(data['second_player'])
         return BattleInfo(first_player, second_player)
 
     def as_dict(self) -> dict[str, PlayerInfoAsDict]:
@@ -46,15 +201,17 @@ class BattleInfo(NamedTuple):
 
 
 def create_battle() -> BattleInfo:
-    empty_field = [[CellState.nothing for _ in range(10)] for _ in range(10)]
-    first_player = PlayerInfo(empty_field, [])
-    second_player = PlayerInfo(deepcopy(empty_field), [])
-    return BattleInfo(first_player, second_player)
+    return BattleInfo(PlayerInfo(), PlayerInfo())
 
 
 def validate_ships_coords(ships_coords: list[ShipCoordinates]) -> tuple[bool, str]:
     try:
-        _validate_ships_coords(ships_coords)
+        ships = get_ships_masks(ships_coords)
+        if ships is None:
+            # The old validator only picks the error message, data that has no exact masks is never accepted
+            _validate_ships_coords(ships_coords)
+            raise TypeError
+        _validate_ships_masks(ships)
     except BattleLogicException as e:
         return False, str(e)
     except Exception:
@@ -62,6 +219,70 @@ def validate_ships_coords(ships_coords: list[ShipCoordinates]) -> tuple[bool, st
     return True, ''
 
 
+def validate_many_ships_coords(many_ships_coords: Iterable[list[ShipCoordinates]]) -> list[tuple[bool, str]]:
+    """The function that validates a batch of fleets, e.g. generated by bots or load tests"""
+
+    return [validate_ships_coords(ships_coords) for ships_coords in many_ships_coords]
+
+
+def get_ships_masks(ships_coords: list[ShipCoordinates]) -> Optional[list[int]]:
+    """
+    The function that converts well-formed ships coordinates to the occupancy masks
+
+    Returns 'None' if the data can't be represented by masks without losing information
+    (wrong types, coordinates out of the field, repeated cells within a ship)
+    """
+
+    if type(ships_coords) != list or len(ships_coords) != 10:
+        return None
+
+    ships = []
+    for ship_coords in ships_coords:
+        if type(ship_coords) != list:
+            return None
+        ship = 0
+        for cell_coord in ship_coords:
+            if type(cell_coord) != list or len(cell_coord) != 2:
+                return None
+            x, y = cell_coord
+            if type(x) != int or type(y) != int or not 0 <= x < FIELD_SIZE or not 0 <= y < FIELD_SIZE:
+                return None
+            ship |= 1 << get_cell_index(x, y)
+        if ship.bit_count() != len(ship_coords):
+            return None
+        ships.append(ship)
+    return ships
+
+
+def _validate_ships_masks(ships: list[int]) -> None:
+    """The function that validates ships in one pass. Raises the same errors as '_validate_ships_coords'"""
+
+    occupied = 0
+    for ship in ships:
+        if ship & occupied:
+            raise BattleLogicException('incorrect ships coordinates')
+        occupied |= ship
+    if occupied.bit_count() != 20:
+        raise BattleLogicException('incorrect ships coordinates')
+
+    forbidden, ships_count_by_size = 0, [0, 0, 0, 0]
+    for ship in ships:
+        size = ship.bit_count()
+        if size == 0 or size > 4:
+            raise BattleLogicException('incorrect ship size')
+        ships_count_by_size[size - 1] += 1
+
+        ship_forbidden = FORBIDDEN_MASKS_BY_SHIP.get(ship)
+        if ship_forbidden is None:
+            raise BattleLogicException('incorrect ship coordinates')
+        if ship & forbidden:
+            raise BattleLogicException('ships cant be nearby')
+        forbidden |= ship_forbidden
+
+    if ships_count_by_size != [4, 3, 2, 1]:
+        raise BattleLogicException('incorrect ratio of ships')
+
+
 def _validate_ships_coords(ships_coords: list[ShipCoordinates]) -> None:
     if not isinstance(ships_coords, list):
         raise TypeError
@@ -138,8 +359,8 @@ def add_forbidden_cells(ship_coords: ShipCoordinates, new_cell: list[int],
         forbidden_cells.append(new_cell)
 
 
-def shot_is_valid(shot_coordinates: list[int], field: list[list[CellState]]) -> bool:
-    if not isinstance(field, list):
+def shot_is_valid(shot_coordinates: list[int], player_info: PlayerInfo) -> bool:
+    if not isinstance(shot_coordinates, list):
         return False
     if len(shot_coordinates) != 2:
         return False
@@ -147,59 +368,89 @@ def shot_is_valid(shot_coordinates: list[int], field: list[list[CellState]]) ->
         return False
     if any([coord not in range(0, 10) for coord in shot_coordinates]):
         return False
-    x, y = shot_coordinates
-    if field[x][y] not in (CellState.nothing, 3):
-        return False
-    return True
+    board = player_info.board
+    cell_mask = 1 << get_cell_index(*shot_coordinates)
+    return not (board.hit | board.missed) & cell_mask
 
 
 def process_shot(shot_coordinates: list[int], player_info: PlayerInfo) -> bool:
     """The function that processes a valid shot. Returns 'true' if ship was hit and 'false' if not"""
 
-    x, y = shot_coordinates
-    ship_index = get_affected_ship_index(shot_coordinates, player_info)
+    board = player_info.board
+    board.shots += 1
+    cell_mask = 1 << get_cell_index(*shot_coordinates)
+    ship_index = get_affected_ship_index(cell_mask, board)
 
     if ship_index is not None:
-        player_info.field[x][y] = CellState.hit
-        ship = player_info.ships_coordinates[ship_index]
+        board.hit |= cell_mask
+        ship = board.ships[ship_index]
 
-        if did_ship_destroy(ship, player_info.field):
-            process_cells_adjacent_to_ship(ship, process_ship_destruction, player_info)
-            del player_info.ships_coordinates[ship_index]
+        if did_ship_destroy(ship, board):
+            board.missed |= get_halo(ship) & ~ship
+            del board.ships[ship_index]
 
         return True
 
-    player_info.field[x][y] = CellState.missed
+    board.missed |= cell_mask
     return False
 
 
-def get_affected_ship_index(shot_coordinates: list[int], player_info: PlayerInfo) -> Optional[int]:
+def get_affected_ship_index(cell_mask: int, board: Bitboard) -> Optional[int]:
     """The function that processes hitting the ship. Returns the ship index if ship was hit and 'None' if not"""
 
-    for i, ship_coords in enumerate(player_info.ships_coordinates):
-        if shot_coordinates in ship_coords:
+    for i, ship in enumerate(board.ships):
+        if ship & cell_mask:
             return i
     return None
 
 
-def did_ship_destroy(ship_coords: list[list[int]], field: list[list[CellState]]) -> bool:
-    for x, y in ship_coords:
-        if field[x][y] != CellState.hit:
-            return False
-    return True
+def did_ship_destroy(ship: int, board: Bitboard) -> bool:
+    return ship & ~board.hit == 0
 
 
-def process_ship_destruction(ship_coords: ShipCoordinates, new_cell: list[int], player_info: PlayerInfo) -> None:
-    """The function that sets neighbours cell with the ship in 'hit'"""
-
-    if new_cell not in ship_coords:
-        player_info.field[new_cell[0]][new_cell[1]] = CellState.missed
-
-
-def get_ships_count(ships_coordinates: list[ShipCoordinates]) -> dict[str, int]:
+def get_ships_count(player_info: PlayerInfo) -> dict[str, int]:
     """The function that returns count living ships count"""
 
     ships_count = {'1': 0, '2': 0, '3': 0, '4': 0}
-    for ship_coords in ships_coordinates:
-        ships_count[str(len(ship_coords))] += 1
+    for ship in player_info.board.ships:
+        ships_count[str(ship.bit_count())] += 1
     return ships_count
+
+
+def generate_fleet_masks(rng: random.Random) -> list[int]:
+    """The function that returns the masks of a legal fleet drawn uniformly from all legal fleets"""
+
+    return sample_fleet(rng, FLEET_PLACEMENTS)
+
+
+def sample_fleet(rng: random.Random, fleet_placements: Sequence[Sequence[tuple[int, int]]]) -> list[int]:
+    """
+    The function that draws every ship uniformly from all its placements and starts again if ships overlap or touch
+
+    All legal fleets are equally likely, since every combination of placements is. A fleet is rejected
+    once a ship touches the previous ones, so the largest ships go first. About 1 of 4000 fleets
+    of the 10x10 field is legal, which takes a few milliseconds
+    """
+
+    draw = rng.random
+    while True:
+        occupied, ships = 0, []
+        for placements in fleet_placements:
+            ship, halo = placements[int(draw() * len(placements))]
+            if ship & occupied:
+                break
+            occupied |= halo
+            ships.append(ship)
+        else:
+            return ships
+
+
+def generate_many_fleet_masks(count: int, seed: Optional[int] = None) -> list[list[int]]:
+    rng = random.Random(seed)
+    return [generate_fleet_masks(rng) for _ in range(count)]
+
+
+def generate_many_ships_coords(count: int, seed: Optional[int] = None) -> list[list[ShipCoordinates]]:
+    """The function that returns random fleets in the format of the 'load ships coordinates' request"""
+
+    return [[mask_to_coords(ship) for ship in ships] for ships in generate_many_fleet_masks(count, seed)]
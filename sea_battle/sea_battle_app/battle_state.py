@@ -0,0 +1,227 @@
+from abc import ABC, abstractmethod
+from copy import deepcopy
+from functools import lru_cache
+from typing import Any, NamedTuple, Optional
+
+import redis.asyncio as redis
+from django.conf import settings
+
+from sea_battle_app.battle_logic import BattleInfo, PlayerInfo, Bitboard, ShipCoordinates, create_battle, \
+    coords_to_mask, shot_is_valid, process_shot
+from sea_battle_app.utils import create_backend, get_shard_index
+
+
+class ShotResult(NamedTuple):
+    ship_was_hit: bool
+    player_info: PlayerInfo
+    changed_cells: int
+
+
+def apply_shot(shot_coordinates: list[int], player_info: PlayerInfo) -> Optional[ShotResult]:
+    """The function that validates and processes the shot. Returns 'None' if the shot is incorrect"""
+
+    if not shot_is_valid(shot_coordinates, player_info):
+        return None
+    board = player_info.board
+    marked_cells = board.hit | board.missed
+    ship_was_hit = process_shot(shot_coordinates, player_info)
+    return ShotResult(ship_was_hit, player_info, (board.hit | board.missed) & ~marked_cells)
+
+
+class BaseBattleStateStore(ABC):
+    """
+    The storage of the battle fields shared by consumers of both players
+
+    All methods are coroutines, so the store can be used from the consumers event loop.
+    Battles are identified by 'Battle.address', players by their number (1 or 2).
+    A battle that has never been written is returned as an empty one
+    """
+
+    @abstractmethod
+    async def get(self, address: str) -> BattleInfo:
+        pass
+
+    @abstractmethod
+    async def get_player_info(self, address: str, player_number: int) -> PlayerInfo:
+        pass
+
+    @abstractmethod
+    async def set_ships_coordinates(self, address: str, player_number: int,
+                                    ships_coordinates: list[ShipCoordinates]) -> BattleInfo:
+        """The method that replaces the player's ships. Returns the battle state after the change"""
+
+    @abstractmethod
+    async def take_shot(self, address: str, player_number: int, shot_coordinates: list[int]) -> Optional[ShotResult]:
+        """
+        The method that atomically validates and processes a shot at the player's field
+
+        Returns 'None' if the shot is incorrect
+        """
+
+    @abstractmethod
+    async def restore(self, address: str, battle_info: BattleInfo) -> None:
+        """The method that replaces the whole battle, e.g. by the checkpoint from 'Battle.json_state'"""
+
+    @abstractmethod
+    async def delete(self, address: str) -> None:
+        pass
+
+
+class InMemoryBattleStateStore(BaseBattleStateStore):
+    """
+    The process-local store. It is suitable for development and tests only
+
+    Every method runs without awaiting, so it is atomic within the event loop
+    """
+
+    def __init__(self) -> None:
+        self.battles: dict[str, BattleInfo] = {}
+
+    async def get(self, address: str) -> BattleInfo:
+        return deepcopy(self._get(address))
+
+    async def get_player_info(self, address: str, player_number: int) -> PlayerInfo:
+        return deepcopy(self._get(address)[player_number - 1])
+
+    async def set_ships_coordinates(self, address: str, player_number: int,
+                                    ships_coordinates: list[ShipCoordinates]) -> BattleInfo:
+        battle_info = self._get(address)
+        battle_info[player_number - 1].ships_coordinates = ships_coordinates
+        return deepcopy(battle_info)
+
+    async def take_shot(self, address: str, player_number: int, shot_coordinates: list[int]) -> Optional[ShotResult]:
+        shot_result = apply_shot(shot_coordinates, self._get(address)[player_number - 1])
+        if shot_result is None:
+            return None
+        return shot_result._replace(player_info=deepcopy(shot_result.player_info))
+
+    async def restore(self, address: str, battle_info: BattleInfo) -> None:
+        self.battles[address] = deepcopy(battle_info)
+
+    async def delete(self, address: str) -> None:
+        self.battles.pop(address, None)
+
+    def _get(self, address: str) -> BattleInfo:
+        if address not in self.battles:
+            self.battles[address] = create_battle()
+        return self.battles[address]
+
+
+class RedisBattleStateStore(BaseBattleStateStore):
+    """
+    The store that keeps every battle in one Redis hash
+
+    The hash has 'hit', 'missed', 'ships' and 'shots' fields for each player, so a shot
+    rewrites only the fields of the player who was shot at. Shots use WATCH/MULTI
+    """
+
+    fields = ('hit', 'missed', 'ships', 'shots')
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 6379, db: int = 0, prefix: str = 'battle:') -> None:
+        self.redis = redis.Redis(host=host, port=port, db=db)
+        self.prefix = prefix
+
+    async def get(self, address: str) -> BattleInfo:
+        values = await self.redis.hmget(self._get_key(address), self._get_fields(1) + self._get_fields(2))
+        return BattleInfo(self._load_player_info(values[:4]), self._load_player_info(values[4:]))
+
+    async def get_player_info(self, address: str, player_number: int) -> PlayerInfo:
+        values = await self.redis.hmget(self._get_key(address), self._get_fields(player_number))
+        return self._load_player_info(values)
+
+    async def set_ships_coordinates(self, address: str, player_number: int,
+                                    ships_coordinates: list[ShipCoordinates]) -> BattleInfo:
+        ships = ','.join(str(coords_to_mask(ship_coords)) for ship_coords in ships_coordinates)
+        key = self._get_key(address)
+        async with self.redis.pipeline() as pipe:
+            pipe.hset(key, f'{player_number}:ships', ships)
+            pipe.hmget(key, self._get_fields(1) + self._get_fields(2))
+            values = (await pipe.execute())[1]
+        return BattleInfo(self._load_player_info(values[:4]), self._load_player_info(values[4:]))
+
+    async def take_shot(self, address: str, player_number: int, shot_coordinates: list[int]) -> Optional[ShotResult]:
+        key = self._get_key(address)
+        async with self.redis.pipeline() as pipe:
+            while True:
+                try:
+                    await pipe.watch(key)
+                    player_info = self._load_player_info(await pipe.hmget(key, self._get_fields(player_number)))
+                    shot_result = apply_shot(shot_coordinates, player_info)
+                    if shot_result is None:
+                        await pipe.unwatch()
+                        return None
+                    pipe.multi()
+                    pipe.hset(key, mapping=dict(zip(self._get_fields(player_number),
+                                                    self._dump_player_info(player_info))))
+                    await pipe.execute()
+                    return shot_result
+                except redis.WatchError:
+                    continue
+
+    async def restore(self, address: str, battle_info: BattleInfo) -> None:
+        mapping: dict[str, str] = {}
+        for player_number, player_info in enumerate(battle_info, 1):
+            mapping.update(zip(self._get_fields(player_number), self._dump_player_info(player_info)))
+        await self.redis.hset(self._get_key(address), mapping=mapping)
+
+    async def delete(self, address: str) -> None:
+        await self.redis.delete(self._get_key(address))
+
+    def _get_key(self, address: str) -> str:
+        return f'{self.prefix}{address}'
+
+    def _get_fields(self, player_number: int) -> list[str]:
+        return [f'{player_number}:{field}' for field in self.fields]
+
+    @staticmethod
+    def _dump_player_info(player_info: PlayerInfo) -> list[str]:
+        board = player_info.board
+        return [str(board.hit), str(board.missed), ','.join(map(str, board.ships)), str(board.shots)]
+
+    @staticmethod
+    def _load_player_info(values: list[Optional[bytes]]) -> PlayerInfo:
+        hit, missed, ships, shots = values
+        return PlayerInfo(Bitboard(int(hit or 0), int(missed or 0),
+                                   [int(ship) for ship in ships.split(b',')] if ships else [], int(shots or 0)))
+
+
+class ShardedBattleStateStore(BaseBattleStateStore):
+    """
+    The store that spreads battles over several stores by the battle address
+
+    'shards' are store settings like 'BATTLE_STATE_STORE'. The shard is chosen like the battle's
+    channel layer in 'BATTLE_CHANNEL_LAYERS', so a battle keeps its state and its messages
+    on the same Redis instance if both settings list the instances in the same order
+    """
+
+    def __init__(self, shards: list[dict[str, Any]]) -> None:
+        self.shards: list[BaseBattleStateStore] = [create_backend(shard) for shard in shards]
+
+    def get_shard(self, address: str) -> BaseBattleStateStore:
+        return self.shards[get_shard_index(address, len(self.shards))]
+
+    async def get(self, address: str) -> BattleInfo:
+        return await self.get_shard(address).get(address)
+
+    async def get_player_info(self, address: str, player_number: int) -> PlayerInfo:
+        return await self.get_shard(address).get_player_info(address, player_number)
+
+    async def set_ships_coordinates(self, address: str, player_number: int,
+                                    ships_coordinates: list[ShipCoordinates]) -> BattleInfo:
+        return await self.get_shard(address).set_ships_coordinates(address, player_number, ships_coordinates)
+
+    async def take_shot(self, address: str, player_number: int, shot_coordinates: list[int]) -> Optional[ShotResult]:
+        return await self.get_shard(address).take_shot(address, player_number, shot_coordinates)
+
+    async def restore(self, address: str, battle_info: BattleInfo) -> None:
+        await self.get_shard(address).restore(address, battle_info)
+
+    async def delete(self, address: str) -> None:
+        await self.get_shard(address).delete(address)
+
+
+@lru_cache(maxsize=None)
+def get_battle_state_store() -> BaseBattleStateStore:
+    """The function that returns the store configured by the 'BATTLE_STATE_STORE' setting"""
+
+    return create_backend(settings.BATTLE_STATE_STORE)
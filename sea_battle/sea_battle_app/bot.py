@@ -0,0 +1,179 @@
+import asyncio
+import json
+import random
+from typing import Any, Awaitable, Callable, Optional
+
+from django.conf import settings
+
+from sea_battle_app.battle_logic import CellState, FIELD_SIZE, PLACEMENTS_BY_SIZE, iter_cells, mask_to_coords, \
+    generate_fleet_masks
+
+ASGIApplication = Callable[..., Awaitable[None]]
+
+
+def _get_placements_cells() -> dict[int, list[tuple[int, ...]]]:
+    return {size: [tuple(iter_cells(ship)) for ship, _ in placements]
+            for size, placements in PLACEMENTS_BY_SIZE.items()}
+
+
+def _get_placements_by_cell() -> dict[int, list[list[int]]]:
+    """The function that maps every cell to the indexes of the placements that cover it"""
+
+    placements_by_cell: dict[int, list[list[int]]] = {}
+    for size, placements_cells in PLACEMENTS_CELLS.items():
+        placements_by_cell[size] = [[] for _ in range(FIELD_SIZE * FIELD_SIZE)]
+        for placement_index, cells in enumerate(placements_cells):
+            for cell_index in cells:
+                placements_by_cell[size][cell_index].append(placement_index)
+    return placements_by_cell
+
+
+PLACEMENTS_CELLS = _get_placements_cells()
+
+PLACEMENTS_BY_CELL = _get_placements_by_cell()
+
+
+class TargetingMap:
+    """
+    The hunt/target strategy over the opponent's field
+
+    For every ship size it keeps how many possible placements cover every cell. A placement is
+    impossible if it covers a missed cell or a cell of a destroyed ship, so a changed cell updates
+    only the placements that cover it. While no ship is damaged, the bot hunts: it shoots the cell
+    with the highest density of the remaining fleet. After a hit it targets: it shoots the cells
+    of the placements that cover all hits of the damaged ship.
+    The opponent's ships can't touch each other, so the bot has one damaged ship at most
+    """
+
+    def __init__(self, rng: Optional[random.Random] = None) -> None:
+        self.rng = rng or random.Random()
+        self.alive = {size: [True] * len(placements) for size, placements in PLACEMENTS_CELLS.items()}
+        self.coverage = {size: [len(placements) for placements in PLACEMENTS_BY_CELL[size]]
+                         for size in PLACEMENTS_CELLS}
+        self.ships_count = {1: 4, 2: 3, 3: 2, 4: 1}
+        self.unknown = set(range(FIELD_SIZE * FIELD_SIZE))
+        self.damaged: list[int] = []
+
+    def mark(self, cells: list[list[int]], ships_count: dict[str, int]) -> None:
+        """The method that processes the 'cells' and 'ships count' of the 'changed opponent field' delta"""
+
+        for x, y, state in cells:
+            cell_index = x * FIELD_SIZE + y
+            self.unknown.discard(cell_index)
+            if state == CellState.hit.value:
+                self.damaged.append(cell_index)
+            elif state == CellState.missed.value:
+                self._block(cell_index)
+
+        living_ships = {int(size): count for size, count in ships_count.items()}
+        if living_ships != self.ships_count:
+            self.ships_count = living_ships
+            for cell_index in self.damaged:
+                self._block(cell_index)
+            self.damaged = []
+
+    def choose_shot(self) -> list[int]:
+        scores = self._get_target_scores() if self.damaged else self._get_hunt_scores()
+        best_score = max(scores.values(), default=0)
+        best_cells = [cell_index for cell_index, score in scores.items() if score == best_score]
+        cell_index = self.rng.choice(best_cells or sorted(self.unknown))
+        return list(divmod(cell_index, FIELD_SIZE))
+
+    def _block(self, cell_index: int) -> None:
+        for size, placements_indexes in PLACEMENTS_BY_CELL.items():
+            alive, coverage = self.alive[size], self.coverage[size]
+            for placement_index in placements_indexes[cell_index]:
+                if alive[placement_index]:
+                    alive[placement_index] = False
+                    for covered_cell_index in PLACEMENTS_CELLS[size][placement_index]:
+                        coverage[covered_cell_index] -= 1
+
+    def _get_hunt_scores(self) -> dict[int, int]:
+        sizes = [(self.coverage[size], count) for size, count in self.ships_count.items() if count]
+        return {cell_index: sum(coverage[cell_index] * count for coverage, count in sizes)
+                for cell_index in self.unknown}
+
+    def _get_target_scores(self) -> dict[int, int]:
+        scores: dict[int, int] = {}
+        damaged = set(self.damaged)
+        for size, count in self.ships_count.items():
+            if size < len(damaged) or not count:
+                continue
+            for placement_index in PLACEMENTS_BY_CELL[size][self.damaged[0]]:
+                cells = PLACEMENTS_CELLS[size][placement_index]
+                if self.alive[size][placement_index] and damaged.issubset(cells):
+                    for cell_index in cells:
+                        if cell_index in self.unknown:
+                            scores[cell_index] = scores.get(cell_index, 0) + count
+        return scores
+
+
+class BotClient:
+    """
+    The virtual client that plays the battle through its own 'BattleConsumer'
+
+    The consumer is run in this process as an ASGI application, so the bot is an ordinary
+    second player for the opponent's consumer. The bot leaves the battle when it is over,
+    when the opponent has disconnected or after 'IDLE_TIMEOUT' seconds without any frame
+    """
+
+    def __init__(self, address: str, application: ASGIApplication) -> None:
+        self.application = application
+        self.scope = {'type': 'websocket', 'path': f'/ws/battle/{address}/', 'query_string': b'fields=delta',
+                      'headers': [], 'subprotocols': [], 'url_route': {'args': (), 'kwargs': {'address': address}}}
+        self.incoming: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+        self.targeting_map = TargetingMap()
+        self.ready = asyncio.Event()
+
+    async def run(self) -> None:
+        self.incoming.put_nowait({'type': 'websocket.connect'})
+        try:
+            await self.application(self.scope, self.receive, self.send)
+        finally:
+            self.ready.set()
+
+    async def receive(self) -> dict[str, Any]:
+        try:
+            return await asyncio.wait_for(self.incoming.get(), settings.BOT['IDLE_TIMEOUT'])
+        except asyncio.TimeoutError:
+            return {'type': 'websocket.disconnect', 'code': 1000}
+
+    async def send(self, message: dict[str, Any]) -> None:
+        if message['type'] == 'websocket.close':
+            self.incoming.put_nowait({'type': 'websocket.disconnect', 'code': 1000})
+        elif message['type'] == 'websocket.send':
+            self.process_message(json.loads(message['text']))
+
+    def process_message(self, content: dict[str, Any]) -> None:
+        match content:
+            case {'type': 'reconnection token'}:
+                self.ready.set()
+            case {'type': 'state', 'body': 'preparation'}:
+                ships_coordinates = [mask_to_coords(ship) for ship in generate_fleet_masks(self.targeting_map.rng)]
+                self.send_to_consumer({'type': 'load ships coordinates', 'body': ships_coordinates})
+            case {'type': 'changed opponent field', 'body': body}:
+                self.targeting_map.mark(body['cells'], body['ships count'])
+            case {'type': 'battle logic', 'body': 'your move'}:
+                self.send_to_consumer({'type': 'take a shot', 'body': self.targeting_map.choose_shot()})
+            case {'type': 'info after end'} | {'type': 'info', 'body': 'opponent disconnected'}:
+                self.incoming.put_nowait({'type': 'websocket.disconnect', 'code': 1000})
+
+    def send_to_consumer(self, content: dict[str, Any]) -> None:
+        self.incoming.put_nowait({'type': 'websocket.receive', 'text': json.dumps(content)})
+
+
+_bot_tasks: set[asyncio.Task] = set()
+
+
+async def start_bot(address: str, application: ASGIApplication) -> None:
+    """
+    The function that starts the bot in the battle and waits until it has taken a player's slot
+
+    'application' is the ASGI application of the battle consumer
+    """
+
+    bot = BotClient(address, application)
+    task = asyncio.create_task(bot.run())
+    _bot_tasks.add(task)
+    task.add_done_callback(_bot_tasks.discard)
+    await bot.ready.wait()
@@ -0,0 +1,105 @@
+import json
+from abc import ABC, abstractmethod
+from typing import Any, Optional, Union
+
+import msgpack
+
+from sea_battle_app.battle_logic import FIELD_SIZE
+
+Frame = dict[str, Union[str, bytes]]
+
+
+class BaseCodec(ABC):
+    """The codec of websocket frames. It is selected by the websocket subprotocol"""
+
+    subprotocol: Optional[str] = None
+
+    @abstractmethod
+    def encode(self, content: Any) -> Frame:
+        """The method that returns keyword arguments for 'send'"""
+
+    @abstractmethod
+    def decode(self, text_data: Optional[str], bytes_data: Optional[bytes]) -> Any:
+        pass
+
+
+class JsonCodec(BaseCodec):
+    """The codec that is used if the client hasn't asked for any subprotocol. It keeps the original frames"""
+
+    def encode(self, content: Any) -> Frame:
+        return {'text_data': json.dumps(content)}
+
+    def decode(self, text_data: Optional[str], bytes_data: Optional[bytes]) -> Any:
+        if text_data is None:
+            raise ValueError('json frames must be textual')
+        return json.loads(text_data)
+
+
+class CompactJsonCodec(JsonCodec):
+    """The codec that encodes JSON without whitespaces"""
+
+    subprotocol = 'sea-battle.json'
+
+    def __init__(self) -> None:
+        self.encoder = json.JSONEncoder(separators=(',', ':'), check_circular=False)
+
+    def encode(self, content: Any) -> Frame:
+        return {'text_data': self.encoder.encode(content)}
+
+
+class MsgpackCodec(BaseCodec):
+    """
+    The codec that sends binary msgpack frames
+
+    Every 'field' matrix is packed into 25 bytes: 2 bits per cell, 4 cells per byte,
+    cells are ordered by 'x * 10 + y' starting from the lowest bits of the first byte
+    """
+
+    subprotocol = 'sea-battle.msgpack'
+
+    def encode(self, content: Any) -> Frame:
+        return {'bytes_data': msgpack.packb(pack_fields(content))}
+
+    def decode(self, text_data: Optional[str], bytes_data: Optional[bytes]) -> Any:
+        if bytes_data is None:
+            raise ValueError('msgpack frames must be binary')
+        return msgpack.unpackb(bytes_data)
+
+
+def pack_field(field: list[list[int]]) -> bytes:
+    packed = bytearray(FIELD_SIZE * FIELD_SIZE // 4)
+    for x, cell_row in enumerate(field):
+        for y, cell in enumerate(cell_row):
+            cell_index = x * FIELD_SIZE + y
+            packed[cell_index >> 2] |= cell << ((cell_index & 3) << 1)
+    return bytes(packed)
+
+
+def unpack_field(packed: bytes) -> list[list[int]]:
+    return [[packed[cell_index >> 2] >> ((cell_index & 3) << 1) & 3
+             for cell_index in range(x * FIELD_SIZE, (x + 1) * FIELD_SIZE)] for x in range(FIELD_SIZE)]
+
+
+def pack_fields(content: Any) -> Any:
+    """The function that returns a copy of the content with every 'field' matrix packed"""
+
+    if isinstance(content, dict):
+        return {key: pack_field(value) if key == 'field' and isinstance(value, list) else pack_fields(value)
+                for key, value in content.items()}
+    if isinstance(content, list):
+        return [pack_fields(value) for value in content]
+    return content
+
+
+CODECS: dict[Optional[str], BaseCodec] = {
+    codec.subprotocol: codec for codec in (JsonCodec(), CompactJsonCodec(), MsgpackCodec())
+}
+
+
+def choose_codec(subprotocols: list[str]) -> BaseCodec:
+    """The function that returns the codec of the first supported subprotocol requested by the client"""
+
+    for subprotocol in subprotocols:
+        if subprotocol in CODECS:
+            return CODECS[subprotocol]
+    return CODECS[None]
@@ -1,149 +1,318 @@
+import asyncio
 from functools import wraps
 from typing import Any, Union, Optional, Callable
+from urllib.parse import parse_qs
 
-from asgiref.sync import async_to_sync
-from channels.generic.websocket import JsonWebsocketConsumer
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.conf import settings
 
-from sea_battle_app.battle_logic import create_battle, BattleInfo, validate_ships_coords, \
-    shot_is_valid, process_shot, get_ships_count
-from sea_battle_app.models import Battle, Player
+from sea_battle_app.battle_logic import BattleInfo, PlayerInfo, validate_ships_coords, get_ships_count
+from sea_battle_app.battle_state import ShotResult, get_battle_state_store
+from sea_battle_app.bot import start_bot
+from sea_battle_app.channels.codecs import choose_codec
+from sea_battle_app.leaderboard import get_stats_writer
+from sea_battle_app.matchmaking import get_matchmaking_queue, pair_players, start_pairing
+from sea_battle_app.metrics import event_metrics, request_metrics, opponent_messages
+from sea_battle_app.models import Battle, Player, PlayerSlot
+from sea_battle_app.move_log import get_move_log_writer, create_fleet_records, create_move_record
+from sea_battle_app.player_slots import get_player_slots
+from sea_battle_app.rate_limit import ConnectionLimits, create_connection_limits
+from sea_battle_app.reaper import start_reaping
+from sea_battle_app.utils import get_shard_index
 
+_local_consumers: dict[str, 'BattleConsumer'] = {}
 
-class BattleConsumer(JsonWebsocketConsumer):
-    """Consumer for sea battle processing """
 
-    def connect(self) -> None:
-        address = self.scope['url_route']['kwargs']['address']
+def get_battle_channel_layer_alias(address: str) -> str:
+    """The function that returns the channel layer of the battle's shard, see 'BATTLE_CHANNEL_LAYERS'"""
+
+    aliases = settings.BATTLE_CHANNEL_LAYERS
+    return aliases[get_shard_index(address, len(aliases))]
+
+
+def get_spectators_group(address: str) -> str:
+    return f'spectators.{address}'
+
+
+class BattleConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Consumer for sea battle processing
+
+    All database access goes through a few 'database_sync_to_async' methods,
+    players are always fetched together with the battle (see 'PLAYER_SLOTS') so the properties don't query lazily.
+
+    'battle_model' is a cache of the battle phase. It is not refreshed per message:
+    the database is touched only on real transitions (players connection, game start,
+    move change, game end) and every transition is pushed to the opponent's consumer.
+
+    A client connected with '?fields=delta' gets only changed cells after shots. Every change
+    carries the field's sequence number, a client that sees a gap sends 'request snapshot'.
+    Frames are encoded by the codec of the websocket subprotocol the client asked for.
+
+    Every transition also checkpoints the battle fields into 'json_state' by the same query,
+    so there is no write per shot: a checkpoint lags behind the store by the current series of hits at most.
+    Checkpoints aren't coalesced over several transitions, see 'change_battle_state'.
+    A player whose socket has dropped keeps the slot for 'RECONNECTION_GRACE_PERIOD' seconds
+    and gets it back by connecting with '?token=<reconnection token>'. If the store has lost the battle
+    meanwhile, it is restored from the checkpoint.
+
+    Fleets and processed shots are appended to the move log, which is written in batches.
+
+    Consumers of this process are registered by channel name. A message to an opponent connected
+    to the same process is put into its queue of incoming events as is, without the channel layer
+    and serialization, so handlers must not change the received content.
+
+    Changed fields and transitions are sent once to the battle's group of spectators, see 'SpectatorConsumer'.
+    Nothing is sent until a spectator has joined: spectators announce themselves to the players' consumers
+    when they join and when a player connects.
+
+    Frames are rate limited as they come, before they are queued and decoded, see 'RATE_LIMIT'.
+    Frames over the rate limit always get the error reply, malformed frames (including ones the codec
+    can't decode) get coalesced error replies. The connection is closed with the code 4008
+    if there are too many of them
+    """
+
+    request_types = ('load ships coordinates', 'take a shot', 'surrender', 'request snapshot')
+    limits: Optional[ConnectionLimits] = None
+    closing = False
+    has_spectators = False
+
+    async def __call__(self, scope: dict[str, Any], receive: Callable, send: Callable) -> None:
+        """The method that makes both players of the battle use the channel layer of its shard"""
+
+        self.channel_layer_alias = get_battle_channel_layer_alias(scope['url_route']['kwargs']['address'])
+        self.local_messages: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+        forwarding_task = asyncio.create_task(self.forward_client_messages(receive))
         try:
-            self.battle_model = Battle.objects.get(address=address)
-        except Battle.DoesNotExist:
-            self.close()
+            await super().__call__(scope, self.local_messages.get, send)
+        finally:
+            forwarding_task.cancel()
+            channel_name = getattr(self, 'channel_name', None)
+            if channel_name is not None and _local_consumers.get(channel_name) is self:
+                del _local_consumers[channel_name]
+
+    async def forward_client_messages(self, receive: Callable) -> None:
+        """
+        The method that puts client events into the queue of local messages, so they keep their order
+
+        Frames over the limits are dropped here, so a flood doesn't pile up in the queue
+        """
+
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.receive' and not await self.admit_frame():
+                continue
+            self.local_messages.put_nowait(message)
+            if message['type'] == 'websocket.disconnect':
+                return
+
+    async def connect(self) -> None:
+        _local_consumers[self.channel_name] = self
+        self.limits = create_connection_limits(self.scope)
+        start_reaping()
+        address = self.scope['url_route']['kwargs']['address']
+        battle_model = await self.get_battle_model(address=address)
+        if battle_model is None:
+            await self.close()
             return
 
-        if self.battle_model.first_player and self.battle_model.second_player:
-            self.close()
+        self.battle_model = battle_model
+        query = parse_qs(self.scope['query_string'].decode())
+        reconnected = 'token' in query and await self.reconnect_player(query['token'][0])
+        if not reconnected and self.battle_model.is_full:
+            await self.close()
             return
 
-        self.accept()
-        self.set_player()
+        self.battle_state_store = get_battle_state_store()
+        self.move_log = get_move_log_writer()
+        self.stats_writer = get_stats_writer()
+        self.sends_deltas = query.get('fields') == ['delta']
+        self.codec = choose_codec(self.scope.get('subprotocols', []))
+        await self.accept(self.codec.subprotocol)
 
-        if self.battle_model.first_player and self.battle_model.second_player:
-            self.send_message_to_opponent('give_battle_info')
-            self.send_message_to_opponent('send_json', {'type': 'info', 'body': 'opponent connected'})
-        else:
-            self.battle_fields = create_battle()
+        if reconnected:
+            await self.resume()
+            return
 
-        self.send_json({'content': {'type': 'state', 'body': f'{self.battle_model.state.name}'}})
-        self.send_message_to_opponent('request_to_send_data_on_connection')
+        if not await self.set_player():
+            await self.close()
+            return
 
-    def disconnect(self, code: int) -> None:
-        if code != 1000:
+        if isinstance(self.player, (Player, PlayerSlot)):
+            await self.send_json({'content': {'type': 'reconnection token', 'body': self.player.token}})
+
+        if self.battle_model.is_full:
+            await self.send_message_to_opponent('refresh_battle_model')
+            await self.send_message_to_opponent('send_json', {'type': 'info', 'body': 'opponent connected'})
+
+        await self.find_spectators()
+        await self.send_json({'content': {'type': 'state', 'body': f'{self.battle_model.state.name}'}})
+        await self.send_message_to_opponent('request_to_send_data_on_connection')
+
+    async def dispatch(self, message: dict[str, Any]) -> None:
+        with event_metrics.measure('battle', message['type']):
+            await super().dispatch(message)
+
+    async def disconnect(self, code: int) -> None:
+        if not hasattr(self, 'player'):
             return
 
-        self.player.delete()
-        self.battle_model.refresh_from_db()
+        if code != 1000:
+            await self.mark_player_disconnected()
+            await self.send_message_to_opponent('refresh_battle_model')
+            return
 
-        if self.battle_model.first_player is None and self.battle_model.second_player is None:
-            self.battle_model.delete()
+        if await self.remove_player():
+            await self.battle_state_store.delete(self.battle_model.address)
         else:
-            self.send_message_to_opponent('send_json', {'type': 'info', 'body': 'opponent disconnected'})
+            await self.send_message_to_opponent('refresh_battle_model')
+            await self.send_message_to_opponent('send_json', {'type': 'info', 'body': 'opponent disconnected'})
+
+    async def send_json(self, content: dict[str, Any], close: bool = False) -> None:
+        if not self.closing:
+            await self.send(**self.codec.encode(content['content']))
+
+    async def receive(self, text_data: Optional[str] = None, bytes_data: Optional[bytes] = None,
+                      **kwargs: Any) -> None:
+        try:
+            content = self.codec.decode(text_data, bytes_data)
+        except ValueError:
+            await self.process_violation('incorrect frame')
+            return
+        await self.receive_json(content, **kwargs)
 
-    def send_json(self, content: dict[str, Any], close: bool = False) -> None:
-        super().send_json(content['content'])
+    async def receive_json(self, content: Union[list, dict[str, Any]], **kwargs: Any) -> None:
+        request_type = content.get('type') if isinstance(content, dict) else None
+        with request_metrics.measure(request_type if request_type in self.request_types else 'invalid request'):
+            await self.process_request(content)
 
-    def receive_json(self, content: Union[list, dict[str, Any]], **kwargs: Any) -> None:
+    async def process_request(self, content: Union[list, dict[str, Any]]) -> None:
         match content:
             case {'type': 'load ships coordinates', 'body': body}:
-                self.load_ships_coordinates(body)
+                await self.load_ships_coordinates(body)
             case {'type': 'take a shot', 'body': body}:
-                self.take_shot(body)
+                await self.take_shot(body)
             case {'type': 'surrender'}:
-                self.surrender()
+                await self.surrender()
+            case {'type': 'request snapshot'}:
+                await self.send_snapshot()
             case _:
-                self.process_invalid_request(content)
+                await self.process_invalid_request(content)
 
     @staticmethod
     def available_at_stage(stage: Battle.State) -> Callable:
         def decorator(func: Callable) -> Callable:
             @wraps(func)
-            def wrapper(self, *args: Any) -> Any:
-                self.battle_model.refresh_from_db()
+            async def wrapper(self, *args: Any) -> Any:
                 if self.battle_model.state is stage:
-                    return func(self, *args)
-                self.send_json({'content': {'type': 'error', 'body': 'request is not possible at this stage'}})
+                    return await func(self, *args)
+                await self.send_json({'content': {'type': 'error', 'body': 'request is not possible at this stage'}})
 
             return wrapper
 
         return decorator
 
     @available_at_stage(Battle.State.preparation)
-    def load_ships_coordinates(self, ships_coordinates: list[list[list[int]]]) -> None:
+    async def load_ships_coordinates(self, ships_coordinates: list[list[list[int]]]) -> None:
         condition, message = validate_ships_coords(ships_coordinates)
         if condition:
-            self.battle_fields[self.player_number - 1].ships_coordinates = ships_coordinates
-            self.give_battle_info()
-            if not self.battle_fields[self.opponent_number].ships_coordinates:
-                self.send_message_to_opponent('send_json', {'type': 'battle logic', 'body': 'opponent is ready'})
-
-        elif self.battle_fields[self.player_number - 1].ships_coordinates:
-            self.send_message_to_opponent('send_json', {'type': 'battle logic', 'body': 'opponent is not ready'})
-            self.battle_fields[self.player_number - 1].ships_coordinates = []
+            battle_fields = await self.battle_state_store.set_ships_coordinates(
+                self.battle_model.address, self.player_number, ships_coordinates
+            )
+            if not battle_fields[self.opponent_number].board.ships:
+                await self.send_message_to_opponent('send_json', {'type': 'battle logic', 'body': 'opponent is ready'})
+        else:
+            battle_fields = await self.battle_state_store.get(self.battle_model.address)
+            if battle_fields[self.player_number - 1].board.ships:
+                await self.send_message_to_opponent('send_json', {'type': 'battle logic',
+                                                                  'body': 'opponent is not ready'})
+                battle_fields = await self.battle_state_store.set_ships_coordinates(
+                    self.battle_model.address, self.player_number, []
+                )
 
-        self.send_json({'content': {'type': ['error', 'success'][condition],
-                                    'body': message or 'ships successfully placed'}})
+        await self.send_json({'content': {'type': ['error', 'success'][condition],
+                                          'body': message or 'ships successfully placed'}})
 
-        if self.battle_fields[0].ships_coordinates and self.battle_fields[1].ships_coordinates:
-            self.start_game()
+        if battle_fields[0].board.ships and battle_fields[1].board.ships:
+            await self.start_game()
 
     @available_at_stage(Battle.State.progress)
-    def take_shot(self, shot_coordinates: list[int]) -> None:
+    async def take_shot(self, shot_coordinates: list[int]) -> None:
         if self.battle_model.whose_move != self.player_number:
-            self.send_json({'content': {'type': 'error', 'body': 'not your move'}})
+            await self.send_json({'content': {'type': 'error', 'body': 'not your move'}})
             return
 
-        opponent_info = self.battle_fields[self.opponent_number]
+        shot_result = await self.battle_state_store.take_shot(
+            self.battle_model.address, self.opponent_number + 1, shot_coordinates
+        )
 
-        if not shot_is_valid(shot_coordinates, opponent_info.field):
-            self.send_json({'content': {'type': 'error', 'body': 'incorrect shot'}})
+        if shot_result is None:
+            await self.send_json({'content': {'type': 'error', 'body': 'incorrect shot'}})
             return
 
-        ship_was_hit = process_shot(shot_coordinates, opponent_info)
-        self.send_changes_after_shot()
+        self.move_log.append(create_move_record(self.battle_model.address, self.player_number,
+                                                shot_coordinates, shot_result))
+        ship_was_hit, opponent_info, _ = shot_result
+        await self.send_changes_after_shot(shot_result)
 
         if ship_was_hit:
-            if not any(get_ships_count(opponent_info.ships_coordinates).values()):
-                self.end_game()
+            if not opponent_info.board.ships:
+                await self.end_game()
                 return
 
-            self.send_json({'content': {'type': 'battle logic', 'body': 'your move'}})
+            await self.send_json({'content': {'type': 'battle logic', 'body': 'your move'}})
         else:
-            self.send_message_to_opponent('send_json', {'type': 'battle logic', 'body': 'your move'})
-            self.battle_model.whose_move = self.opponent_number + 1
-            self.battle_model.save()
+            await self.change_battle_state(whose_move=self.opponent_number + 1)
+            await self.send_message_to_opponent('send_json', {'type': 'battle logic', 'body': 'your move'})
 
-        self.give_battle_info()
+    @available_at_stage(Battle.State.progress)
+    async def surrender(self) -> None:
+        await self.send_message_to_opponent('send_json', {'type': 'info', 'body': 'opponent surrendered'})
+        await self.send_message_to_opponent('end_game')
 
     @available_at_stage(Battle.State.progress)
-    def surrender(self) -> None:
-        self.send_message_to_opponent('send_json', {'type': 'info', 'body': 'opponent surrendered'})
-        self.send_message_to_opponent('end_game')
+    async def send_snapshot(self) -> None:
+        await self.send_progress_battle_data()
 
-    def process_invalid_request(self, body: Union[list, dict[str, Any]]) -> None:
+    async def process_invalid_request(self, body: Union[list, dict[str, Any]]) -> None:
         match body:
             case {'type': _, 'body': _}:
-                self.send_json({'content': {'type': 'error', 'body': 'unknown request type'}})
+                await self.process_violation('unknown request type')
             case {'body': _}:
-                self.send_json({'content': {'type': 'error', 'body': 'request must have \'type\' field'}})
+                await self.process_violation('request must have \'type\' field')
             case {'type': _}:
-                self.send_json({'content': {'type': 'error', 'body': 'request must have \'body\' field'}})
+                await self.process_violation('request must have \'body\' field')
             case _:
-                self.send_json({'content': {'type': 'error', 'body': 'request must have \'type\' and \'body\' fields'}})
+                await self.process_violation('request must have \'type\' and \'body\' fields')
+
+    async def admit_frame(self) -> bool:
+        if self.closing:
+            return False
+        if self.limits is None or await self.limits.admit_frame():
+            return True
+        await self.process_violation('too many requests', always_reply=True)
+        return False
+
+    async def process_violation(self, error: str, always_reply: bool = False) -> None:
+        """
+        The method that replies with the error unless the client gets too many of them or closes the connection
+
+        Frames over the rate limit are always answered, so a client that waits for the reply to its request
+        doesn't hang. Their replies are limited by the violations only
+        """
+
+        if self.limits is None:
+            await self.send_json({'content': {'type': 'error', 'body': error}})
+        elif not self.limits.violations.consume():
+            self.closing = True
+            await self.close(code=4008)
+        elif always_reply or self.limits.error_replies.consume():
+            await self.send_json({'content': {'type': 'error', 'body': error}})
 
     @property
-    def opponent(self) -> Optional[Player]:
-        if self.player_number == 1:
-            return self.battle_model.second_player
-        return self.battle_model.first_player
+    def opponent(self) -> Union[Player, PlayerSlot, None]:
+        return self.battle_model.get_player(3 - self.player_number)
 
     @property
     def opponent_number(self) -> int:
@@ -151,37 +320,147 @@ class BattleConsumer(JsonWebsocketConsumer):
 
         return 2 // self.player_number - 1
 
-    def send_message_to_opponent(self, func_name: str, content: Optional[dict[str, Any]] = None) -> None:
+    async def send_message_to_opponent(self, func_name: str, content: Optional[dict[str, Any]] = None) -> None:
         """
         The function allows you to send messages opponent's consumer
         and opponents client depending on which 'func_name' is received
         """
 
-        if self.opponent:
-            async_to_sync(self.channel_layer.send)(
-                self.opponent.channel_name, {'type': func_name, 'content': content}
-            )
-
-    def set_player(self) -> None:
-        self.player = Player.objects.create(channel_name=self.channel_name)
+        if not self.opponent or not self.opponent.channel_name:
+            return
 
-        if self.battle_model.first_player is None:
-            self.battle_model.first_player = self.player
-            self.player_number = 1
+        message = {'type': func_name, 'content': content}
+        local_consumer = _local_consumers.get(str(self.opponent.channel_name))
+        if local_consumer is not None:
+            local_consumer.local_messages.put_nowait(message)
         else:
-            self.battle_model.second_player = self.player
-            self.player_number = 2
+            await self.channel_layer.send(self.opponent.channel_name, message)
+        if settings.METRICS['ENABLED']:
+            opponent_messages.inc('local' if local_consumer is not None else 'channel layer')
+
+    async def send_message_to_spectators(self, func_name: str, content: dict[str, Any]) -> None:
+        """The method that sends one message to all spectators of the battle, whatever their number"""
 
-        self.battle_model.save()
+        if settings.SPECTATORS['ENABLED'] and self.has_spectators:
+            await self.channel_layer.group_send(get_spectators_group(self.battle_model.address),
+                                                {'type': func_name, 'content': content})
 
-    def give_battle_info(self, *args: Any) -> None:
-        self.battle_model.refresh_from_db()
-        self.send_message_to_opponent('set_battle_info', {'battle_info': self.battle_fields.as_dict()})
+    async def find_spectators(self) -> None:
+        """The method that asks spectators who are already watching the battle to announce themselves"""
 
-    def set_battle_info(self, content: dict[str, Any]) -> None:
-        self.battle_fields = BattleInfo.from_dict(content['content']['battle_info'])
+        if settings.SPECTATORS['ENABLED']:
+            await self.channel_layer.group_send(get_spectators_group(self.battle_model.address),
+                                                {'type': 'announce_spectator', 'channel_name': self.channel_name})
 
-    def request_to_send_data_on_connection(self, *args: Any) -> None:
+    async def spectator_joined(self, content: dict[str, Any]) -> None:
+        """The method that turns on sending to spectators. It stays on when they leave"""
+
+        self.has_spectators = True
+
+    @staticmethod
+    @database_sync_to_async
+    def get_battle_model(**kwargs: Any) -> Optional[Battle]:
+        return get_player_slots().get_battle(**kwargs)
+
+    @database_sync_to_async
+    def save_battle_state(self) -> None:
+        self.battle_model.save(update_fields=['whose_move', 'who_win', 'json_state'])
+
+    @database_sync_to_async
+    def set_player(self) -> bool:
+        """The method that takes a free slot. Returns 'false' if there is no free slot"""
+
+        taken_slot = get_player_slots().take(self.battle_model, self.channel_name)
+        if taken_slot is None:
+            return False
+        self.battle_model, self.player_number = taken_slot
+        self.player = self.battle_model.get_player(self.player_number)
+        return True
+
+    @database_sync_to_async
+    def remove_player(self) -> bool:
+        """The method that frees the slot. Returns 'true' if the battle was deleted as well"""
+
+        battle_model = get_player_slots().release(self.battle_model, self.player_number)
+        if battle_model is None:
+            return True
+        self.battle_model = battle_model
+        return False
+
+    @database_sync_to_async
+    def mark_player_disconnected(self) -> None:
+        get_player_slots().mark_disconnected(self.battle_model, self.player_number)
+
+    @database_sync_to_async
+    def reconnect_player(self, token: str) -> bool:
+        """The method that gives the slot back to the player by the token. Returns 'true' if the slot was taken"""
+
+        player_number = get_player_slots().reconnect(self.battle_model, token, self.channel_name)
+        if player_number is None:
+            return False
+        self.player_number = player_number
+        self.player = self.battle_model.get_player(player_number)
+        return True
+
+    async def resume(self) -> None:
+        """The method that restores the lost battle from the checkpoint and sends the state to the reconnected client"""
+
+        if self.battle_model.state is not Battle.State.preparation and self.battle_model.json_state is not None:
+            battle_fields = await self.battle_state_store.get(self.battle_model.address)
+            if not battle_fields[0].board.ships and not battle_fields[1].board.ships:
+                await self.battle_state_store.restore(self.battle_model.address,
+                                                      BattleInfo.from_dict(self.battle_model.json_state))
+
+        await self.send_message_to_opponent('refresh_battle_model')
+        await self.send_message_to_opponent('send_json', {'type': 'info', 'body': 'opponent reconnected'})
+        await self.find_spectators()
+        await self.send_json({'content': {'type': 'state', 'body': f'{self.battle_model.state.name}'}})
+        await self.send_data_on_connection()
+
+    async def change_battle_state(self, whose_move: Optional[int], who_win: Optional[int] = None) -> None:
+        """
+        The method that saves the transition with the checkpoint and pushes it to the opponent's consumer
+
+        The checkpoint is written on every transition, about a hundred per game (see 'benchmark checkpoint').
+        It costs one read of the store and a bigger UPDATE, but no extra query: the transition itself
+        must be saved, because other processes and reconnected players read the move from the row.
+        Coalescing checkpoints over several transitions would save only the JSON payload, and a store lost
+        meanwhile would restore fields that are several moves behind the move saved in the row
+        """
+
+        self.battle_model.whose_move = whose_move
+        self.battle_model.who_win = who_win
+        self.battle_model.json_state = (await self.battle_state_store.get(self.battle_model.address)).as_dict()
+        await self.save_battle_state()
+        await self.send_message_to_opponent('set_battle_state', {'whose_move': whose_move, 'who_win': who_win})
+        await self.send_message_to_spectators('set_battle_state', {'whose_move': whose_move, 'who_win': who_win})
+
+    async def set_battle_state(self, content: dict[str, Any]) -> None:
+        game_ended = self.battle_model.who_win is None and content['content']['who_win'] is not None
+        self.battle_model.whose_move = content['content']['whose_move']
+        self.battle_model.who_win = content['content']['who_win']
+        if game_ended:
+            self.record_result(won=False)
+
+    def record_result(self, won: bool) -> None:
+        """
+        The method that adds the result of the finished battle to the stats of the authenticated user
+
+        The winner's consumer records the win in 'end_game', the surrendered player's opponent
+        runs 'end_game' as well. The loser's consumer records the loss when it gets the final state.
+        Both are recorded once, when the battle gets its winner
+        """
+
+        user = self.scope.get('user')
+        if user is not None and user.is_authenticated:
+            self.stats_writer.add_result(user.pk, won)
+
+    async def refresh_battle_model(self, *args: Any) -> None:
+        battle_model = await self.get_battle_model(pk=self.battle_model.pk)
+        if battle_model is not None:
+            self.battle_model = battle_model
+
+    async def request_to_send_data_on_connection(self, *args: Any) -> None:
         """
         The method that is needed to request data on connection
 
@@ -189,95 +468,263 @@ class BattleConsumer(JsonWebsocketConsumer):
         data from another user came later than the method was completed
         """
 
-        self.send_message_to_opponent('send_data_on_connection')
+        await self.send_message_to_opponent('send_data_on_connection')
 
-    def send_data_on_connection(self, *args: Any) -> None:
+    async def send_data_on_connection(self, *args: Any) -> None:
         if self.battle_model.state == Battle.State.preparation:
-            if self.battle_fields[self.opponent_number].ships_coordinates:
-                self.send_json({'content': {'type': 'battle logic', 'body': 'opponent is ready'}})
+            opponent_info = await self.battle_state_store.get_player_info(self.battle_model.address,
+                                                                          self.opponent_number + 1)
+            if opponent_info.board.ships:
+                await self.send_json({'content': {'type': 'battle logic', 'body': 'opponent is ready'}})
         elif self.battle_model.state == Battle.State.progress:
-            self.send_progress_battle_data()
+            await self.send_progress_battle_data()
             if self.battle_model.whose_move == self.player_number:
-                self.send_json({'content': {'type': 'battle logic', 'body': 'your move'}})
+                await self.send_json({'content': {'type': 'battle logic', 'body': 'your move'}})
 
-    def start_game(self) -> None:
-        self.send_json({'content': {'type': 'state', 'body': self.battle_model.state.progress.name}})
-        self.send_message_to_opponent('send_json', {'type': 'state', 'body': self.battle_model.state.progress.name})
+    async def start_game(self) -> None:
+        await self.send_json({'content': {'type': 'state', 'body': self.battle_model.state.progress.name}})
+        await self.send_message_to_opponent('send_json', {'type': 'state',
+                                                          'body': self.battle_model.state.progress.name})
 
-        self.send_progress_battle_data()
-        self.send_message_to_opponent('send_progress_battle_data')
+        await self.send_progress_battle_data()
+        await self.send_message_to_opponent('send_progress_battle_data')
 
-        self.battle_model.refresh_from_db()
-        self.battle_model.whose_move = 1
-        self.battle_model.save()
+        await self.change_battle_state(whose_move=1)
+        self.move_log.extend(create_fleet_records(self.battle_model.address,
+                                                  BattleInfo.from_dict(self.battle_model.json_state)))
 
         if self.player_number == 1:
-            self.send_json({'content': {'type': 'battle logic', 'body': 'your move'}})
+            await self.send_json({'content': {'type': 'battle logic', 'body': 'your move'}})
+        else:
+            await self.send_message_to_opponent('send_json', {'type': 'battle logic', 'body': 'your move'})
+
+    async def send_changes_after_shot(self, shot_result: ShotResult) -> None:
+        board = shot_result.player_info.board
+        changes = {'cells': board.cells_as_int(shot_result.changed_cells),
+                   'ships count': get_ships_count(shot_result.player_info),
+                   'sequence': board.shots}
+
+        if self.sends_deltas:
+            body = changes
+        else:
+            body = {'field': board.field_as_int(), 'ships count': changes['ships count']}
+        await self.send_json({'content': {'type': 'changed opponent field', 'body': body}})
+        await self.send_message_to_opponent('send_your_field_changes', changes)
+        await self.send_message_to_spectators('merge_field_changes', {'player': self.opponent_number + 1, **changes})
+
+    async def send_your_field_changes(self, content: dict[str, Any]) -> None:
+        changes = content['content']
+        if self.sends_deltas:
+            body = changes
         else:
-            self.send_message_to_opponent('send_json', {'type': 'battle logic', 'body': 'your move'})
-
-    def send_changes_after_shot(self) -> None:
-        player_info = self.battle_fields[self.opponent_number]
-        field = player_info.field_as_int()
-        ships_count = get_ships_count(player_info.ships_coordinates)
-        self.send_json({'content': {'type': 'changed opponent field',
-                                    'body': {'field': field, 'ships count': ships_count}}})
-        self.send_message_to_opponent('send_json', {'type': 'changed your field',
-                                                    'body': {'field': field, 'ships count': ships_count}})
-
-    def send_progress_battle_data(self, *args: Any) -> None:
-        self_info = self.get_all_data_about_player(self.player_number)
-        opponents_info = self.get_all_data_about_player(self.opponent_number + 1)
+            player_info = await self.battle_state_store.get_player_info(self.battle_model.address,
+                                                                        self.player_number)
+            body = {'field': player_info.field_as_int(), 'ships count': changes['ships count']}
+        await self.send_json({'content': {'type': 'changed your field', 'body': body}})
+
+    async def send_progress_battle_data(self, *args: Any) -> None:
+        battle_fields = await self.battle_state_store.get(self.battle_model.address)
+        self_info = self.get_all_data_about_player(battle_fields[self.player_number - 1])
+        opponents_info = self.get_all_data_about_player(battle_fields[self.opponent_number])
         opponents_info.pop('living ships')
-        self.send_json({'content': {'type': 'progress battle data',
-                                    'body': {'your info': self_info, 'opponents info': opponents_info}}})
+        await self.send_json({'content': {'type': 'progress battle data',
+                                          'body': {'your info': self_info, 'opponents info': opponents_info}}})
 
-    def end_game(self, *args: Any) -> None:
+    async def end_game(self, *args: Any) -> None:
         """
         The method that processes end of the battle
 
-        Only winner can call it
+        Only winner can call it. The battle ends once, a repeated call (e.g. after a double surrender) is ignored
         """
 
-        self.battle_model.whose_move = None
-        self.battle_model.who_win = self.player_number
-        self.battle_model.save()
+        if self.battle_model.who_win is not None:
+            return
+
+        await self.change_battle_state(whose_move=None, who_win=self.player_number)
+        self.record_result(won=True)
+
+        await self.send_json({'content': {'type': 'end game', 'body': 'you are winner'}})
+        await self.send_message_to_opponent('send_json', {'content': {'type': 'end game',
+                                                                      'body': 'you are loser'}})
 
-        self.send_json({'content': {'type': 'end game', 'body': 'you are winner'}})
-        self.send_message_to_opponent('send_json', {'content': {'type': 'end game', 'body': 'you are loser'}})
+        await self.send_info_after_end()
+        await self.send_message_to_opponent('send_info_after_end')
 
-        self_info = self.get_all_data_about_player(self.player_number)
-        opponents_info = self.get_all_data_about_player(self.opponent_number + 1)
+    async def send_info_after_end(self, *args: Any) -> None:
+        """The method that sends final fields. Delta clients already have them, so they get ships only"""
 
-        self.send_json({'content': {'type': 'info after end',
-                                    'body': {'your info': self_info, 'opponents info': opponents_info}}})
-        self.send_message_to_opponent('send_json', {'type': 'info after end',
-                                                    'body': {'your info': opponents_info, 'opponents info': self_info}})
+        battle_fields = await self.battle_state_store.get(self.battle_model.address)
+        self_info = self.get_all_data_about_player(battle_fields[self.player_number - 1])
+        opponents_info = self.get_all_data_about_player(battle_fields[self.opponent_number])
+        if self.sends_deltas:
+            self_info.pop('field')
+            opponents_info.pop('field')
 
-    def get_all_data_about_player(self, player_number: int) -> dict[str, Union[list, dict]]:
-        player_info = self.battle_fields[player_number - 1]
-        return {'field': player_info.field_as_int(),
-                'living ships': player_info.ships_coordinates,
-                'ships count': get_ships_count(player_info.ships_coordinates)}
+        await self.send_json({'content': {'type': 'info after end',
+                                          'body': {'your info': self_info, 'opponents info': opponents_info}}})
 
+    def get_all_data_about_player(self, player_info: PlayerInfo) -> dict[str, Union[list, dict, int]]:
+        data: dict[str, Union[list, dict, int]] = {'field': player_info.field_as_int(),
+                                                   'living ships': player_info.ships_coordinates,
+                                                   'ships count': get_ships_count(player_info)}
+        if self.sends_deltas:
+            data['sequence'] = player_info.board.shots
+        return data
 
-class SearchOpponentConsumer(JsonWebsocketConsumer):
-    """The consumer that processes search the opponent"""
 
-    def connect(self) -> None:
-        self.accept()
-        async_to_sync(self.channel_layer.group_add)('search', self.channel_name)
-        async_to_sync(self.channel_layer.group_send)('search', {'type': 'connect_player', 'name': self.channel_name})
+class SpectatorConsumer(AsyncJsonWebsocketConsumer):
+    """
+    The consumer that streams the battle to a spectator
 
-    def connect_player(self, data: dict[str, str]) -> None:
-        if data['name'] == self.channel_name:
+    Spectators see the fields like the opponents see them: hits, misses and ships count without living ships.
+    Player consumers send every change once to the battle's group. Changes are merged until the next frame,
+    so a spectator gets a frame per changed field every 'SPECTATORS["FLUSH_INTERVAL"]' seconds at most
+    and a slow spectator can't hold up the players. The channel layer drops messages to a channel
+    that is full; a spectator who has missed a change gets the whole field again
+    """
+
+    flushing_task: Optional[asyncio.Task] = None
+
+    async def __call__(self, scope: dict[str, Any], receive: Callable, send: Callable) -> None:
+        self.channel_layer_alias = get_battle_channel_layer_alias(scope['url_route']['kwargs']['address'])
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if self.flushing_task is not None:
+                self.flushing_task.cancel()
+
+    async def connect(self) -> None:
+        self.address = self.scope['url_route']['kwargs']['address']
+        battle_model = await database_sync_to_async(get_player_slots().get_battle)(address=self.address)
+        if battle_model is None:
+            await self.close()
+            return
+
+        self.codec = choose_codec(self.scope.get('subprotocols', []))
+        await self.accept(self.codec.subprotocol)
+        await self.channel_layer.group_add(get_spectators_group(self.address), self.channel_name)
+        for player_number in (1, 2):
+            player = battle_model.get_player(player_number)
+            if player is not None and player.channel_name:
+                await self.announce_spectator({'channel_name': player.channel_name})
+
+        self.battle_state = {'whose_move': battle_model.whose_move, 'who_win': battle_model.who_win}
+        self.battle_state_changed = True
+        self.sequences = {1: -1, 2: -1}
+        self.changes: dict[int, dict[str, Any]] = {}
+        self.stale_fields = {1, 2}
+        self.changed = asyncio.Event()
+        self.changed.set()
+        self.flushing_task = asyncio.create_task(self.flush_periodically())
+
+    async def disconnect(self, code: int) -> None:
+        if self.flushing_task is not None:
+            await self.channel_layer.group_discard(get_spectators_group(self.address), self.channel_name)
+
+    async def receive(self, text_data: Optional[str] = None, bytes_data: Optional[bytes] = None,
+                      **kwargs: Any) -> None:
+        """Spectators can't send requests, their frames are dropped without decoding"""
+
+    async def announce_spectator(self, content: dict[str, Any]) -> None:
+        """The method that makes the player's consumer send changes to the spectators, see 'find_spectators'"""
+
+        await self.channel_layer.send(content['channel_name'], {'type': 'spectator_joined'})
+
+    async def set_battle_state(self, content: dict[str, Any]) -> None:
+        self.battle_state = content['content']
+        self.battle_state_changed = True
+        self.changed.set()
+
+    async def merge_field_changes(self, content: dict[str, Any]) -> None:
+        changes = content['content']
+        player_number, sequence = changes['player'], changes['sequence']
+        if sequence <= self.sequences[player_number]:
             return
+        if sequence > self.sequences[player_number] + 1:
+            self.stale_fields.add(player_number)
+        self.sequences[player_number] = sequence
+
+        merged_changes = self.changes.setdefault(player_number, {'cells': {}})
+        merged_changes['cells'].update(((x, y), state) for x, y, state in changes['cells'])
+        merged_changes['ships count'] = changes['ships count']
+        merged_changes['sequence'] = sequence
+        self.changed.set()
+
+    async def flush_periodically(self) -> None:
+        while True:
+            await self.changed.wait()
+            self.changed.clear()
+            await self.flush()
+            await asyncio.sleep(settings.SPECTATORS['FLUSH_INTERVAL'])
+
+    async def flush(self) -> None:
+        """The method that sends the merged changes. Stale fields are sent whole instead of their changes"""
+
+        if self.battle_state_changed:
+            self.battle_state_changed = False
+            battle_model = Battle(**self.battle_state)
+            await self.send_frame('battle state', {'state': battle_model.state.name,
+                                                   'whose move': battle_model.whose_move,
+                                                   'who win': battle_model.who_win})
+
+        stale_fields, self.stale_fields = self.stale_fields, set()
+        for player_number in sorted(stale_fields):
+            player_info = await get_battle_state_store().get_player_info(self.address, player_number)
+            self.sequences[player_number] = max(self.sequences[player_number], player_info.board.shots)
+            await self.send_frame('field snapshot', {'player': player_number, 'field': player_info.field_as_int(),
+                                                     'ships count': get_ships_count(player_info),
+                                                     'sequence': player_info.board.shots})
+            if self.changes.get(player_number, {}).get('sequence', -1) <= player_info.board.shots:
+                self.changes.pop(player_number, None)
+
+        changes, self.changes = self.changes, {}
+        for player_number, merged_changes in sorted(changes.items()):
+            await self.send_frame('changed field', {
+                'player': player_number,
+                'cells': [[x, y, state] for (x, y), state in merged_changes['cells'].items()],
+                'ships count': merged_changes['ships count'],
+                'sequence': merged_changes['sequence'],
+            })
+
+    async def send_frame(self, frame_type: str, body: Any) -> None:
+        await self.send(**self.codec.encode({'type': frame_type, 'body': body}))
+
+
+class SearchOpponentConsumer(AsyncJsonWebsocketConsumer):
+    """
+    The consumer that processes search the opponent
+
+    Players wait in the matchmaking queue. Pairs are made right after joining
+    or every 'PAIRING_INTERVAL' seconds if the interval is set.
+    A player who has connected with '?opponent=bot' gets a battle with the server-side bot at once
+    """
+
+    queue_entry: Optional[str] = None
+
+    async def connect(self) -> None:
+        await self.accept()
+        if parse_qs(self.scope['query_string'].decode()).get('opponent') == ['bot']:
+            battle = await database_sync_to_async(Battle.objects.create)()
+            await start_bot(battle.address, BattleConsumer.as_asgi())
+            await self.send_json({'content': {'ws_address': battle.address}})
+            return
+
+        self.queue = get_matchmaking_queue()
+        self.queue_entry = await self.queue.push(self.channel_name)
+
+        if settings.MATCHMAKING.get('PAIRING_INTERVAL'):
+            start_pairing(self.queue, self.channel_layer)
+        else:
+            await pair_players(self.queue, self.channel_layer)
+
+    async def dispatch(self, message: dict[str, Any]) -> None:
+        with event_metrics.measure('search', message['type']):
+            await super().dispatch(message)
 
-        battle = Battle.objects.create()
-        async_to_sync(self.channel_layer.send)(data['name'], {'type': 'send_json',
-                                                              'content': {'ws_address': battle.address}})
-        self.send_json({'content': {'ws_address': battle.address}})
+    async def disconnect(self, code: int) -> None:
+        if self.queue_entry is not None:
+            await self.queue.remove(self.queue_entry)
 
-    def send_json(self, content: dict[str, Any], close: bool = False) -> None:
-        super().send_json(content['content'])
-        self.close()
+    async def send_json(self, content: dict[str, Any], close: bool = False) -> None:
+        await super().send_json(content['content'])
+        await self.close()
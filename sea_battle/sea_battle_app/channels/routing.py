@@ -1,8 +1,9 @@
 from django.urls import path
 
-from .consumers import BattleConsumer, SearchOpponentConsumer
+from .consumers import BattleConsumer, SearchOpponentConsumer, SpectatorConsumer
 
 websocket_urlpatterns = [
     path('ws/battle/<str:address>/', BattleConsumer.as_asgi()),
+    path('ws/battle/<str:address>/watch/', SpectatorConsumer.as_asgi()),
     path('ws/search-battle/', SearchOpponentConsumer.as_asgi())
 ]
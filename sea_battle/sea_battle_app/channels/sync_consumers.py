@@ -0,0 +1,209 @@
+from functools import wraps
+from typing import Any, Union, Optional, Callable
+
+from asgiref.sync import async_to_sync
+from channels.generic.websocket import JsonWebsocketConsumer
+
+from sea_battle_app.battle_logic import BattleInfo, PlayerInfo, create_battle, validate_ships_coords, get_ships_count
+from sea_battle_app.battle_state import ShotResult, apply_shot
+from sea_battle_app.models import Battle, Player
+
+
+class SyncBattleConsumer(JsonWebsocketConsumer):
+    """
+    The synchronous battle consumer the project had before 'BattleConsumer', kept as the baseline of
+    'manage.py benchmark consumers'. It isn't routed
+
+    Every handler runs in the thread pool of synchronous consumers, the battle row is refreshed
+    per request and the field that was changed is copied to the opponent's consumer through the channel
+    layer. It speaks the subset of the protocol that bots use: field changes are always sent as deltas,
+    there are no reconnection tokens, spectators, rate limits and move log
+    """
+
+    def connect(self) -> None:
+        address = self.scope['url_route']['kwargs']['address']
+        battle_model = Battle.objects.select_related('first_player', 'second_player').filter(address=address).first()
+        if battle_model is None or battle_model.first_player and battle_model.second_player:
+            self.close()
+            return
+
+        self.battle_model = battle_model
+        self.accept()
+        self.set_player()
+
+        self.battle_fields = create_battle()
+        if self.battle_model.first_player and self.battle_model.second_player:
+            self.send_message_to_opponent('give_battle_info')
+            self.send_message_to_opponent('send_json', {'type': 'info', 'body': 'opponent connected'})
+
+        self.send_json({'content': {'type': 'state', 'body': self.battle_model.state.name}})
+
+    def disconnect(self, code: int) -> None:
+        if code != 1000 or not hasattr(self, 'player'):
+            return
+
+        self.player.delete()
+        self.battle_model.refresh_from_db()
+        if self.battle_model.first_player is None and self.battle_model.second_player is None:
+            self.battle_model.delete()
+        else:
+            self.send_message_to_opponent('send_json', {'type': 'info', 'body': 'opponent disconnected'})
+
+    def send_json(self, content: dict[str, Any], close: bool = False) -> None:
+        super().send_json(content['content'])
+
+    def receive_json(self, content: Union[list, dict[str, Any]], **kwargs: Any) -> None:
+        match content:
+            case {'type': 'load ships coordinates', 'body': body}:
+                self.load_ships_coordinates(body)
+            case {'type': 'take a shot', 'body': body}:
+                self.take_shot(body)
+            case {'type': 'surrender'}:
+                self.surrender()
+            case _:
+                self.send_json({'content': {'type': 'error', 'body': 'unknown request type'}})
+
+    @staticmethod
+    def available_at_stage(stage: Battle.State) -> Callable:
+        def decorator(func: Callable) -> Callable:
+            @wraps(func)
+            def wrapper(self, *args: Any) -> Any:
+                self.battle_model.refresh_from_db()
+                if self.battle_model.state is stage:
+                    return func(self, *args)
+                self.send_json({'content': {'type': 'error', 'body': 'request is not possible at this stage'}})
+
+            return wrapper
+
+        return decorator
+
+    @available_at_stage(Battle.State.preparation)
+    def load_ships_coordinates(self, ships_coordinates: list[list[list[int]]]) -> None:
+        condition, message = validate_ships_coords(ships_coordinates)
+        if condition:
+            self.battle_fields[self.player_number - 1].ships_coordinates = ships_coordinates
+            self.give_battle_info()
+        self.send_json({'content': {'type': ['error', 'success'][condition],
+                                    'body': message or 'ships successfully placed'}})
+        self.start_game_if_ready()
+
+    @available_at_stage(Battle.State.progress)
+    def take_shot(self, shot_coordinates: list[int]) -> None:
+        if self.battle_model.whose_move != self.player_number:
+            self.send_json({'content': {'type': 'error', 'body': 'not your move'}})
+            return
+
+        shot_result = apply_shot(shot_coordinates, self.battle_fields[self.opponent_number])
+        if shot_result is None:
+            self.send_json({'content': {'type': 'error', 'body': 'incorrect shot'}})
+            return
+
+        self.send_changes_after_shot(shot_result)
+        self.give_battle_info(self.opponent_number + 1)
+        if not shot_result.ship_was_hit:
+            self.battle_model.whose_move = self.opponent_number + 1
+            self.battle_model.save()
+            self.send_message_to_opponent('send_json', {'type': 'battle logic', 'body': 'your move'})
+        elif shot_result.player_info.board.ships:
+            self.send_json({'content': {'type': 'battle logic', 'body': 'your move'}})
+        else:
+            self.end_game()
+
+    @available_at_stage(Battle.State.progress)
+    def surrender(self) -> None:
+        self.send_message_to_opponent('send_json', {'type': 'info', 'body': 'opponent surrendered'})
+        self.send_message_to_opponent('end_game')
+
+    @property
+    def opponent(self) -> Optional[Player]:
+        if self.player_number == 1:
+            return self.battle_model.second_player
+        return self.battle_model.first_player
+
+    @property
+    def opponent_number(self) -> int:
+        """The method that returns opponent number (first player - 0, second player - 1)"""
+
+        return 2 // self.player_number - 1
+
+    def send_message_to_opponent(self, func_name: str, content: Optional[dict[str, Any]] = None) -> None:
+        if self.opponent:
+            async_to_sync(self.channel_layer.send)(self.opponent.channel_name, {'type': func_name, 'content': content})
+
+    def set_player(self) -> None:
+        self.player = Player.objects.create(channel_name=self.channel_name)
+        if self.battle_model.first_player is None:
+            self.battle_model.first_player, self.player_number = self.player, 1
+        else:
+            self.battle_model.second_player, self.player_number = self.player, 2
+        self.battle_model.save()
+
+    def give_battle_info(self, player_number: Any = None) -> None:
+        """
+        The method that copies the field of the player to the opponent's consumer
+
+        Without the number (or when it's called by the opponent) the field of this player is copied.
+        Only one field is copied, so fields that both players change at the same time aren't lost
+        """
+
+        if not isinstance(player_number, int):
+            player_number = self.player_number
+        self.battle_model.refresh_from_db()
+        self.send_message_to_opponent('set_battle_info', {
+            'player_number': player_number, 'player_info': self.battle_fields[player_number - 1].as_dict()})
+
+    def set_battle_info(self, content: dict[str, Any]) -> None:
+        player_number, player_info = content['content']['player_number'], content['content']['player_info']
+        self.battle_fields = self.battle_fields._replace(
+            **{BattleInfo._fields[player_number - 1]: PlayerInfo.from_dict(player_info)})
+        self.battle_model.refresh_from_db()
+        self.start_game_if_ready()
+
+    def start_game_if_ready(self) -> None:
+        """The method that starts the game once the second player's consumer has both fleets"""
+
+        if self.player_number == 2 and self.battle_model.whose_move is None and self.battle_model.who_win is None \
+                and self.battle_fields[0].board.ships and self.battle_fields[1].board.ships:
+            self.start_game()
+
+    def start_game(self) -> None:
+        self.battle_model.whose_move = 1
+        self.battle_model.save()
+        self.send_json({'content': {'type': 'state', 'body': Battle.State.progress.name}})
+        self.send_message_to_opponent('send_json', {'type': 'state', 'body': Battle.State.progress.name})
+
+        self.send_message_to_opponent('send_json', {'type': 'battle logic', 'body': 'your move'})
+
+    def send_changes_after_shot(self, shot_result: ShotResult) -> None:
+        board = shot_result.player_info.board
+        changes = {'cells': board.cells_as_int(shot_result.changed_cells),
+                   'ships count': get_ships_count(shot_result.player_info), 'sequence': board.shots}
+        self.send_json({'content': {'type': 'changed opponent field', 'body': changes}})
+        self.send_message_to_opponent('send_json', {'type': 'changed your field', 'body': changes})
+
+    def end_game(self, *args: Any) -> None:
+        """
+        The method that processes end of the battle
+
+        Only winner can call it
+        """
+
+        self.battle_model.refresh_from_db()
+        if self.battle_model.who_win is not None:
+            return
+        self.battle_model.whose_move = None
+        self.battle_model.who_win = self.player_number
+        self.battle_model.save()
+
+        self_info = self.get_all_data_about_player(self.battle_fields[self.player_number - 1])
+        opponents_info = self.get_all_data_about_player(self.battle_fields[self.opponent_number])
+        self.send_json({'content': {'type': 'end game', 'body': 'you are winner'}})
+        self.send_message_to_opponent('send_json', {'type': 'end game', 'body': 'you are loser'})
+        self.send_json({'content': {'type': 'info after end',
+                                    'body': {'your info': self_info, 'opponents info': opponents_info}}})
+        self.send_message_to_opponent('send_json', {'type': 'info after end',
+                                                    'body': {'your info': opponents_info, 'opponents info': self_info}})
+
+    @staticmethod
+    def get_all_data_about_player(player_info: PlayerInfo) -> dict[str, Union[list, dict]]:
+        return {'living ships': player_info.ships_coordinates, 'ships count': get_ships_count(player_info)}
@@ -0,0 +1,222 @@
+import bisect
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Any, Iterator, Optional
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+
+from sea_battle_app.models import PlayerStats
+from sea_battle_app.utils import BufferedWriter, create_backend
+
+LEADERBOARD_CACHE_KEY = 'leaderboard:{after}'
+
+# The position of the user in the leaderboard order, the page after it starts with the next user
+Cursor = tuple[int, int]
+
+
+class BaseRanking(ABC):
+    """
+    The ratings of users kept in the leaderboard order: by rating descending, then by user id
+
+    'StatsWriter' updates the users it writes, so the rank of the user and the count of users
+    are read without scanning the stats table
+    """
+
+    @abstractmethod
+    def update(self, ratings: dict[int, int]) -> None:
+        """The method that sets the ratings of the users, adding the users that aren't ranked"""
+
+    @abstractmethod
+    def get_rank(self, user_id: int) -> Optional[int]:
+        """The method that returns the rank starting from 1 or 'None' if the user isn't ranked"""
+
+    @abstractmethod
+    def get_count(self) -> int:
+        pass
+
+    @abstractmethod
+    def clear(self) -> None:
+        pass
+
+
+class InMemoryRanking(BaseRanking):
+    """The process-local ranking in a sorted list. It is suitable for development and tests only"""
+
+    def __init__(self) -> None:
+        self.keys: list[tuple[int, int]] = []
+        self.ratings: dict[int, int] = {}
+
+    def update(self, ratings: dict[int, int]) -> None:
+        for user_id, rating in ratings.items():
+            old_rating = self.ratings.get(user_id)
+            if old_rating is not None:
+                del self.keys[bisect.bisect_left(self.keys, (-old_rating, user_id))]
+            bisect.insort(self.keys, (-rating, user_id))
+            self.ratings[user_id] = rating
+
+    def get_rank(self, user_id: int) -> Optional[int]:
+        rating = self.ratings.get(user_id)
+        if rating is None:
+            return None
+        return bisect.bisect_left(self.keys, (-rating, user_id)) + 1
+
+    def get_count(self) -> int:
+        return len(self.keys)
+
+    def clear(self) -> None:
+        self.keys.clear()
+        self.ratings.clear()
+
+
+class RedisRanking(BaseRanking):
+    """
+    The ranking in a Redis sorted set, the rank is read by ZREVRANK in logarithmic time
+
+    The score is 'rating * 2^32 - user id', so users with the same rating are ordered by id like in the database.
+    Scores are exact while ratings are within ±2^20
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 6379, db: int = 0, key: str = 'leaderboard') -> None:
+        self.redis = redis.Redis(host=host, port=port, db=db)
+        self.key = key
+
+    @staticmethod
+    def get_score(user_id: int, rating: int) -> int:
+        return (rating << 32) - user_id
+
+    def update(self, ratings: dict[int, int]) -> None:
+        if ratings:
+            self.redis.zadd(self.key, {str(user_id): self.get_score(user_id, rating)
+                                       for user_id, rating in ratings.items()})
+
+    def get_rank(self, user_id: int) -> Optional[int]:
+        rank = self.redis.zrevrank(self.key, str(user_id))
+        return None if rank is None else rank + 1
+
+    def get_count(self) -> int:
+        return self.redis.zcard(self.key)
+
+    def clear(self) -> None:
+        self.redis.delete(self.key)
+
+
+@lru_cache(maxsize=None)
+def get_ranking() -> BaseRanking:
+    """The function that returns the ranking configured by the 'LEADERBOARD["RANKING"]' setting"""
+
+    return create_backend(settings.LEADERBOARD['RANKING'])
+
+
+class StatsWriter(BufferedWriter[dict[int, list[int]]]):
+    """
+    The process-wide buffer of the battle results
+
+    Results of the same user are summed, and all users of the buffer are updated by one UPDATE query
+    when the buffer has 'batch_size' users or every 'flush_interval' seconds, see 'BufferedWriter'.
+    Then their new ratings are read back and set in the ranking
+    """
+
+    def __init__(self, batch_size: int = 100, flush_interval: float = 1.0) -> None:
+        super().__init__(batch_size, flush_interval)
+
+    def create_buffer(self) -> dict[int, list[int]]:
+        return {}
+
+    def add_result(self, user_id: int, won: bool) -> None:
+        wins_and_losses = self.buffer.setdefault(user_id, [0, 0])
+        wins_and_losses[0 if won else 1] += 1
+        self.schedule_flush()
+
+    def write(self, results: dict[int, list[int]]) -> None:
+        """The method that creates missing stats, adds the results to all users by one UPDATE query and ranks them"""
+
+        def sum_by_user(field: str, amounts: dict[int, int]) -> Any:
+            return F(field) + Case(*(When(user_id=user_id, then=Value(amount)) for user_id, amount in amounts.items()),
+                                   default=Value(0))
+
+        with transaction.atomic():
+            PlayerStats.objects.bulk_create([PlayerStats(user_id=user_id, rating=settings.LEADERBOARD['INITIAL_RATING'])
+                                             for user_id in results], ignore_conflicts=True)
+            PlayerStats.objects.filter(user_id__in=results).update(
+                wins=sum_by_user('wins', {user_id: wins for user_id, (wins, _) in results.items()}),
+                losses=sum_by_user('losses', {user_id: losses for user_id, (_, losses) in results.items()}),
+                rating=sum_by_user('rating', {
+                    user_id: wins * settings.LEADERBOARD['WIN_POINTS'] - losses * settings.LEADERBOARD['LOSS_POINTS']
+                    for user_id, (wins, losses) in results.items()
+                })
+            )
+            ratings = dict(PlayerStats.objects.filter(user_id__in=results).values_list('user_id', 'rating'))
+        get_ranking().update(ratings)
+
+
+@lru_cache(maxsize=None)
+def get_stats_writer() -> StatsWriter:
+    """The function that returns the writer configured by the 'LEADERBOARD' setting"""
+
+    return StatsWriter(settings.LEADERBOARD['BATCH_SIZE'], settings.LEADERBOARD['FLUSH_INTERVAL'])
+
+
+def serialize_stats(stats: PlayerStats, rank: Optional[int]) -> dict[str, Any]:
+    return {'rank': rank, 'username': stats.user.username, 'wins': stats.wins, 'losses': stats.losses,
+            'rating': stats.rating}
+
+
+def get_leaderboard_page(after: Optional[Cursor] = None) -> dict[str, Any]:
+    """
+    The function that returns the page of users ordered by rating, starting after the 'after' cursor
+
+    The page is read from the rating index by keyset, and the rank of its first user is read from the ranking,
+    so the cost doesn't depend on how deep the page is. Pages are cached for 'LEADERBOARD["CACHE_TIMEOUT"]'
+    seconds, so the ranks may be behind the results a bit
+    """
+
+    cache_key = LEADERBOARD_CACHE_KEY.format(after='first' if after is None else '%d:%d' % after)
+    leaderboard_page = cache.get(cache_key)
+    if leaderboard_page is None:
+        users_stats = PlayerStats.objects.select_related('user').order_by('-rating', 'user')
+        if after is not None:
+            rating, user_id = after
+            users_stats = users_stats.filter(Q(rating__lt=rating) | Q(rating=rating, user__gt=user_id))
+        page = list(users_stats[:settings.LEADERBOARD['PAGE_SIZE']])
+
+        first_rank = get_ranking().get_rank(page[0].pk) if page else None
+        next_cursor = None
+        if len(page) == settings.LEADERBOARD['PAGE_SIZE']:
+            next_cursor = '%d:%d' % (page[-1].rating, page[-1].pk)
+        leaderboard_page = {'count': get_ranking().get_count(), 'next': next_cursor,
+                            'results': [serialize_stats(stats, None if first_rank is None else first_rank + i)
+                                        for i, stats in enumerate(page)]}
+        cache.set(cache_key, leaderboard_page, settings.LEADERBOARD['CACHE_TIMEOUT'])
+    return leaderboard_page
+
+
+def get_user_rank(stats: PlayerStats) -> Optional[int]:
+    """The function that reads the rank of the user from the ranking, 'None' if the user isn't ranked yet"""
+
+    return get_ranking().get_rank(stats.pk)
+
+
+def iter_ratings(batch_size: int) -> Iterator[dict[int, int]]:
+    """The function that yields the ratings of all users by batches in the leaderboard order"""
+
+    users_stats = PlayerStats.objects.order_by('-rating', 'user').values_list('rating', 'user_id')
+    batch = list(users_stats[:batch_size])
+    while batch:
+        yield {user_id: rating for rating, user_id in batch}
+        rating, user_id = batch[-1]
+        batch = list(users_stats.filter(Q(rating__lt=rating) | Q(rating=rating, user__gt=user_id))[:batch_size])
+
+
+def rebuild_ranking(batch_size: int = 1000) -> int:
+    """The function that fills the ranking from the stats table, e.g. after the Redis data is lost"""
+
+    ranking, count = get_ranking(), 0
+    ranking.clear()
+    for ratings in iter_ratings(batch_size):
+        ranking.update(ratings)
+        count += len(ratings)
+    return count
@@ -0,0 +1,349 @@
+import asyncio
+import json
+import random
+import time
+import timeit
+from typing import Any, Callable, Optional, Union
+
+from channels.db import database_sync_to_async
+from channels.layers import channel_layers
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandParser
+from django.test import override_settings
+
+from sea_battle_app.battle_logic import BattleInfo, PlayerInfo, Bitboard, generate_fleet_masks, \
+    generate_many_fleet_masks, generate_many_ships_coords, get_ships_count, mask_to_coords, validate_many_ships_coords
+from sea_battle_app.battle_state import ShotResult, apply_shot, get_battle_state_store
+from sea_battle_app.bot import BotClient
+from sea_battle_app.channels.codecs import CODECS
+from sea_battle_app.channels.consumers import BattleConsumer
+from sea_battle_app.channels.sync_consumers import SyncBattleConsumer
+from sea_battle_app.models import Battle
+
+
+def get_player_data(player_info: PlayerInfo, with_ships: bool) -> dict[str, Any]:
+    data = {'field': player_info.field_as_int(), 'ships count': get_ships_count(player_info),
+            'sequence': player_info.board.shots}
+    if with_ships:
+        data['living ships'] = player_info.ships_coordinates
+    return data
+
+
+def create_sample_battle(shots_count: int, rng: random.Random) -> tuple[BattleInfo, ShotResult]:
+    """The function that returns a random battle after 'shots_count' random shots at every field and the last shot"""
+
+    battle_info = BattleInfo(*(PlayerInfo(Bitboard(ships=generate_fleet_masks(rng))) for _ in range(2)))
+    shot_result = ShotResult(False, battle_info.second_player, 0)
+    for player_info in battle_info:
+        shots = [[x, y] for x in range(10) for y in range(10)]
+        rng.shuffle(shots)
+        for shot in shots[:shots_count]:
+            shot_result = apply_shot(shot, player_info) or shot_result
+    return battle_info, shot_result
+
+
+def count_transitions(rng: random.Random) -> tuple[int, int]:
+    """
+    The function that plays a random game and returns the number of its shots and of its transitions
+
+    The move passes after every miss, the game start and the game end are transitions as well
+    """
+
+    battle_info = BattleInfo(*(PlayerInfo(Bitboard(ships=generate_fleet_masks(rng))) for _ in range(2)))
+    shots = [[[x, y] for x in range(10) for y in range(10)] for _ in range(2)]
+    for player_shots in shots:
+        rng.shuffle(player_shots)
+
+    shots_count, transitions, shooter = 0, 2, 0
+    while True:
+        shot_result = apply_shot(shots[shooter].pop(), battle_info[1 - shooter])
+        if shot_result is None:
+            continue
+        shots_count += 1
+        if not shot_result.player_info.board.ships:
+            return shots_count, transitions
+        if not shot_result.ship_was_hit:
+            shooter, transitions = 1 - shooter, transitions + 1
+
+
+def get_sample_messages(shots_count: int, seed: int) -> dict[str, Any]:
+    """The function that returns a message of every type of 'documentation.yaml' in the middle of a random battle"""
+
+    rng = random.Random(seed)
+    battle_info, shot_result = create_sample_battle(shots_count, rng)
+    your_info = get_player_data(battle_info.first_player, with_ships=True)
+    opponents_info = get_player_data(battle_info.second_player, with_ships=False)
+    changes = {'cells': shot_result.player_info.board.cells_as_int(shot_result.changed_cells),
+               'ships count': get_ships_count(shot_result.player_info), 'sequence': shot_result.player_info.board.shots}
+    return {
+        'loadShipsCoordinates': {'type': 'load ships coordinates',
+                                 'body': [mask_to_coords(ship) for ship in generate_fleet_masks(rng)]},
+        'takeShot': {'type': 'take a shot', 'body': [4, 7]},
+        'surrender': {'type': 'surrender', 'body': None},
+        'requestSnapshot': {'type': 'request snapshot', 'body': None},
+        'impossibleAtThisStageRequest': {'type': 'error', 'body': 'request is not possible at this stage'},
+        'incorrectLoadingCoordinatesRequest': {'type': 'error', 'body': 'incorrect input data'},
+        'correctPlacementOfShips': {'type': 'success', 'body': 'ships successfully placed'},
+        'opponentsTurn': {'type': 'error', 'body': 'not your move'},
+        'incorrectShot': {'type': 'error', 'body': 'incorrect shot'},
+        'incorrectRequest': {'type': 'error', 'body': 'request must have \'type\' field'},
+        'yourMove': {'type': 'battle logic', 'body': 'your move'},
+        'opponentsReadiness': {'type': 'battle logic', 'body': 'opponent is ready'},
+        'battleState': {'type': 'state', 'body': 'progress'},
+        'reconnectionToken': {'type': 'reconnection token', 'body': 'qQmbmHIrOx2yXcMqhWx5vw'},
+        'progressBattleData': {'type': 'progress battle data',
+                               'body': {'your info': your_info, 'opponents info': opponents_info}},
+        'changedOpponentField': {'type': 'changed opponent field',
+                                 'body': {'field': opponents_info['field'], 'ships count': changes['ships count']}},
+        'changedOpponentField (delta)': {'type': 'changed opponent field', 'body': changes},
+        'changedYourField': {'type': 'changed your field',
+                             'body': {'field': your_info['field'], 'ships count': your_info['ships count']}},
+        'youAreWinner': {'type': 'end game', 'body': 'you are winner'},
+        'youAreLoser': {'type': 'end game', 'body': 'you are loser'},
+        'infoAfterEnd': {'type': 'info after end', 'body': {'your info': your_info,
+                                                            'opponents info': {**opponents_info, 'living ships': []}}},
+        'spectatedBattleState': {'type': 'battle state', 'body': {'state': 'progress', 'whose move': 1,
+                                                                  'who win': None}},
+        'fieldSnapshot': {'type': 'field snapshot', 'body': {'player': 2, **opponents_info}},
+        'changedField': {'type': 'changed field', 'body': {'player': 2, **changes}},
+        'battleFound': {'ws_address': '018b4a3c2f1e7d6a-f5Yq2Lw8'},
+    }
+
+
+def get_shard_settings(shards_count: int, redis_hosts: Optional[list[tuple[str, int]]]) -> dict[str, Any]:
+    """The function that returns the settings of the battle channel layers and state stores of the shards"""
+
+    layers: list[dict[str, Any]]
+    stores: list[dict[str, Any]]
+    if redis_hosts is None:
+        layers = [{'BACKEND': 'channels.layers.InMemoryChannelLayer'} for _ in range(shards_count)]
+        stores = [{'BACKEND': 'sea_battle_app.battle_state.InMemoryBattleStateStore'} for _ in range(shards_count)]
+    else:
+        hosts = [redis_hosts[i % len(redis_hosts)] for i in range(shards_count)]
+        layers = [{'BACKEND': 'channels_redis.core.RedisChannelLayer', 'CONFIG': {'hosts': [host]}} for host in hosts]
+        stores = [{'BACKEND': 'sea_battle_app.battle_state.RedisBattleStateStore',
+                   'CONFIG': {'host': host, 'port': port}} for host, port in hosts]
+
+    aliases = [f'benchmark-{i}' for i in range(shards_count)]
+    return {
+        'CHANNEL_LAYERS': {**settings.CHANNEL_LAYERS, **dict(zip(aliases, layers))},
+        'BATTLE_CHANNEL_LAYERS': aliases,
+        'BATTLE_STATE_STORE': {'BACKEND': 'sea_battle_app.battle_state.ShardedBattleStateStore',
+                               'CONFIG': {'shards': stores}},
+    }
+
+
+def count_layer_messages(alias: str, counter: list[int]) -> None:
+    """The function that makes the channel layer count its 'send' and 'group_send' calls in 'counter'"""
+
+    channel_layer = channel_layers[alias]
+    for method_name in ('send', 'group_send'):
+        method = getattr(channel_layer, method_name)
+
+        async def counted(*args: Any, method: Callable = method) -> None:
+            counter[0] += 1
+            await method(*args)
+
+        setattr(channel_layer, method_name, counted)
+
+
+ConsumerClass = type[Union[BattleConsumer, SyncBattleConsumer]]
+
+CONSUMERS: dict[str, ConsumerClass] = {'async': BattleConsumer, 'sync': SyncBattleConsumer}
+
+
+class Command(BaseCommand):
+    help = 'Runs the benchmark in this process and reports its throughput. Run it ' \
+           'with DJANGO_SETTINGS_MODULE=sea_battle.loadtest_settings to test it without Redis and Postgres'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+        consumers = subparsers.add_parser('consumers', help='battles of two bots played at the same time through '
+                                                            'battle consumers, without sockets')
+        consumers.add_argument('--battles', type=int, nargs='+', default=[10, 50, 100, 200],
+                               help='the numbers of concurrent battles to measure')
+        consumers.add_argument('--consumers', nargs='+', choices=list(CONSUMERS), default=list(CONSUMERS),
+                               help='the battle consumers to compare')
+
+        codecs = subparsers.add_parser('codecs', help='encoding and decoding of every message type by every codec')
+        codecs.add_argument('--number', type=int, default=2000, help='the number of encodings of every message')
+        codecs.add_argument('--shots', type=int, default=40, help='the shots at every field of the sample battle')
+        codecs.add_argument('--seed', type=int, default=0)
+
+        checkpoint = subparsers.add_parser('checkpoint', help='the cost of the checkpoint that every transition writes')
+        checkpoint.add_argument('--number', type=int, default=500, help='the number of measured writes')
+        checkpoint.add_argument('--games', type=int, default=200,
+                                help='the number of random games to count transitions per game')
+        checkpoint.add_argument('--shots', type=int, default=40, help='the shots at every field of the checkpoint')
+        checkpoint.add_argument('--seed', type=int, default=0)
+
+        simulator = subparsers.add_parser('simulator', help='random games of the NumPy batch simulator and of the '
+                                                            'battle logic')
+        simulator.add_argument('--games', type=int, nargs='+', default=[1000, 10000, 100000],
+                               help='the numbers of games played by one batch')
+        simulator.add_argument('--seed', type=int, default=0)
+
+        fleets = subparsers.add_parser('fleets', help='generation of random legal fleets')
+        fleets.add_argument('--fleets', type=int, default=1000, help='the number of generated fleets')
+        fleets.add_argument('--seed', type=int, default=0)
+
+        shards = subparsers.add_parser('shards', help='bot battles with their channel layers and states spread '
+                                                      'over shards')
+        shards.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4], help='the numbers of shards to measure')
+        shards.add_argument('--battles', type=int, default=50, help='the number of concurrent battles')
+        shards.add_argument('--redis', type=lambda value: [(host, int(port)) for host, port in
+                                                           (shard.split(':') for shard in value.split(','))],
+                            help='Redis instances like \'127.0.0.1:6379,127.0.0.1:6380\' that shards are assigned to '
+                                 'in turn, the in-memory backends are used without it')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        getattr(self, f'benchmark_{options["benchmark"]}')(options)
+
+    def benchmark_consumers(self, options: dict[str, Any]) -> None:
+        """
+        The method that plays every number of battles at the same time and reports battles per second
+
+        Both players of a battle are bots, every bot runs its own consumer as an ASGI application,
+        so the consumers, the channel layer, the state store and the database are the same as for sockets.
+        'SyncBattleConsumer' is the synchronous baseline of 'BattleConsumer'. The time per battle grows
+        with the number of battles once the process is saturated
+        """
+
+        asyncio.run(self.compare_consumers(options['consumers'], options['battles']))
+
+    async def compare_consumers(self, consumers: list[str], battles_counts: list[int]) -> None:
+        """The method that plays all battles in one event loop, so the Redis clients of the stores stay bound to it"""
+
+        self.stdout.write(f'{"consumer":<10}{"battles":>8}{"duration, s":>14}{"battles/s":>12}{"s per battle":>14}')
+        for consumer in consumers:
+            for battles_count in battles_counts:
+                started_at = time.perf_counter()
+                await self.play_bot_battles(battles_count, CONSUMERS[consumer])
+                duration = time.perf_counter() - started_at
+                self.stdout.write(f'{consumer:<10}{battles_count:>8}{duration:>14.2f}'
+                                  f'{battles_count / duration:>12.1f}{duration / battles_count:>14.4f}')
+
+    @staticmethod
+    async def play_bot_battles(battles_count: int, consumer: ConsumerClass = BattleConsumer) -> None:
+        battles = await database_sync_to_async(Battle.objects.create_many)(battles_count)
+        application = consumer.as_asgi()
+        await asyncio.gather(*(BotClient(battle.address, application).run() for battle in battles for _ in range(2)))
+
+    def benchmark_codecs(self, options: dict[str, Any]) -> None:
+        """The method that reports bytes on the wire and encoding and decoding time of every message type"""
+
+        self.stdout.write(f'{"message":<30}{"codec":<20}{"bytes":>7}{"encode, us":>12}{"decode, us":>12}')
+        for message_type, content in get_sample_messages(options['shots'], options['seed']).items():
+            for codec in CODECS.values():
+                frame = codec.encode(content)
+                data = frame.get('text_data', frame.get('bytes_data'))
+                text_data = data if isinstance(data, str) else None
+                bytes_data = data if isinstance(data, bytes) else None
+                size = len(bytes_data) if bytes_data is not None else len(str(text_data).encode())
+                encode_time = timeit.timeit(lambda: codec.encode(content), number=options['number'])
+                decode_time = timeit.timeit(lambda: codec.decode(text_data, bytes_data), number=options['number'])
+                self.stdout.write(f'{message_type:<30}{codec.subprotocol or "json":<20}{size:>7}'
+                                  f'{encode_time / options["number"] * 1e6:>12.1f}'
+                                  f'{decode_time / options["number"] * 1e6:>12.1f}')
+
+    def benchmark_checkpoint(self, options: dict[str, Any]) -> None:
+        """
+        The method that compares the transition UPDATE with and without the 'json_state' checkpoint
+
+        Checkpoints are written only by transitions, so the overhead per game is the overhead per write
+        multiplied by the transitions of a game, not by its shots
+        """
+
+        rng = random.Random(options['seed'])
+        battle_info, _ = create_sample_battle(options['shots'], rng)
+        battle = Battle.objects.create(whose_move=1)
+        try:
+            serialization = min(timeit.repeat(battle_info.as_dict, number=options['number'])) / options['number']
+            battle.json_state = battle_info.as_dict()
+            # The best of several rounds, the commits of the database make single rounds noisy
+            with_checkpoint = min(timeit.repeat(
+                lambda: battle.save(update_fields=['whose_move', 'who_win', 'json_state']), number=options['number']
+            )) / options['number']
+            without_checkpoint = min(timeit.repeat(
+                lambda: battle.save(update_fields=['whose_move', 'who_win']), number=options['number']
+            )) / options['number']
+        finally:
+            battle.delete()
+
+        games = [count_transitions(rng) for _ in range(options['games'])]
+        shots_per_game = sum(shots for shots, _ in games) / len(games)
+        transitions_per_game = sum(transitions for _, transitions in games) / len(games)
+        overhead = serialization + with_checkpoint - without_checkpoint
+        self.stdout.write(f'checkpoint: {len(json.dumps(battle.json_state))} bytes, '
+                          f'serialization {serialization * 1e6:.1f} us')
+        self.stdout.write(f'transition UPDATE: {with_checkpoint * 1e3:.3f} ms with the checkpoint, '
+                          f'{without_checkpoint * 1e3:.3f} ms without it')
+        self.stdout.write(f'per game: {shots_per_game:.1f} shots, {transitions_per_game:.1f} transitions, '
+                          f'checkpoints cost {overhead * transitions_per_game * 1e3:.2f} ms, '
+                          f'a checkpoint per shot would cost {overhead * shots_per_game * 1e3:.2f} ms')
+
+    def benchmark_simulator(self, options: dict[str, Any]) -> None:
+        """
+        The method that reports random games per second of 'simulation.play_random_games'
+
+        The baseline is the same random play of the smallest number of games through 'battle_state.apply_shot'.
+        Legal fleets are drawn slowly, so larger batches repeat the fleets of the smallest one with other shots.
+        Numpy is imported here, the web application doesn't need it
+        """
+
+        from sea_battle_app.simulation import play_random_games
+
+        rng = random.Random(options['seed'])
+        fleets = generate_many_fleet_masks(min(options['games']), options['seed'])
+        started_at = time.perf_counter()
+        for ships in fleets:
+            player_info, shots = PlayerInfo(Bitboard(ships=list(ships))), [[x, y] for x in range(10) for y in range(10)]
+            rng.shuffle(shots)
+            while player_info.board.ships:
+                apply_shot(shots.pop(), player_info)
+        duration = time.perf_counter() - started_at
+
+        self.stdout.write(f'{"engine":<14}{"games":>8}{"duration, s":>14}{"games/s":>12}')
+        self.stdout.write(f'{"battle logic":<14}{len(fleets):>8}{duration:>14.2f}{len(fleets) / duration:>12.0f}')
+        for games_count in options['games']:
+            batch = [fleets[game % len(fleets)] for game in range(games_count)]
+            started_at = time.perf_counter()
+            play_random_games(batch, options['seed'])
+            duration = time.perf_counter() - started_at
+            self.stdout.write(f'{"numpy":<14}{games_count:>8}{duration:>14.2f}{games_count / duration:>12.0f}')
+
+    def benchmark_fleets(self, options: dict[str, Any]) -> None:
+        """The method that reports fleets per second generated as masks and as coordinates and validated"""
+
+        fleets_count, seed = options['fleets'], options['seed']
+        ships_coords = generate_many_ships_coords(fleets_count, seed)
+        self.stdout.write(f'{"operation":<24}{"duration, s":>14}{"fleets/s":>12}')
+        for operation, function in (('masks', lambda: generate_many_fleet_masks(fleets_count, seed)),
+                                    ('coordinates', lambda: generate_many_ships_coords(fleets_count, seed)),
+                                    ('validation', lambda: validate_many_ships_coords(ships_coords))):
+            duration = timeit.timeit(function, number=1)
+            self.stdout.write(f'{operation:<24}{duration:>14.2f}{fleets_count / duration:>12.0f}')
+
+    def benchmark_shards(self, options: dict[str, Any]) -> None:
+        """
+        The method that plays the same number of bot battles over every number of shards
+
+        It reports battles and channel layer messages per second. In-memory shards share one event loop,
+        so they show the routing overhead only, the throughput of the instances is measured with '--redis'
+        """
+
+        self.stdout.write(f'{"shards":>8}{"battles/s":>12}{"messages":>10}{"messages/s":>12}')
+        for shards_count in options['shards']:
+            shard_settings = get_shard_settings(shards_count, options['redis'])
+            with override_settings(**shard_settings):
+                get_battle_state_store.cache_clear()
+                counter = [0]
+                for alias in shard_settings['BATTLE_CHANNEL_LAYERS']:
+                    count_layer_messages(alias, counter)
+                started_at = time.perf_counter()
+                asyncio.run(self.play_bot_battles(options['battles']))
+                duration = time.perf_counter() - started_at
+            get_battle_state_store.cache_clear()
+            self.stdout.write(f'{shards_count:>8}{options["battles"] / duration:>12.1f}{counter[0]:>10}'
+                              f'{counter[0] / duration:>12.0f}')
@@ -0,0 +1,226 @@
+import asyncio
+import json
+import random
+import time
+from collections import Counter, defaultdict
+from typing import Any, Optional
+
+import websockets
+from django.core.management.base import BaseCommand, CommandParser
+
+from sea_battle_app.battle_logic import FIELD_SIZE, generate_fleet_masks, mask_to_coords
+
+
+class LoadTestStats:
+    """The latencies of requests by type, received messages and errors of all players"""
+
+    def __init__(self) -> None:
+        self.latencies: defaultdict[str, list[float]] = defaultdict(list)
+        self.errors: Counter[str] = Counter()
+        self.received_messages = 0
+        self.finished_players = 0
+        self.flood_frames = 0
+        self.closed_flooders = 0
+
+    def record(self, request_type: str, sent_at: float) -> None:
+        self.latencies[request_type].append(time.perf_counter() - sent_at)
+
+
+class Player:
+    """
+    The websocket client that finds the opponent and plays one battle following 'documentation.yaml'
+
+    It places a random fleet, shoots at random unmarked cells and surrenders after
+    'surrender_after' moves if it is set. A rejected shot is repeated, after 'RETRY_DELAY' seconds
+    if it was over the rate limit. Latency of a request is the time until its first response
+    """
+
+    RETRY_DELAY = 0.5
+
+    def __init__(self, url: str, stats: LoadTestStats, rng: random.Random, surrender_after: Optional[int],
+                 timeout: float) -> None:
+        self.url = url
+        self.stats = stats
+        self.rng = rng
+        self.surrender_after = surrender_after
+        self.timeout = timeout
+        self.sent_at: dict[str, float] = {}
+        self.unknown_cells = {(x, y) for x in range(FIELD_SIZE) for y in range(FIELD_SIZE)}
+        self.moves = 0
+
+    async def play(self) -> None:
+        try:
+            sent_at = time.perf_counter()
+            async with websockets.connect(f'{self.url}/ws/search-battle/') as websocket:
+                address = (await self.receive(websocket))['ws_address']
+            self.stats.record('battle found', sent_at)
+
+            sent_at = time.perf_counter()
+            async with websockets.connect(f'{self.url}/ws/battle/{address}/?fields=delta') as websocket:
+                self.stats.record('connect', sent_at)
+                await self.play_battle(websocket)
+            self.stats.finished_players += 1
+        except asyncio.TimeoutError:
+            self.stats.errors['timeout'] += 1
+        except (OSError, websockets.WebSocketException) as e:
+            self.stats.errors[type(e).__name__] += 1
+
+    async def play_battle(self, websocket: Any) -> None:
+        while True:
+            match await self.receive(websocket):
+                case {'type': 'state', 'body': 'preparation'}:
+                    ships = [mask_to_coords(ship) for ship in generate_fleet_masks(self.rng)]
+                    await self.request(websocket, 'load ships coordinates', ships)
+                case {'type': 'success'}:
+                    self.respond('load ships coordinates')
+                case {'type': 'changed opponent field', 'body': body}:
+                    self.respond('take a shot')
+                    self.unknown_cells.difference_update((x, y) for x, y, _ in body['cells'])
+                case {'type': 'battle logic', 'body': 'your move'}:
+                    await self.move(websocket)
+                case {'content': {'type': 'end game'}}:
+                    self.respond('surrender')
+                case {'type': 'error', 'body': body}:
+                    self.stats.errors[body] += 1
+                    if self.sent_at.pop('take a shot', None) is not None:
+                        if body == 'too many requests':
+                            await asyncio.sleep(self.RETRY_DELAY)
+                        await self.move(websocket)
+                case {'type': 'info after end'}:
+                    return
+                case {'type': 'info', 'body': 'opponent disconnected'}:
+                    self.stats.errors['opponent disconnected'] += 1
+                    return
+
+    async def move(self, websocket: Any) -> None:
+        self.moves += 1
+        if self.surrender_after is not None and self.moves > self.surrender_after:
+            await self.request(websocket, 'surrender', None)
+        else:
+            await self.request(websocket, 'take a shot', list(self.rng.choice(tuple(self.unknown_cells))))
+
+    async def request(self, websocket: Any, request_type: str, body: Any) -> None:
+        self.sent_at[request_type] = time.perf_counter()
+        await websocket.send(json.dumps({'type': request_type, 'body': body}))
+
+    def respond(self, request_type: str) -> None:
+        sent_at = self.sent_at.pop(request_type, None)
+        if sent_at is not None:
+            self.stats.record(request_type, sent_at)
+
+    async def receive(self, websocket: Any) -> Any:
+        content = json.loads(await asyncio.wait_for(websocket.recv(), self.timeout))
+        self.stats.received_messages += 1
+        return content
+
+
+class Flooder:
+    """
+    The websocket client that floods its battle with the server-side bot by malformed
+    and out of turn requests until the players finish or the server closes the connection
+    """
+
+    frames = ('{"type": "take a shot", "body": [0, 0]}', '{"body": null}', '[]')
+
+    def __init__(self, url: str, stats: LoadTestStats, timeout: float) -> None:
+        self.url = url
+        self.stats = stats
+        self.timeout = timeout
+
+    async def flood(self, stop: asyncio.Event) -> None:
+        try:
+            async with websockets.connect(f'{self.url}/ws/search-battle/?opponent=bot') as websocket:
+                address = json.loads(await asyncio.wait_for(websocket.recv(), self.timeout))['ws_address']
+
+            async with websockets.connect(f'{self.url}/ws/battle/{address}/') as websocket:
+                reading_task = asyncio.create_task(self.skip_messages(websocket))
+                try:
+                    while not stop.is_set():
+                        await websocket.send(self.frames[self.stats.flood_frames % len(self.frames)])
+                        self.stats.flood_frames += 1
+                        await asyncio.sleep(0)
+                finally:
+                    reading_task.cancel()
+        except websockets.ConnectionClosed:
+            self.stats.closed_flooders += 1
+        except asyncio.TimeoutError:
+            self.stats.errors['flooder timeout'] += 1
+        except (OSError, websockets.WebSocketException) as e:
+            self.stats.errors[f'flooder {type(e).__name__}'] += 1
+
+    @staticmethod
+    async def skip_messages(websocket: Any) -> None:
+        async for _ in websocket:
+            pass
+
+
+def get_percentile(sorted_values: list[float], percent: int) -> float:
+    return sorted_values[min(len(sorted_values) - 1, len(sorted_values) * percent // 100)]
+
+
+class Command(BaseCommand):
+    help = 'Plays full battles over websockets and reports latency, throughput and errors. Run the server ' \
+           'with DJANGO_SETTINGS_MODULE=sea_battle.loadtest_settings to test it without Redis and Postgres'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--url', default='ws://127.0.0.1:8000')
+        parser.add_argument('--players', type=int, default=200, help='the number of players, it must be even')
+        parser.add_argument('--concurrency', type=int, default=100,
+                            help='the number of players that play simultaneously, it must be even')
+        parser.add_argument('--surrender-rate', type=float, default=0.1,
+                            help='the share of players who surrender after a random number of moves')
+        parser.add_argument('--timeout', type=float, default=30, help='the maximum time to wait for a message')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--flooders', type=int, default=0,
+                            help='the number of abusive clients that flood their battles while the players play')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        stats = LoadTestStats()
+        started_at = time.perf_counter()
+        asyncio.run(self.run_players(stats, options))
+        self.report(stats, time.perf_counter() - started_at, options)
+
+    @staticmethod
+    async def run_players(stats: LoadTestStats, options: dict[str, Any]) -> None:
+        rng = random.Random(options['seed'])
+        semaphore = asyncio.Semaphore(options['concurrency'])
+
+        async def play(player: Player) -> None:
+            async with semaphore:
+                await player.play()
+
+        players = []
+        for _ in range(options['players']):
+            surrender_after = rng.randint(1, 30) if rng.random() < options['surrender_rate'] else None
+            players.append(Player(options['url'], stats, random.Random(rng.random()), surrender_after,
+                                  options['timeout']))
+
+        stop_flooding = asyncio.Event()
+        flooding = asyncio.gather(*(Flooder(options['url'], stats, options['timeout']).flood(stop_flooding)
+                                    for _ in range(options['flooders'])))
+        await asyncio.gather(*(play(player) for player in players))
+        stop_flooding.set()
+        await flooding
+
+    def report(self, stats: LoadTestStats, duration: float, options: dict[str, Any]) -> None:
+        self.stdout.write(f'{"request type":<25}{"count":>8}{"p50, ms":>10}{"p95, ms":>10}{"p99, ms":>10}')
+        for request_type, latencies in stats.latencies.items():
+            latencies = sorted(latencies)
+            percentiles = ''.join(f'{get_percentile(latencies, percent) * 1000:>10.1f}' for percent in (50, 95, 99))
+            self.stdout.write(f'{request_type:<25}{len(latencies):>8}{percentiles}')
+
+        requests_count = sum(map(len, stats.latencies.values()))
+        self.stdout.write(f'\nduration: {duration:.1f} s, finished battles: {stats.finished_players // 2}, '
+                          f'{stats.finished_players / 2 / duration:.1f} battles/s, '
+                          f'{requests_count / duration:.1f} requests/s, '
+                          f'{stats.received_messages / duration:.1f} received messages/s')
+
+        if options['flooders']:
+            self.stdout.write(f'flood: {stats.flood_frames / duration:.1f} frames/s, '
+                              f'flooders closed by the server: {stats.closed_flooders} of {options["flooders"]}')
+
+        errors_count = sum(stats.errors.values())
+        self.stdout.write(f'errors: {errors_count}, {errors_count / max(requests_count, 1) * 100:.2f}% of requests, '
+                          f'failed players: {options["players"] - stats.finished_players}')
+        for error, count in stats.errors.most_common():
+            self.stdout.write(f'    {error}: {count}')
@@ -0,0 +1,16 @@
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandParser
+
+from sea_battle_app.leaderboard import rebuild_ranking
+
+
+class Command(BaseCommand):
+    help = 'Fills the leaderboard ranking from the stats of all users, e.g. after its Redis data is lost. ' \
+           'Results written while it runs may be ranked by their old rating until the next result of the user'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--batch-size', type=int, default=1000, help='users read by one query')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        self.stdout.write(f'ranked players: {rebuild_ranking(options["batch_size"])}')
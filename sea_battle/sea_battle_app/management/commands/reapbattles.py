@@ -0,0 +1,29 @@
+import asyncio
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandParser
+
+from sea_battle_app.reaper import reap_battles
+
+
+class Command(BaseCommand):
+    help = 'Deletes battles that nobody has joined, finished and abandoned battles by the "REAPER" setting and ' \
+           'releases their state in the store. The in-memory store of server processes is released by ' \
+           'their own reaping task, see "REAPER["INTERVAL"]"'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--interval', type=float, default=0,
+                            help='repeat every INTERVAL seconds instead of reaping once')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        asyncio.run(self.reap(options['interval']))
+
+    async def reap(self, interval: float) -> None:
+        """The method that reaps in one event loop, so the Redis clients of the stores stay bound to it"""
+
+        while True:
+            reaped = await reap_battles()
+            self.stdout.write(f'reaped battles: {reaped}')
+            if not interval:
+                return
+            await asyncio.sleep(interval)
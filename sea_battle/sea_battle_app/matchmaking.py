@@ -0,0 +1,223 @@
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from functools import lru_cache
+from typing import Optional
+
+import redis.asyncio as redis
+from channels.db import database_sync_to_async
+from channels.layers import BaseChannelLayer
+from django.conf import settings
+
+from sea_battle_app.metrics import matchmaking_wait
+from sea_battle_app.models import Battle
+from sea_battle_app.utils import create_backend
+
+QueueEntry = str
+
+
+class BaseMatchmakingQueue(ABC):
+    """
+    The queue of players who search the opponent
+
+    Entries are '<channel name> <joining timestamp>' strings. Pairs are popped atomically,
+    so every player gets into exactly one pair and every pair gets exactly one battle
+    """
+
+    @abstractmethod
+    async def push(self, channel_name: str) -> QueueEntry:
+        pass
+
+    @abstractmethod
+    async def remove(self, entry: QueueEntry) -> None:
+        pass
+
+    @abstractmethod
+    async def pop_pairs(self, max_pairs: int) -> list[tuple[QueueEntry, QueueEntry]]:
+        pass
+
+    @abstractmethod
+    async def get_depth(self) -> int:
+        pass
+
+    @abstractmethod
+    async def record_waits(self, waits: list[float]) -> None:
+        pass
+
+    @abstractmethod
+    async def get_stats(self) -> dict[str, float]:
+        """The method that returns queue depth and wait time metrics"""
+
+    @staticmethod
+    def create_entry(channel_name: str) -> QueueEntry:
+        return f'{channel_name} {time.time()}'
+
+    @staticmethod
+    def parse_entry(entry: QueueEntry) -> tuple[str, float]:
+        channel_name, joined_at = entry.rsplit(' ', 1)
+        return channel_name, float(joined_at)
+
+
+class InMemoryMatchmakingQueue(BaseMatchmakingQueue):
+    """The process-local queue. It is suitable for development and tests only"""
+
+    def __init__(self) -> None:
+        self.entries: deque[QueueEntry] = deque()
+        self.paired_players = 0
+        self.total_wait = 0.0
+
+    async def push(self, channel_name: str) -> QueueEntry:
+        entry = self.create_entry(channel_name)
+        self.entries.append(entry)
+        return entry
+
+    async def remove(self, entry: QueueEntry) -> None:
+        if entry in self.entries:
+            self.entries.remove(entry)
+
+    async def pop_pairs(self, max_pairs: int) -> list[tuple[QueueEntry, QueueEntry]]:
+        pairs: list[tuple[QueueEntry, QueueEntry]] = []
+        while len(pairs) < max_pairs and len(self.entries) >= 2:
+            pairs.append((self.entries.popleft(), self.entries.popleft()))
+        return pairs
+
+    async def get_depth(self) -> int:
+        return len(self.entries)
+
+    async def record_waits(self, waits: list[float]) -> None:
+        self.paired_players += len(waits)
+        self.total_wait += sum(waits)
+
+    async def get_stats(self) -> dict[str, float]:
+        return {'depth': len(self.entries), 'paired players': self.paired_players,
+                'average wait': self.total_wait / self.paired_players if self.paired_players else 0.0}
+
+
+class RedisMatchmakingQueue(BaseMatchmakingQueue):
+    """The queue that is kept in a Redis list. Pairs are popped by a Lua script"""
+
+    pop_script = '''
+        local available = redis.call('LLEN', KEYS[1])
+        local count = math.min(tonumber(ARGV[1]) * 2, available - available % 2)
+        if count == 0 then
+            return {}
+        end
+        local entries = redis.call('LRANGE', KEYS[1], 0, count - 1)
+        redis.call('LTRIM', KEYS[1], count, -1)
+        return entries
+    '''
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 6379, db: int = 0, prefix: str = 'matchmaking:') -> None:
+        self.redis = redis.Redis(host=host, port=port, db=db, decode_responses=True)
+        self.queue_key = f'{prefix}queue'
+        self.stats_key = f'{prefix}stats'
+        self.pop = self.redis.register_script(self.pop_script)
+
+    async def push(self, channel_name: str) -> QueueEntry:
+        entry = self.create_entry(channel_name)
+        await self.redis.rpush(self.queue_key, entry)
+        return entry
+
+    async def remove(self, entry: QueueEntry) -> None:
+        await self.redis.lrem(self.queue_key, 1, entry)
+
+    async def pop_pairs(self, max_pairs: int) -> list[tuple[QueueEntry, QueueEntry]]:
+        entries = await self.pop(keys=[self.queue_key], args=[max_pairs])
+        return list(zip(entries[::2], entries[1::2]))
+
+    async def get_depth(self) -> int:
+        return await self.redis.llen(self.queue_key)
+
+    async def record_waits(self, waits: list[float]) -> None:
+        async with self.redis.pipeline() as pipe:
+            pipe.hincrby(self.stats_key, 'paired players', len(waits))
+            pipe.hincrbyfloat(self.stats_key, 'total wait', sum(waits))
+            await pipe.execute()
+
+    async def get_stats(self) -> dict[str, float]:
+        async with self.redis.pipeline() as pipe:
+            pipe.llen(self.queue_key)
+            pipe.hmget(self.stats_key, ['paired players', 'total wait'])
+            depth, (paired_players, total_wait) = await pipe.execute()
+        paired_players, total_wait = int(paired_players or 0), float(total_wait or 0)
+        return {'depth': depth, 'paired players': paired_players,
+                'average wait': total_wait / paired_players if paired_players else 0.0}
+
+
+@lru_cache(maxsize=None)
+def get_matchmaking_queue() -> BaseMatchmakingQueue:
+    """The function that returns the queue configured by the 'MATCHMAKING' setting"""
+
+    return create_backend(settings.MATCHMAKING)
+
+
+async def pair_players(queue: BaseMatchmakingQueue, channel_layer: BaseChannelLayer) -> None:
+    """The function that creates a battle for every popped pair and sends its address to both players"""
+
+    pairs = await queue.pop_pairs(settings.MATCHMAKING.get('MAX_PAIRS_PER_BATCH', 100))
+    if not pairs:
+        return
+
+    now = time.time()
+    waits = [now - queue.parse_entry(entry)[1] for pair in pairs for entry in pair]
+    await queue.record_waits(waits)
+    if settings.METRICS['ENABLED']:
+        for wait in waits:
+            matchmaking_wait.observe(wait)
+
+    if settings.MATCHMAKING.get('PREFER_COLOCATED'):
+        pairs = colocate_pairs(queue, pairs)
+
+    battles = await database_sync_to_async(Battle.objects.create_many)(len(pairs))
+    for pair, battle in zip(pairs, battles):
+        for entry in pair:
+            channel_name, _ = queue.parse_entry(entry)
+            await channel_layer.send(channel_name, {'type': 'send_json', 'content': {'ws_address': battle.address}})
+
+
+def get_process_key(channel_name: str) -> str:
+    """The function that returns the part of the channel name that is the same for all channels of a process"""
+
+    return channel_name.split('!', 1)[0]
+
+
+def colocate_pairs(queue: BaseMatchmakingQueue,
+                   pairs: list[tuple[QueueEntry, QueueEntry]]) -> list[tuple[QueueEntry, QueueEntry]]:
+    """
+    The function that re-pairs the popped players, so players searching in the same process are paired together
+
+    The rest are paired by joining time. If the load balancer sticks clients to processes, both players
+    of such a pair connect to the battle in the same process and their consumers talk without the channel layer.
+    The more players are popped at once, the more pairs are co-located, so it works best with 'PAIRING_INTERVAL'
+    """
+
+    entries_by_process: dict[str, list[QueueEntry]] = {}
+    for entry in sorted((entry for pair in pairs for entry in pair), key=lambda entry: queue.parse_entry(entry)[1]):
+        entries_by_process.setdefault(get_process_key(queue.parse_entry(entry)[0]), []).append(entry)
+
+    colocated_pairs: list[tuple[QueueEntry, QueueEntry]] = []
+    rest: list[QueueEntry] = []
+    for entries in entries_by_process.values():
+        colocated_pairs.extend(zip(entries[::2], entries[1::2]))
+        if len(entries) % 2:
+            rest.append(entries[-1])
+    rest.sort(key=lambda entry: queue.parse_entry(entry)[1])
+    return colocated_pairs + list(zip(rest[::2], rest[1::2]))
+
+
+_pairing_task: Optional[asyncio.Task] = None
+
+
+def start_pairing(queue: BaseMatchmakingQueue, channel_layer: BaseChannelLayer) -> None:
+    """The function that starts the process-wide task pairing players every 'PAIRING_INTERVAL' seconds"""
+
+    global _pairing_task
+    if _pairing_task is None or _pairing_task.done():
+        _pairing_task = asyncio.create_task(_pair_players_periodically(queue, channel_layer))
+
+
+async def _pair_players_periodically(queue: BaseMatchmakingQueue, channel_layer: BaseChannelLayer) -> None:
+    while True:
+        await asyncio.sleep(settings.MATCHMAKING['PAIRING_INTERVAL'])
+        await pair_players(queue, channel_layer)
@@ -0,0 +1,194 @@
+import random
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models import Count, Q
+from django.dispatch import receiver
+
+from sea_battle_app.models import Battle
+
+LabelValues = tuple[str, ...]
+
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+QUERIES_BUCKETS = (0, 1, 2, 3, 5, 10, 20)
+
+WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Metric:
+    """The base of the process-local metrics that are exported in the Prometheus text format"""
+
+    type = ''
+
+    def __init__(self, name: str, documentation: str, labels: LabelValues = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        REGISTRY.append(self)
+
+    def format_labels(self, label_values: LabelValues, **extra_labels: str) -> str:
+        pairs = [*zip(self.labels, label_values), *extra_labels.items()]
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{label}="{value}"' for label, value in pairs) + '}'
+
+    def collect(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} {self.type}'
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: LabelValues = ()) -> None:
+        super().__init__(name, documentation, labels)
+        self.values: dict[LabelValues, float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def collect(self) -> Iterator[str]:
+        yield from super().collect()
+        for label_values, value in self.values.items():
+            yield f'{self.name}{self.format_labels(label_values)} {value}'
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: LabelValues = (),
+                 buckets: tuple[float, ...] = DURATION_BUCKETS) -> None:
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+        self.values: dict[LabelValues, list[float]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        """The method that counts the value in its bucket only. Buckets are accumulated on collection"""
+
+        if label_values not in self.values:
+            self.values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts = self.values[label_values]
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def collect(self) -> Iterator[str]:
+        yield from super().collect()
+        for label_values, counts in self.values.items():
+            total = 0
+            for bucket, count in zip((*self.buckets, '+Inf'), counts):
+                total += int(count)
+                yield f'{self.name}_bucket{self.format_labels(label_values, le=str(bucket))} {total}'
+            yield f'{self.name}_sum{self.format_labels(label_values)} {counts[-1]}'
+            yield f'{self.name}_count{self.format_labels(label_values)} {total}'
+
+
+class Gauge(Metric):
+    """The metric that is computed by the function on collection"""
+
+    type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labels: LabelValues,
+                 get_values: Callable[[], dict[LabelValues, float]]) -> None:
+        super().__init__(name, documentation, labels)
+        self.get_values = get_values
+
+    def collect(self) -> Iterator[str]:
+        yield from super().collect()
+        for label_values, value in self.get_values().items():
+            yield f'{self.name}{self.format_labels(label_values)} {value}'
+
+
+REGISTRY: list[Metric] = []
+
+_active_query_counters: ContextVar[tuple[list[int], ...]] = ContextVar('active_query_counters', default=())
+
+
+def count_query(execute: Callable, sql: str, params: Any, many: bool, context: dict) -> Any:
+    """
+    The execute wrapper that counts the query for every measured handler of the current context
+
+    It is a module-level function, not a closure, so 'count_queries' can tell that a connection has it already
+    """
+
+    for query_counter in _active_query_counters.get():
+        query_counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+@receiver(connection_created)
+def count_queries(connection: Any, **kwargs: Any) -> None:
+    """
+    The receiver that makes every new connection count its queries for the measured handlers
+
+    The signal is sent again when the same connection object reconnects, so the wrapper is added once
+    """
+
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+class HandlerMetrics:
+    """
+    The calls counter with the time and database queries histograms of handlers
+
+    Every call is counted. The time and the queries are measured only for the calls sampled
+    by 'METRICS["SAMPLE_RATE"]'. Queries of 'database_sync_to_async' calls are counted
+    as well, because the context is copied to their thread
+    """
+
+    def __init__(self, name: str, documentation: str, labels: LabelValues) -> None:
+        self.calls = Counter(f'{name}_total', documentation, labels)
+        self.duration = Histogram(f'{name}_duration_seconds', f'Handling time of sampled {documentation.lower()}',
+                                  labels)
+        self.queries = Histogram(f'{name}_db_queries', f'Database queries per sampled {documentation.lower()}',
+                                 labels, QUERIES_BUCKETS)
+
+    @contextmanager
+    def measure(self, *label_values: str) -> Iterator[None]:
+        if not settings.METRICS['ENABLED']:
+            yield
+            return
+
+        self.calls.inc(*label_values)
+        if random.random() >= settings.METRICS['SAMPLE_RATE']:
+            yield
+            return
+
+        query_counter = [0]
+        token = _active_query_counters.set((*_active_query_counters.get(), query_counter))
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.duration.observe(time.perf_counter() - started_at, *label_values)
+            self.queries.observe(query_counter[0], *label_values)
+            _active_query_counters.reset(token)
+
+
+def get_battles_by_state() -> dict[LabelValues, float]:
+    counts = Battle.objects.aggregate(**{
+        Battle.State.preparation.name: Count('pk', filter=Q(who_win__isnull=True, whose_move__isnull=True)),
+        Battle.State.progress.name: Count('pk', filter=Q(who_win__isnull=True, whose_move__isnull=False)),
+        Battle.State.is_over.name: Count('pk', filter=Q(who_win__isnull=False)),
+    })
+    return {(state,): count for state, count in counts.items()}
+
+
+event_metrics = HandlerMetrics('sea_battle_events', 'Websocket events and channel layer messages',
+                               ('consumer', 'event'))
+request_metrics = HandlerMetrics('sea_battle_requests', 'Client requests', ('type',))
+matchmaking_wait = Histogram('sea_battle_matchmaking_wait_seconds', 'Time from joining the queue to getting a pair',
+                             buckets=WAIT_BUCKETS)
+opponent_messages = Counter('sea_battle_opponent_messages_total',
+                            'Messages to the opponent\'s consumer by the way of delivery', ('route',))
+battles = Gauge('sea_battle_battles', 'Battles in the database by state', ('state',), get_battles_by_state)
+
+
+def collect_metrics() -> str:
+    return '\n'.join(line for metric in REGISTRY for line in metric.collect()) + '\n'
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.4 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sea_battle_app', '0005_alter_battle_who_win_alter_battle_whose_move'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='player',
+            name='token',
+            field=models.CharField(max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='player',
+            name='disconnected_at',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.1.4 on 2026-10-18 06:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sea_battle_app', '0006_player_token_player_disconnected_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Move',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('address', models.CharField(max_length=127)),
+                ('sequence', models.PositiveSmallIntegerField()),
+                ('shooter', models.IntegerField(choices=[(1, 1), (2, 2)])),
+                ('cell', models.PositiveSmallIntegerField()),
+                ('result', models.IntegerField(choices=[(0, 'missed'), (1, 'hit'), (2, 'destroyed')])),
+            ],
+            options={
+                'unique_together': {('address', 'shooter', 'sequence')},
+            },
+        ),
+        migrations.CreateModel(
+            name='Fleet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('address', models.CharField(max_length=127)),
+                ('player', models.IntegerField(choices=[(1, 1), (2, 2)])),
+                ('ships', models.JSONField()),
+            ],
+            options={
+                'unique_together': {('address', 'player')},
+            },
+        ),
+    ]
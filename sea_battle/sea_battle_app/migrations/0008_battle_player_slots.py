@@ -0,0 +1,43 @@
+# Generated by Django 4.1.4 on 2026-10-18 06:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sea_battle_app', '0007_fleet_move'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='battle',
+            name='first_channel_name',
+            field=models.CharField(max_length=127, null=True),
+        ),
+        migrations.AddField(
+            model_name='battle',
+            name='first_disconnected_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='battle',
+            name='first_token',
+            field=models.CharField(max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='battle',
+            name='second_channel_name',
+            field=models.CharField(max_length=127, null=True),
+        ),
+        migrations.AddField(
+            model_name='battle',
+            name='second_disconnected_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='battle',
+            name='second_token',
+            field=models.CharField(max_length=32, null=True),
+        ),
+    ]
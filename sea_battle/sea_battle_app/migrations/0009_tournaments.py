@@ -0,0 +1,35 @@
+# Generated by Django 4.1.4 on 2026-10-18 06:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sea_battle_app', '0008_battle_player_slots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tournament',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('datetime', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TournamentMatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('round', models.PositiveSmallIntegerField()),
+                ('position', models.PositiveIntegerField()),
+                ('battle_address', models.CharField(db_index=True, max_length=127, null=True)),
+                ('who_win', models.IntegerField(choices=[(1, 1), (2, 2)], null=True)),
+                ('tournament', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='matches', to='sea_battle_app.tournament')),
+            ],
+            options={
+                'unique_together': {('tournament', 'round', 'position')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.1.4 on 2026-10-18 06:51
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('sea_battle_app', '0009_tournaments'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayerStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('wins', models.PositiveIntegerField(default=0)),
+                ('losses', models.PositiveIntegerField(default=0)),
+                ('rating', models.IntegerField(default=1000)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='playerstats',
+            index=models.Index(fields=['-rating', 'user'], name='player_stats_rating_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.1.4 on 2026-10-18 06:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sea_battle_app', '0010_player_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='battle',
+            index=models.Index(fields=['datetime'], name='battle_datetime_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='battle',
+            index=models.Index(condition=models.Q(('who_win__isnull', False)), fields=['datetime'], name='battle_finished_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='battle',
+            index=models.Index(condition=models.Q(('first_player__isnull', True), ('first_token__isnull', True), ('second_player__isnull', True), ('second_token__isnull', True)), fields=['datetime'], name='battle_unjoined_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='battle',
+            index=models.Index(fields=['who_win', 'whose_move'], name='battle_state_idx'),
+        ),
+    ]
@@ -1,6 +1,8 @@
+from datetime import datetime
 from enum import Enum
-from typing import Any
+from typing import Any, NamedTuple, Optional, Union
 
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.db import models, IntegrityError
 
@@ -12,6 +14,16 @@ class Player(models.Model):
 
     user = models.OneToOneField(User, on_delete=models.SET_NULL, null=True)
     channel_name = models.CharField(max_length=127, null=True)
+    token = models.CharField(max_length=32, null=True)
+    disconnected_at = models.DateTimeField(null=True)
+
+
+class PlayerSlot(NamedTuple):
+    """The player kept on the battle row"""
+
+    channel_name: Optional[str]
+    token: str
+    disconnected_at: Optional[datetime]
 
 
 class BattleInfoManager(models.Manager):
@@ -24,6 +36,12 @@ class BattleInfoManager(models.Manager):
         except IntegrityError:
             return self.create(**kwargs)
 
+    def create_many(self, count: int, batch_size: Optional[int] = None, **kwargs: Any) -> list['Battle']:
+        """The method that creates battles by one query or by a query per 'batch_size' battles"""
+
+        return self.bulk_create([self.model(address=create_battle_address(), **kwargs) for _ in range(count)],
+                                batch_size=batch_size)
+
 
 class Battle(models.Model):
     """
@@ -33,6 +51,9 @@ class Battle(models.Model):
     1) if who_win is null and whose_move is null then battle is preparing (players set ships)
     2) if who_win is null but whose_move is not null then game in progress
     3) if who_win is not null and whose_move is null then game is finished
+
+    Players are kept either in 'first_player' and 'second_player' or in the slot fields of the row itself,
+    see 'PLAYER_SLOTS'. 'get_player' returns the player whichever way is used
     """
 
     player_choices = ((1, 1), (2, 2))
@@ -44,9 +65,28 @@ class Battle(models.Model):
     who_win = models.IntegerField(choices=player_choices, null=True)
     whose_move = models.IntegerField(choices=player_choices, null=True)
     datetime = models.DateTimeField(auto_now_add=True)
+    first_channel_name = models.CharField(max_length=127, null=True)
+    first_token = models.CharField(max_length=32, null=True)
+    first_disconnected_at = models.DateTimeField(null=True)
+    second_channel_name = models.CharField(max_length=127, null=True)
+    second_token = models.CharField(max_length=32, null=True)
+    second_disconnected_at = models.DateTimeField(null=True)
 
     objects = BattleInfoManager()
 
+    class Meta:
+        # 'address' and the player foreign keys are indexed by their fields. The partial indexes
+        # keep only the battles that 'reaper.get_stale_battles_filter' looks for, the state index
+        # counts the battles by state for the metrics
+        indexes = [
+            models.Index(fields=['datetime'], name='battle_datetime_idx'),
+            models.Index(fields=['datetime'], condition=models.Q(who_win__isnull=False), name='battle_finished_idx'),
+            models.Index(fields=['datetime'], name='battle_unjoined_idx',
+                         condition=models.Q(first_player__isnull=True, second_player__isnull=True,
+                                            first_token__isnull=True, second_token__isnull=True)),
+            models.Index(fields=['who_win', 'whose_move'], name='battle_state_idx'),
+        ]
+
     class State(Enum):
         preparation = 1
         progress = 2
@@ -59,3 +99,101 @@ class Battle(models.Model):
         if self.who_win is None:
             return self.State.progress
         return self.State.is_over
+
+    @property
+    def is_full(self) -> bool:
+        return self.get_player(1) is not None and self.get_player(2) is not None
+
+    def get_player(self, player_number: int) -> Union[Player, PlayerSlot, None]:
+        player = self.first_player if player_number == 1 else self.second_player
+        if player is not None:
+            return player
+
+        prefix = get_slot_prefix(player_number)
+        token = getattr(self, f'{prefix}_token')
+        if token is None:
+            return None
+        return PlayerSlot(getattr(self, f'{prefix}_channel_name'), token, getattr(self, f'{prefix}_disconnected_at'))
+
+
+def get_slot_prefix(player_number: int) -> str:
+    """The function that returns the prefix of the slot fields of the player"""
+
+    return 'first' if player_number == 1 else 'second'
+
+
+class Fleet(models.Model):
+    """
+    The record of the player's ships at the start of the battle
+
+    The move log is kept by the battle address, so it outlives the battle row
+    """
+
+    address = models.CharField(max_length=127)
+    player = models.IntegerField(choices=Battle.player_choices)
+    ships = models.JSONField()
+
+    class Meta:
+        unique_together = ('address', 'player')
+
+
+class Move(models.Model):
+    """
+    The record of the append-only move log
+
+    'sequence' is the number of the shot at the field of the shooter's opponent,
+    'cell' is the bit index of the cell ('x * 10 + y')
+    """
+
+    result_choices = ((0, 'missed'), (1, 'hit'), (2, 'destroyed'))
+
+    address = models.CharField(max_length=127)
+    sequence = models.PositiveSmallIntegerField()
+    shooter = models.IntegerField(choices=Battle.player_choices)
+    cell = models.PositiveSmallIntegerField()
+    result = models.IntegerField(choices=result_choices)
+
+    class Meta:
+        unique_together = ('address', 'shooter', 'sequence')
+
+
+class Tournament(models.Model):
+    """The single-elimination tournament, its bracket is made of 'TournamentMatch' records"""
+
+    datetime = models.DateTimeField(auto_now_add=True)
+
+
+class TournamentMatch(models.Model):
+    """
+    The match of the tournament bracket
+
+    The winner of the match at 'position' plays the next round at 'position // 2'.
+    'who_win' is copied from the battle when the battle ends, because the battle row is deleted
+    after the players leave. A match without a battle is a bye, its only player wins it
+    """
+
+    tournament = models.ForeignKey(Tournament, on_delete=models.CASCADE, related_name='matches')
+    round = models.PositiveSmallIntegerField()
+    position = models.PositiveIntegerField()
+    battle_address = models.CharField(max_length=127, null=True, db_index=True)
+    who_win = models.IntegerField(choices=Battle.player_choices, null=True)
+
+    class Meta:
+        unique_together = ('tournament', 'round', 'position')
+
+
+class PlayerStats(models.Model):
+    """
+    The wins, losses and rating of the user, they are updated by 'leaderboard.StatsWriter'
+
+    The index orders users like the leaderboard, so a page is read from it by keyset.
+    The rank of the user is read from 'leaderboard.BaseRanking'
+    """
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    wins = models.PositiveIntegerField(default=0)
+    losses = models.PositiveIntegerField(default=0)
+    rating = models.IntegerField(default=settings.LEADERBOARD['INITIAL_RATING'])
+
+    class Meta:
+        indexes = [models.Index(fields=['-rating', 'user'], name='player_stats_rating_idx')]
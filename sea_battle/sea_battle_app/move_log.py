@@ -0,0 +1,135 @@
+import logging
+from collections import defaultdict, deque
+from functools import lru_cache
+from typing import Any, Iterable, Iterator, Optional, Union
+
+from django.conf import settings
+from django.db import DatabaseError
+
+from sea_battle_app.battle_logic import BattleInfo, PlayerInfo, Bitboard, BattleLogicException, FIELD_SIZE, \
+    get_cell_index, shot_is_valid, process_shot
+from sea_battle_app.battle_state import ShotResult
+from sea_battle_app.models import Fleet, Move
+from sea_battle_app.utils import BufferedWriter
+
+LogRecord = Union[Fleet, Move]
+
+logger = logging.getLogger(__name__)
+
+
+class MoveLogWriter(BufferedWriter[list[LogRecord]]):
+    """
+    The process-wide buffer of the move log records
+
+    Records are written by 'bulk_create' when the buffer reaches 'batch_size' records
+    or every 'flush_interval' seconds, see 'BufferedWriter'
+    """
+
+    def __init__(self, batch_size: int = 500, flush_interval: float = 1.0) -> None:
+        super().__init__(batch_size, flush_interval)
+
+    def create_buffer(self) -> list[LogRecord]:
+        return []
+
+    def append(self, record: LogRecord) -> None:
+        self.extend([record])
+
+    def extend(self, records: Iterable[LogRecord]) -> None:
+        self.buffer.extend(records)
+        self.schedule_flush()
+
+    def write(self, records: list[LogRecord]) -> None:
+        """
+        The method that writes the records of every model by its own 'bulk_create'
+
+        Records that are already in the log are skipped. The flush runs in a task that nobody awaits,
+        so the error of a model is logged and doesn't prevent the records of the other model from being written
+        """
+
+        records_by_model: defaultdict[type[LogRecord], list[Any]] = defaultdict(list)
+        for record in records:
+            records_by_model[type(record)].append(record)
+        for model, model_records in records_by_model.items():
+            try:
+                model.objects.bulk_create(model_records, ignore_conflicts=True)
+            except DatabaseError:
+                logger.exception('%d records of %s are lost', len(model_records), model.__name__)
+
+
+@lru_cache(maxsize=None)
+def get_move_log_writer() -> MoveLogWriter:
+    """The function that returns the writer configured by the 'MOVE_LOG' setting"""
+
+    return MoveLogWriter(settings.MOVE_LOG['BATCH_SIZE'], settings.MOVE_LOG['FLUSH_INTERVAL'])
+
+
+def get_move_result(cell_index: int, ship_was_hit: bool, player_info: PlayerInfo) -> int:
+    """The function that returns the 'Move.result' of the processed shot at the cell"""
+
+    if not ship_was_hit:
+        return 0
+    cell_mask = 1 << cell_index
+    return 1 if any(ship & cell_mask for ship in player_info.board.ships) else 2
+
+
+def create_fleet_records(address: str, battle_info: BattleInfo) -> list[Fleet]:
+    return [Fleet(address=address, player=player_number, ships=player_info.board.ships)
+            for player_number, player_info in enumerate(battle_info, 1)]
+
+
+def create_move_record(address: str, shooter: int, shot_coordinates: list[int], shot_result: ShotResult) -> Move:
+    cell_index = get_cell_index(*shot_coordinates)
+    return Move(address=address, sequence=shot_result.player_info.board.shots, shooter=shooter, cell=cell_index,
+                result=get_move_result(cell_index, shot_result.ship_was_hit, shot_result.player_info))
+
+
+def iter_battle_states(fleets: tuple[list[int], list[int]], moves: Iterable[Move]) -> Iterator[BattleInfo]:
+    """
+    The function that streams moves through 'process_shot'
+
+    It yields the battle before the first move and after every move. The same object is
+    changed and yielded every time, so copy it to keep an intermediate state.
+    Moves of each shooter must be ordered by sequence, the order between shooters is restored
+    by the rules: the first player starts and the shooter keeps the move after hitting.
+    Raises 'BattleLogicException' if the log contradicts the fleets or the rules
+    """
+
+    battle_info = BattleInfo(PlayerInfo(Bitboard(ships=list(fleets[0]))), PlayerInfo(Bitboard(ships=list(fleets[1]))))
+    moves_by_shooter: dict[int, deque[Move]] = {1: deque(), 2: deque()}
+    for move in moves:
+        moves_by_shooter[move.shooter].append(move)
+
+    yield battle_info
+    shooter = 1
+    while moves_by_shooter[shooter]:
+        move = moves_by_shooter[shooter].popleft()
+        player_info = battle_info[2 - shooter]
+        shot_coordinates = list(divmod(move.cell, FIELD_SIZE))
+        if not shot_is_valid(shot_coordinates, player_info):
+            raise BattleLogicException(f'the move {move.sequence} of the player {shooter} is incorrect')
+
+        ship_was_hit = process_shot(shot_coordinates, player_info)
+        if (player_info.board.shots, get_move_result(move.cell, ship_was_hit, player_info)) != \
+                (move.sequence, move.result):
+            raise BattleLogicException(f'the move {move.sequence} of the player {shooter} contradicts the log')
+        yield battle_info
+
+        if not ship_was_hit:
+            shooter = 3 - shooter
+
+    if moves_by_shooter[3 - shooter]:
+        raise BattleLogicException(f'the player {3 - shooter} has moves out of turn')
+
+
+def replay_battle(address: str, moves_count: Optional[int] = None) -> BattleInfo:
+    """The function that reconstructs the battle after the first 'moves_count' moves (after all by default)"""
+
+    fleets = dict(Fleet.objects.filter(address=address).values_list('player', 'ships'))
+    if len(fleets) != 2:
+        raise Fleet.DoesNotExist(f'the battle {address} has no fleets in the move log')
+
+    moves = Move.objects.filter(address=address).order_by('shooter', 'sequence').iterator()
+    for moves_number, battle_info in enumerate(iter_battle_states((fleets[1], fleets[2]), moves)):
+        if moves_number == moves_count:
+            break
+    return battle_info
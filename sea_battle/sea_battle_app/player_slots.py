@@ -0,0 +1,178 @@
+import secrets
+from abc import ABC, abstractmethod
+from datetime import timedelta
+from functools import lru_cache
+from typing import Any, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from sea_battle_app.models import Battle, Player, PlayerSlot, get_slot_prefix
+from sea_battle_app.utils import create_backend
+
+
+class BasePlayerSlots(ABC):
+    """
+    The way the battle keeps the players who have taken its slots
+
+    Methods query the database synchronously, consumers call them by 'database_sync_to_async'
+    """
+
+    @abstractmethod
+    def get_battle(self, **kwargs: Any) -> Optional[Battle]:
+        """The method that returns the battle with its players"""
+
+    @abstractmethod
+    def take(self, battle: Battle, channel_name: str) -> Optional[tuple[Battle, int]]:
+        """
+        The method that gives a free slot to the player. Players who connect at the same time get different slots
+
+        Returns the refreshed battle and the player number or 'None' if there is no free slot
+        """
+
+    @abstractmethod
+    def reconnect(self, battle: Battle, token: str, channel_name: str) -> Optional[int]:
+        """
+        The method that gives the slot back to the player who has dropped less than
+        'RECONNECTION_GRACE_PERIOD' seconds ago. Returns the player number if the slot was taken
+        """
+
+    @abstractmethod
+    def mark_disconnected(self, battle: Battle, player_number: int) -> None:
+        """The method that keeps the slot for the player whose socket has dropped"""
+
+    @abstractmethod
+    def release(self, battle: Battle, player_number: int) -> Optional[Battle]:
+        """The method that frees the slot. Returns the battle or 'None' if it was deleted with its last player"""
+
+    @staticmethod
+    def get_grace_start() -> Any:
+        return timezone.now() - timedelta(seconds=settings.RECONNECTION_GRACE_PERIOD)
+
+
+class PlayerRowSlots(BasePlayerSlots):
+    """The slots that refer to 'Player' rows. A player row is created on every connection"""
+
+    def get_battle(self, **kwargs: Any) -> Optional[Battle]:
+        return Battle.objects.select_related('first_player', 'second_player').filter(**kwargs).first()
+
+    def take(self, battle: Battle, channel_name: str) -> Optional[tuple[Battle, int]]:
+        with transaction.atomic():
+            locked_battle = Battle.objects.select_for_update(of=('self',)) \
+                .select_related('first_player', 'second_player').filter(pk=battle.pk).first()
+            if locked_battle is None or locked_battle.is_full:
+                return None
+
+            player = Player.objects.create(channel_name=channel_name, token=secrets.token_urlsafe(16))
+            if locked_battle.first_player is None:
+                locked_battle.first_player, player_number = player, 1
+            else:
+                locked_battle.second_player, player_number = player, 2
+
+            locked_battle.save(update_fields=['first_player', 'second_player'])
+        return locked_battle, player_number
+
+    def reconnect(self, battle: Battle, token: str, channel_name: str) -> Optional[int]:
+        for player_number, player in enumerate((battle.first_player, battle.second_player), 1):
+            if player is None or player.token != token:
+                continue
+            if not Player.objects.filter(pk=player.pk, disconnected_at__gt=self.get_grace_start()) \
+                    .update(channel_name=channel_name, disconnected_at=None):
+                return None
+            player.channel_name, player.disconnected_at = channel_name, None
+            return player_number
+        return None
+
+    def mark_disconnected(self, battle: Battle, player_number: int) -> None:
+        player = battle.get_player(player_number)
+        if not isinstance(player, Player):
+            return
+        player.channel_name = None
+        player.disconnected_at = timezone.now()
+        Player.objects.filter(pk=player.pk).update(channel_name=None, disconnected_at=player.disconnected_at)
+
+    def release(self, battle: Battle, player_number: int) -> Optional[Battle]:
+        player = battle.get_player(player_number)
+        if isinstance(player, Player):
+            player.delete()
+        refreshed_battle = self.get_battle(pk=battle.pk)
+        if refreshed_battle is None:
+            return None
+
+        if refreshed_battle.first_player is None and refreshed_battle.second_player is None:
+            refreshed_battle.delete()
+            return None
+        return refreshed_battle
+
+
+class BattleRowSlots(BasePlayerSlots):
+    """
+    The slots that are kept in the fields of the battle row
+
+    A slot is taken, freed or reconnected by one conditional UPDATE, so no player rows are written
+    and two sockets can't take the same slot. The battle is deleted by one more conditional DELETE
+    when its last player leaves
+    """
+
+    def get_battle(self, **kwargs: Any) -> Optional[Battle]:
+        return Battle.objects.filter(**kwargs).first()
+
+    def take(self, battle: Battle, channel_name: str) -> Optional[tuple[Battle, int]]:
+        token = secrets.token_urlsafe(16)
+        free_slots = [player_number for player_number in (1, 2) if battle.get_player(player_number) is None]
+        for player_number in free_slots or (1, 2):
+            prefix = get_slot_prefix(player_number)
+            if Battle.objects.filter(pk=battle.pk, **{f'{prefix}_token__isnull': True}) \
+                    .update(**{f'{prefix}_channel_name': channel_name, f'{prefix}_token': token}):
+                refreshed_battle = self.get_battle(pk=battle.pk)
+                return (refreshed_battle, player_number) if refreshed_battle is not None else None
+        return None
+
+    def reconnect(self, battle: Battle, token: str, channel_name: str) -> Optional[int]:
+        for player_number in (1, 2):
+            player = battle.get_player(player_number)
+            if player is None or player.token != token:
+                continue
+
+            prefix = get_slot_prefix(player_number)
+            if not Battle.objects.filter(pk=battle.pk, **{f'{prefix}_token': token,
+                                                          f'{prefix}_disconnected_at__gt': self.get_grace_start()}) \
+                    .update(**{f'{prefix}_channel_name': channel_name, f'{prefix}_disconnected_at': None}):
+                return None
+            setattr(battle, f'{prefix}_channel_name', channel_name)
+            setattr(battle, f'{prefix}_disconnected_at', None)
+            return player_number
+        return None
+
+    def mark_disconnected(self, battle: Battle, player_number: int) -> None:
+        player = battle.get_player(player_number)
+        if not isinstance(player, PlayerSlot):
+            return
+
+        prefix = get_slot_prefix(player_number)
+        fields = {f'{prefix}_channel_name': None, f'{prefix}_disconnected_at': timezone.now()}
+        Battle.objects.filter(pk=battle.pk, **{f'{prefix}_token': player.token}).update(**fields)
+        for field, value in fields.items():
+            setattr(battle, field, value)
+
+    def release(self, battle: Battle, player_number: int) -> Optional[Battle]:
+        player = battle.get_player(player_number)
+        prefix = get_slot_prefix(player_number)
+        fields = {f'{prefix}_channel_name': None, f'{prefix}_token': None, f'{prefix}_disconnected_at': None}
+        if isinstance(player, PlayerSlot):
+            Battle.objects.filter(pk=battle.pk, **{f'{prefix}_token': player.token}).update(**fields)
+        deleted, _ = Battle.objects.filter(pk=battle.pk, first_token__isnull=True, second_token__isnull=True).delete()
+        if deleted:
+            return None
+
+        for field, value in fields.items():
+            setattr(battle, field, value)
+        return battle
+
+
+@lru_cache(maxsize=None)
+def get_player_slots() -> BasePlayerSlots:
+    """The function that returns the slots configured by the 'PLAYER_SLOTS' setting"""
+
+    return create_backend(settings.PLAYER_SLOTS)
@@ -0,0 +1,115 @@
+import time
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Any, Optional
+
+import redis.asyncio as redis
+from django.conf import settings
+
+from sea_battle_app.utils import create_backend
+
+
+class TokenBucket:
+    """The process-local bucket that allows 'capacity' actions at once and 'rate' actions per second on average"""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def consume(self, cost: float = 1) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens < cost:
+            return False
+        self.tokens -= cost
+        return True
+
+
+class BaseRateLimiter(ABC):
+    """The token buckets that are shared by all connections with the same key"""
+
+    @abstractmethod
+    async def consume(self, key: str, rate: float, capacity: float) -> bool:
+        """The method that takes a token from the bucket of the key. Returns 'false' if the bucket is empty"""
+
+
+class InMemoryRateLimiter(BaseRateLimiter):
+    """The process-local buckets. It is suitable for development and tests only"""
+
+    def __init__(self) -> None:
+        self.buckets: dict[str, TokenBucket] = {}
+
+    async def consume(self, key: str, rate: float, capacity: float) -> bool:
+        if key not in self.buckets:
+            self.buckets[key] = TokenBucket(rate, capacity)
+        return self.buckets[key].consume()
+
+
+class RedisRateLimiter(BaseRateLimiter):
+    """The buckets that are kept in Redis hashes. A token is taken by a Lua script, the time is Redis time"""
+
+    consume_script = '''
+        local capacity, rate = tonumber(ARGV[1]), tonumber(ARGV[2])
+        local time = redis.call('TIME')
+        local now = time[1] + time[2] / 1000000
+        local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated at')
+        local tokens = tonumber(bucket[1]) or capacity
+        local updated_at = tonumber(bucket[2]) or now
+        tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+        local allowed = tokens >= 1
+        if allowed then
+            tokens = tokens - 1
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated at', tostring(now))
+        redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+        return allowed and 1 or 0
+    '''
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 6379, db: int = 0, prefix: str = 'rate limit:') -> None:
+        self.redis = redis.Redis(host=host, port=port, db=db)
+        self.prefix = prefix
+        self.consume_token = self.redis.register_script(self.consume_script)
+
+    async def consume(self, key: str, rate: float, capacity: float) -> bool:
+        return bool(await self.consume_token(keys=[f'{self.prefix}{key}'], args=[capacity, rate]))
+
+
+@lru_cache(maxsize=None)
+def get_rate_limiter() -> BaseRateLimiter:
+    """The function that returns the limiter configured by the 'RATE_LIMIT' setting"""
+
+    return create_backend(settings.RATE_LIMIT)
+
+
+class ConnectionLimits:
+    """
+    The limits of one websocket connection
+
+    A frame takes a token from the bucket of the connection and from the shared bucket of the client's IP.
+    Error replies to rejected and malformed frames are limited, the rest of them are dropped.
+    Every rejected or malformed frame is a violation, the connection must be closed
+    when violations exceed their limit
+    """
+
+    def __init__(self, client_ip: str) -> None:
+        config = settings.RATE_LIMIT
+        self.ip_key = f'ip:{client_ip}'
+        self.frames = TokenBucket(config['CONNECTION_RATE'], config['CONNECTION_BURST'])
+        self.error_replies = TokenBucket(config['ERROR_REPLY_RATE'], config['ERROR_REPLY_BURST'])
+        self.violations = TokenBucket(config['VIOLATION_RATE'], config['VIOLATION_BURST'])
+
+    async def admit_frame(self) -> bool:
+        config = settings.RATE_LIMIT
+        return self.frames.consume() and await get_rate_limiter().consume(self.ip_key, config['IP_RATE'],
+                                                                          config['IP_BURST'])
+
+
+def create_connection_limits(scope: dict[str, Any]) -> Optional[ConnectionLimits]:
+    """The function that returns the limits of the connection. In-process clients like the bot aren't limited"""
+
+    if not settings.RATE_LIMIT['ENABLED'] or not scope.get('client'):
+        return None
+    return ConnectionLimits(scope['client'][0])
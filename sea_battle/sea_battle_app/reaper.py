@@ -0,0 +1,86 @@
+import asyncio
+from datetime import timedelta
+from typing import Optional
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from sea_battle_app.battle_state import get_battle_state_store
+from sea_battle_app.models import Battle, Player, TournamentMatch
+
+
+def get_stale_battles_filter() -> Q:
+    """
+    The function that returns the filter of battles to reap, the ages are counted from 'Battle.datetime':
+    1) battles without players older than 'UNJOINED_AFTER' seconds, except the battles of tournaments,
+       their players come when the previous rounds end
+    2) finished battles older than 'FINISHED_AFTER' seconds
+    3) any battles older than 'ABANDONED_AFTER' seconds
+    """
+
+    now = timezone.now()
+    no_players = Q(first_player__isnull=True, second_player__isnull=True,
+                   first_token__isnull=True, second_token__isnull=True) \
+        & ~Exists(TournamentMatch.objects.filter(battle_address=OuterRef('address')))
+    return no_players & Q(datetime__lt=now - timedelta(seconds=settings.REAPER['UNJOINED_AFTER'])) \
+        | Q(who_win__isnull=False, datetime__lt=now - timedelta(seconds=settings.REAPER['FINISHED_AFTER'])) \
+        | Q(datetime__lt=now - timedelta(seconds=settings.REAPER['ABANDONED_AFTER']))
+
+
+def delete_stale_battles(batch_size: int) -> list[str]:
+    """
+    The function that deletes a batch of stale battles with their player rows. Returns the addresses
+
+    The move log is kept by the address, so the reaped battles can still be replayed
+    """
+
+    with transaction.atomic():
+        # Any stale battles make a batch. Ordering would turn the index lookups into a scan of the table
+        battles = list(Battle.objects.filter(get_stale_battles_filter())
+                       .values_list('pk', 'address', 'first_player', 'second_player')[:batch_size])
+        Battle.objects.filter(pk__in=[pk for pk, *_ in battles]).delete()
+        Player.objects.filter(pk__in=[player for *_, first, second in battles for player in (first, second)
+                                      if player is not None]).delete()
+    return [address for _, address, *_ in battles]
+
+
+async def reap_battles() -> int:
+    """
+    The function that deletes stale battles by 'REAPER["BATCH_SIZE"]' and releases their state in the store
+
+    Returns the number of reaped battles
+    """
+
+    batch_size = settings.REAPER['BATCH_SIZE']
+    store = get_battle_state_store()
+    reaped = 0
+    while True:
+        addresses = await database_sync_to_async(delete_stale_battles)(batch_size)
+        await asyncio.gather(*(store.delete(address) for address in addresses))
+        reaped += len(addresses)
+        if len(addresses) < batch_size:
+            return reaped
+
+
+_reaping_task: Optional[asyncio.Task] = None
+
+
+def start_reaping() -> None:
+    """
+    The function that starts the process-wide task reaping battles every 'REAPER["INTERVAL"]' seconds
+
+    Unlike the 'reapbattles' command, it releases the battles of the in-memory store of this process too
+    """
+
+    global _reaping_task
+    if settings.REAPER.get('INTERVAL') and (_reaping_task is None or _reaping_task.done()):
+        _reaping_task = asyncio.create_task(_reap_battles_periodically())
+
+
+async def _reap_battles_periodically() -> None:
+    while True:
+        await asyncio.sleep(settings.REAPER['INTERVAL'])
+        await reap_battles()
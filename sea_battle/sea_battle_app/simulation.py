@@ -0,0 +1,116 @@
+from typing import NamedTuple, Sequence
+
+import numpy as np
+
+from sea_battle_app.battle_logic import CellState, FIELD_SIZE
+
+CELLS_COUNT = FIELD_SIZE * FIELD_SIZE
+
+MASK_BYTES = (CELLS_COUNT + 7) // 8
+
+
+class StepResult(NamedTuple):
+    valid: np.ndarray
+    hit: np.ndarray
+    destroyed: np.ndarray
+    game_over: np.ndarray
+
+
+class BatchSimulator:
+    """
+    The offline simulator of N fields shot at simultaneously
+
+    It follows 'battle_logic.process_shot': 'cells' has the values of 'CellState'
+    and is equal to 'Bitboard.field_as_int' of the same field after the same shots.
+    'ship_ids' has 0 for water and 'i + 1' for the cells of the i-th ship of the fleet
+    """
+
+    def __init__(self, fleets: Sequence[list[int]]) -> None:
+        """'fleets' are lists of ship masks like 'Bitboard.ships'"""
+
+        count, ships_count = len(fleets), max(map(len, fleets), default=0)
+        packed = b''.join(ship.to_bytes(MASK_BYTES, 'little')
+                          for ships in fleets for ship in ships + [0] * (ships_count - len(ships)))
+        bits = np.unpackbits(np.frombuffer(packed, dtype=np.uint8), bitorder='little') \
+            .reshape(count, ships_count, MASK_BYTES * 8)[:, :, :CELLS_COUNT]
+
+        ship_ids = np.arange(1, ships_count + 1, dtype=np.int8)[None, :, None]
+        self.ship_ids = (bits * ship_ids).sum(axis=1, dtype=np.int8).reshape(count, FIELD_SIZE, FIELD_SIZE)
+        ship_cells = bits.sum(axis=2, dtype=np.int8)
+        self.ship_cells_left = np.concatenate([np.zeros((count, 1), dtype=np.int8), ship_cells], axis=1)
+
+        self.cells = np.full((count, FIELD_SIZE, FIELD_SIZE), CellState.nothing.value, dtype=np.uint8)
+        self.ships_left = (ship_cells > 0).sum(axis=1, dtype=np.int8)
+        self.shots = np.zeros(count, dtype=np.int16)
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+    @property
+    def game_over(self) -> np.ndarray:
+        return self.ships_left == 0
+
+    def step(self, shots: np.ndarray) -> StepResult:
+        """
+        The method that processes one shot per field, 'shots' has shape (N, 2)
+
+        Incorrect shots and shots at finished games change nothing and are marked as not valid
+        """
+
+        games = np.arange(len(self))
+        x, y = shots[:, 0], shots[:, 1]
+        valid = (x >= 0) & (x < FIELD_SIZE) & (y >= 0) & (y < FIELD_SIZE) & ~self.game_over
+        x, y = np.where(valid, x, 0), np.where(valid, y, 0)
+        valid &= self.cells[games, x, y] == CellState.nothing.value
+
+        ship_id = np.where(valid, self.ship_ids[games, x, y], 0)
+        hit = ship_id > 0
+        self.shots += valid
+        self.cells[games[valid], x[valid], y[valid]] = np.where(hit[valid], CellState.hit.value,
+                                                                CellState.missed.value)
+
+        self.ship_cells_left[games[hit], ship_id[hit]] -= 1
+        destroyed = hit & (self.ship_cells_left[games, ship_id] == 0)
+        self.ships_left -= destroyed
+        if destroyed.any():
+            self._mark_halo(games[destroyed], ship_id[destroyed])
+
+        return StepResult(valid, hit, destroyed, self.game_over)
+
+    def _mark_halo(self, games: np.ndarray, ship_id: np.ndarray) -> None:
+        ships = self.ship_ids[games] == ship_id[:, None, None]
+        padded = np.pad(ships, ((0, 0), (1, 1), (1, 1)))
+        halo = np.zeros_like(ships)
+        for i in range(3):
+            for j in range(3):
+                halo |= padded[:, i:i + FIELD_SIZE, j:j + FIELD_SIZE]
+        halo &= ~ships
+
+        cells = self.cells[games]
+        cells[halo & (cells != CellState.hit.value)] = CellState.missed.value
+        self.cells[games] = cells
+
+
+def play_random_games(fleets: Sequence[list[int]], seed: int = 0) -> np.ndarray:
+    """
+    The function that shoots at random unmarked cells until every fleet is destroyed. Returns shots per game
+
+    Every field is shot in its own random order of cells, marked cells are skipped,
+    so every shot is uniformly random among unmarked cells
+    """
+
+    simulator = BatchSimulator(fleets)
+    games = np.arange(len(simulator))
+    orders = np.random.default_rng(seed).random((len(simulator), CELLS_COUNT)).argsort(axis=1)
+    positions = np.zeros(len(simulator), dtype=np.intp)
+    cells = simulator.cells.reshape(len(simulator), CELLS_COUNT)
+
+    while not simulator.game_over.all():
+        marked = ~simulator.game_over & (cells[games, orders[games, positions]] != CellState.nothing.value)
+        while marked.any():
+            positions[marked] += 1
+            marked_games = games[marked]
+            marked[marked] = cells[marked_games, orders[marked_games, positions[marked_games]]] \
+                != CellState.nothing.value
+        simulator.step(np.stack(np.divmod(orders[games, positions], FIELD_SIZE), axis=1))
+    return simulator.shots
@@ -0,0 +1,15 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from sea_battle_app.utils import create_battle_address
+
+
+class BattleAddressTest(SimpleTestCase):
+    """Addresses of one process are unique and ordered even when they are created in the same millisecond"""
+
+    def test_same_millisecond(self) -> None:
+        with mock.patch('time.time_ns', return_value=1_700_000_000_000_000_000):
+            addresses = [create_battle_address() for _ in range(10000)]
+        self.assertEqual(len(set(addresses)), len(addresses))
+        self.assertEqual(sorted(addresses), addresses)
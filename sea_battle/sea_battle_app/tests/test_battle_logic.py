@@ -0,0 +1,67 @@
+import itertools
+import random
+from collections import Counter
+
+from django.test import SimpleTestCase
+
+from sea_battle_app.battle_logic import SHIPS_SIZES, generate_many_fleet_masks, generate_many_ships_coords, \
+    get_ship_placements, sample_fleet, validate_ships_coords
+
+FLEET = [[[0, 0], [0, 1], [0, 2], [0, 3]], [[2, 0], [2, 1], [2, 2]], [[4, 0], [4, 1], [4, 2]],
+         [[6, 0], [6, 1]], [[8, 0], [8, 1]], [[0, 5], [0, 6]], [[9, 9]], [[7, 9]], [[5, 9]], [[3, 9]]]
+
+
+class FleetGenerationTest(SimpleTestCase):
+    """Generated fleets are always legal, all legal fleets are equally likely and the same seed gives the same fleets"""
+
+    def test_fleets_are_valid(self) -> None:
+        for ships_coords in generate_many_ships_coords(300, seed=0):
+            self.assertEqual(validate_ships_coords(ships_coords), (True, ''), ships_coords)
+            self.assertEqual(sorted(map(len, ships_coords), reverse=True), list(SHIPS_SIZES))
+
+    def test_seed_is_reproducible(self) -> None:
+        self.assertEqual(generate_many_fleet_masks(100, seed=1), generate_many_fleet_masks(100, seed=1))
+        self.assertNotEqual(generate_many_fleet_masks(100, seed=1), generate_many_fleet_masks(100, seed=2))
+
+    def test_uniform_distribution(self) -> None:
+        # All legal fleets of a 4x4 field with ships of 3, 2 and 1 cells are counted by brute force
+        fleet_placements = [get_ship_placements(size, field_size=4) for size in (3, 2, 1)]
+        legal_fleets = [tuple(ship for ship, _ in placements) for placements in itertools.product(*fleet_placements)
+                        if all(not first[1] & second[0] for first, second in itertools.combinations(placements, 2))]
+        self.assertEqual(len(legal_fleets), 176)
+
+        rng, samples_per_fleet = random.Random(0), 200
+        counts = Counter(tuple(sample_fleet(rng, fleet_placements))
+                         for _ in range(len(legal_fleets) * samples_per_fleet))
+        self.assertEqual(set(counts), set(legal_fleets))
+
+        # Chi-squared with 175 degrees of freedom: its mean is 175 and its deviation is about 19
+        chi_squared = sum((count - samples_per_fleet) ** 2 / samples_per_fleet for count in counts.values())
+        self.assertLess(chi_squared, 270)
+
+
+class FleetValidationTest(SimpleTestCase):
+    """The mask validator keeps the error messages of the original one and accepts integer coordinates only"""
+
+    def assertFleetError(self, ships_coords: object, message: str) -> None:
+        self.assertEqual(validate_ships_coords(ships_coords), (False, message))  # type: ignore
+
+    def test_valid_fleet(self) -> None:
+        self.assertEqual(validate_ships_coords(FLEET), (True, ''))
+
+    def test_error_messages(self) -> None:
+        self.assertFleetError('ships', 'incorrect input data')
+        self.assertFleetError(FLEET[:9], 'incorrect ships count')
+        self.assertFleetError([*FLEET[:9], [[9, 9]]], 'incorrect ships coordinates')
+        self.assertFleetError([*FLEET[:9], [[1, 6]]], 'ships cant be nearby')
+        self.assertFleetError([*FLEET[:9], [[3, 10]]], 'incorrect ship coordinates')
+        self.assertFleetError([[[0, 0], [1, 1], [0, 2], [0, 3]], *FLEET[1:]], 'incorrect ship coordinates')
+        self.assertFleetError([[[0, 0], [0, 1], [0, 2], [0, 3], [0, 4]], *FLEET[1:9], []], 'incorrect ship size')
+        self.assertFleetError([*FLEET[:5], [[0, 5], [0, 7]], *FLEET[6:]], 'incorrect ship coordinates')
+        self.assertFleetError([[[0, 0], [0, 1], [0, 2]], [[0, 5], [0, 6], [0, 7]], *FLEET[1:5], *FLEET[6:]],
+                              'incorrect ratio of ships')
+
+    def test_non_integer_coordinates(self) -> None:
+        for coord in (7.0, 7.5, True, '7'):
+            self.assertFleetError([*FLEET[:7], [[coord, 9]], *FLEET[8:]], 'incorrect input data')
+        self.assertFleetError([*FLEET[:9], [[True, 9]]], 'incorrect input data')
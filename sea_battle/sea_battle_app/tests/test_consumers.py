@@ -0,0 +1,276 @@
+import asyncio
+from typing import Any
+
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import TransactionTestCase, override_settings
+
+from sea_battle_app.battle_logic import BattleInfo
+from sea_battle_app.battle_state import get_battle_state_store
+from sea_battle_app.bot import BotClient
+from sea_battle_app.channels.consumers import _local_consumers
+from sea_battle_app.channels.sync_consumers import SyncBattleConsumer
+from sea_battle_app.leaderboard import get_stats_writer
+from sea_battle_app.models import Battle, PlayerStats
+from sea_battle_app.move_log import get_move_log_writer
+from sea_battle_app.player_slots import get_player_slots
+from sea_battle_app.tests.utils import CapturedQueries, application, connect, get_shots, receive_all, request, \
+    start_battle
+
+
+class ConcurrentConnectionTest(TransactionTestCase):
+    """Players who connect to a new battle at the same moment must get different slots"""
+
+    def tearDown(self) -> None:
+        get_player_slots.cache_clear()
+
+    async def connect_at_once(self) -> None:
+        battle = await database_sync_to_async(Battle.objects.create)()
+        communicators = [WebsocketCommunicator(application, f'/ws/battle/{battle.address}/') for _ in range(3)]
+        await asyncio.gather(*(communicator.connect() for communicator in communicators))
+
+        # The socket is accepted before the slot is taken, the player without a slot is closed after that
+        first_frames = [await communicator.receive_output() for communicator in communicators]
+        players = [communicator for communicator, frame in zip(communicators, first_frames)
+                   if frame['type'] == 'websocket.send']
+        self.assertEqual(len(players), 2)
+        self.assertEqual([frame['type'] for frame in first_frames].count('websocket.close'), 1)
+
+        battle = await database_sync_to_async(get_player_slots().get_battle)(pk=battle.pk)
+        self.assertTrue(battle.is_full)
+        self.assertNotEqual(battle.get_player(1).token, battle.get_player(2).token)
+        for communicator in players:
+            await communicator.disconnect(1000)
+
+    async def test_battle_row_slots(self) -> None:
+        with override_settings(PLAYER_SLOTS={'BACKEND': 'sea_battle_app.player_slots.BattleRowSlots'}):
+            get_player_slots.cache_clear()
+            await self.connect_at_once()
+
+    async def test_player_row_slots(self) -> None:
+        with override_settings(PLAYER_SLOTS={'BACKEND': 'sea_battle_app.player_slots.PlayerRowSlots'}):
+            get_player_slots.cache_clear()
+            await self.connect_at_once()
+
+    async def test_unknown_battle_is_rejected(self) -> None:
+        communicator = WebsocketCommunicator(application, '/ws/battle/unknown/')
+        connected, _ = await communicator.connect()
+        self.assertFalse(connected)
+
+
+@override_settings(MOVE_LOG={'BATCH_SIZE': 10000, 'FLUSH_INTERVAL': 3600})
+class QueryCountTest(TransactionTestCase):
+    """The database is touched on transitions only: a shot costs no query, a move change costs one UPDATE"""
+
+    def setUp(self) -> None:
+        get_move_log_writer.cache_clear()
+
+    def tearDown(self) -> None:
+        get_move_log_writer.cache_clear()
+
+    async def test_full_game(self) -> None:
+        battle = await database_sync_to_async(Battle.objects.create)()
+        players, _ = await start_battle(battle.address)
+        shots = [get_shots(1), get_shots(2)]
+        shooter, moves_changed = 0, 0
+        while True:
+            async with CapturedQueries() as queries:
+                await request(players[shooter], 'take a shot', shots[shooter].pop())
+                shooter_frames, opponent_frames = await receive_all(players[shooter]), \
+                    await receive_all(players[1 - shooter])
+
+            if {'type': 'end game', 'body': 'you are winner'} in shooter_frames:
+                # The end of the game looks up the tournament match of the battle as well
+                self.assertEqual((queries.count('UPDATE'), queries.count('SELECT')), (1, 1))
+                break
+            self.assertEqual(queries.count('SELECT'), 0)
+            if {'type': 'battle logic', 'body': 'your move'} in opponent_frames:
+                self.assertEqual(queries.count('UPDATE'), 1)
+                shooter, moves_changed = 1 - shooter, moves_changed + 1
+            else:
+                self.assertEqual(queries.count('UPDATE'), 0)
+            self.assertEqual(len(queries.context.captured_queries), queries.count('UPDATE'))
+
+        self.assertGreater(moves_changed, 0)
+        for player in players:
+            await player.disconnect(1000)
+
+
+class ReconnectionTest(TransactionTestCase):
+    """A dropped player gets the slot back by the token and the lost battle is restored from the checkpoint"""
+
+    async def pass_move(self, battle: Battle) -> tuple[list[WebsocketCommunicator], list[str]]:
+        """The method that starts the battle and makes the first player shoot until the move passes"""
+
+        players, tokens = await start_battle(battle.address)
+        shots = get_shots()
+        while True:
+            await request(players[0], 'take a shot', shots.pop())
+            await receive_all(players[0])
+            if {'type': 'battle logic', 'body': 'your move'} in await receive_all(players[1]):
+                return players, tokens
+
+    async def test_resume_from_checkpoint(self) -> None:
+        battle = await database_sync_to_async(Battle.objects.create)()
+        players, tokens = await self.pass_move(battle)
+        await players[0].disconnect(1006)
+        store = get_battle_state_store()
+        await store.delete(battle.address)
+
+        reconnected = await connect(battle.address, f'token={tokens[0]}')
+        frames = await receive_all(reconnected)
+        self.assertEqual(frames[0], {'type': 'state', 'body': 'progress'})
+        self.assertEqual(frames[1]['type'], 'progress battle data')
+        self.assertIn({'type': 'info', 'body': 'opponent reconnected'}, await receive_all(players[1]))
+
+        checkpoint = (await database_sync_to_async(Battle.objects.get)(pk=battle.pk)).json_state
+        self.assertEqual((await store.get(battle.address)).as_dict(), BattleInfo.from_dict(checkpoint).as_dict())
+        self.assertGreater(checkpoint['second_player']['shots'], 0)
+
+        await request(players[1], 'take a shot', get_shots(1).pop())
+        self.assertEqual((await receive_all(players[1]))[0]['type'], 'changed opponent field')
+        self.assertEqual((await receive_all(reconnected))[0]['type'], 'changed your field')
+        for player in (reconnected, players[1]):
+            await player.disconnect(1000)
+
+    async def test_grace_period_is_over(self) -> None:
+        battle = await database_sync_to_async(Battle.objects.create)()
+        players, tokens = await self.pass_move(battle)
+        await players[0].disconnect(1006)
+
+        with override_settings(RECONNECTION_GRACE_PERIOD=0):
+            communicator = WebsocketCommunicator(application, f'/ws/battle/{battle.address}/?token={tokens[0]}')
+            connected, _ = await communicator.connect()
+        self.assertFalse(connected)
+        await players[1].disconnect(1000)
+
+
+@override_settings(SPECTATORS={'ENABLED': True, 'FLUSH_INTERVAL': 0})
+class SpectatorTest(TransactionTestCase):
+    """Player consumers send nothing to the group of spectators until a spectator has joined"""
+
+    @staticmethod
+    def has_spectators(address: str) -> list[bool]:
+        return [consumer.has_spectators for consumer in _local_consumers.values()
+                if consumer.battle_model.address == address]
+
+    @staticmethod
+    async def watch(address: str) -> WebsocketCommunicator:
+        communicator = WebsocketCommunicator(application, f'/ws/battle/{address}/watch/')
+        connected, _ = await communicator.connect()
+        assert connected, f'the spectator of {address} was rejected'
+        return communicator
+
+    async def test_spectator_joins_the_game(self) -> None:
+        battle = await database_sync_to_async(Battle.objects.create)()
+        players, _ = await start_battle(battle.address)
+        self.assertEqual(self.has_spectators(battle.address), [False, False])
+
+        spectator = await self.watch(battle.address)
+        self.assertEqual([frame['type'] for frame in await receive_all(spectator)],
+                         ['battle state', 'field snapshot', 'field snapshot'])
+        self.assertEqual(self.has_spectators(battle.address), [True, True])
+
+        await request(players[0], 'take a shot', get_shots().pop())
+        await receive_all(players[0])
+        self.assertEqual((await receive_all(spectator))[0]['type'], 'changed field')
+        for communicator in (spectator, *players):
+            await communicator.disconnect(1000)
+
+    async def test_players_connect_after_spectator(self) -> None:
+        battle = await database_sync_to_async(Battle.objects.create)()
+        spectator = await self.watch(battle.address)
+        players, _ = await start_battle(battle.address)
+        self.assertEqual(self.has_spectators(battle.address), [True, True])
+        for communicator in (spectator, *players):
+            await communicator.disconnect(1000)
+
+
+RATE_LIMIT = {**settings.RATE_LIMIT, 'ENABLED': True, 'CONNECTION_RATE': 0.001, 'CONNECTION_BURST': 3,
+              'ERROR_REPLY_RATE': 0.001, 'ERROR_REPLY_BURST': 1, 'VIOLATION_RATE': 0.001, 'VIOLATION_BURST': 8}
+
+
+class RateLimitTest(TransactionTestCase):
+    """Requests over the rate limit are always answered, undecodable frames are violations"""
+
+    async def connect_client(self) -> WebsocketCommunicator:
+        battle = await database_sync_to_async(Battle.objects.create)()
+        communicator = WebsocketCommunicator(application, f'/ws/battle/{battle.address}/')
+        # In-process clients without an address aren't limited
+        communicator.scope['client'] = ('127.0.0.1', 50000)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await receive_all(communicator)
+        return communicator
+
+    @override_settings(RATE_LIMIT=RATE_LIMIT)
+    async def test_rejected_requests_are_answered(self) -> None:
+        communicator = await self.connect_client()
+        for _ in range(6):
+            await request(communicator, 'surrender')
+
+        # Rejected frames are answered before the admitted ones are processed
+        bodies = [frame['body'] for frame in await receive_all(communicator)]
+        self.assertEqual(sorted(bodies), ['request is not possible at this stage'] * 3 + ['too many requests'] * 3)
+        await communicator.disconnect(1000)
+
+    @override_settings(RATE_LIMIT={**RATE_LIMIT, 'CONNECTION_BURST': 100})
+    async def test_undecodable_frames_are_violations(self) -> None:
+        communicator = await self.connect_client()
+        await communicator.send_to(text_data='{"type": "surrender"')
+        self.assertEqual(await receive_all(communicator), [{'type': 'error', 'body': 'incorrect frame'}])
+
+        for _ in range(8):
+            await communicator.send_to(text_data='not json')
+        self.assertEqual(await communicator.receive_output(), {'type': 'websocket.close', 'code': 4008})
+
+
+@override_settings(LEADERBOARD={**settings.LEADERBOARD, 'BATCH_SIZE': 10000, 'FLUSH_INTERVAL': 3600})
+class GameResultTest(TransactionTestCase):
+    """The battle ends once: a repeated surrender doesn't end it again and doesn't record another result"""
+
+    def setUp(self) -> None:
+        get_stats_writer.cache_clear()
+
+    def tearDown(self) -> None:
+        get_stats_writer.cache_clear()
+
+    async def test_double_surrender(self) -> None:
+        battle = await database_sync_to_async(Battle.objects.create)()
+        users = [await database_sync_to_async(User.objects.create_user)(username) for username in ('first', 'second')]
+        players, _ = await start_battle(battle.address, users=users)
+
+        # The second request is processed before the end of the battle reaches the consumer
+        await request(players[0], 'surrender')
+        await request(players[0], 'surrender')
+        self.assertEqual((await receive_all(players[1])).count({'type': 'end game', 'body': 'you are winner'}), 1)
+        await receive_all(players[0])
+
+        await get_stats_writer().flush()
+        results = database_sync_to_async(lambda: set(PlayerStats.objects.values_list('user__username', 'wins',
+                                                                                      'losses')))
+        self.assertEqual(await results(), {('first', 0, 1), ('second', 1, 0)})
+        for player in players:
+            await player.disconnect(1000)
+
+
+class SyncBaselineTest(TransactionTestCase):
+    """Bots finish their battles through the synchronous baseline consumer, so the benchmark compares whole games"""
+
+    async def test_bots_finish_battles(self) -> None:
+        results: list[str] = []
+
+        class RecordingBot(BotClient):
+            def process_message(self, content: dict[str, Any]) -> None:
+                if content['type'] == 'end game':
+                    results.append(content['body'])
+                super().process_message(content)
+
+        battles = await database_sync_to_async(Battle.objects.create_many)(3)
+        application = SyncBattleConsumer.as_asgi()
+        await asyncio.gather(*(RecordingBot(battle.address, application).run() for battle in battles for _ in range(2)))
+
+        self.assertEqual(sorted(results), ['you are loser'] * 3 + ['you are winner'] * 3)
+        self.assertFalse(await database_sync_to_async(Battle.objects.exists)())
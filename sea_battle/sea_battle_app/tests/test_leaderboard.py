@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from sea_battle_app.leaderboard import StatsWriter, get_leaderboard_page, get_ranking, get_user_rank, rebuild_ranking
+from sea_battle_app.models import PlayerStats
+
+
+@override_settings(LEADERBOARD={**settings.LEADERBOARD, 'PAGE_SIZE': 7, 'CACHE_TIMEOUT': 0})
+class LeaderboardTest(TestCase):
+    """Ranks are kept by the stats writer and pages are read by keyset in the leaderboard order"""
+
+    def setUp(self) -> None:
+        cache.clear()
+        get_ranking().clear()
+        users = User.objects.bulk_create([User(username=f'user{i}') for i in range(30)])
+        # Results that make equal ratings, so the order by user id is used as well
+        StatsWriter().write({user.pk: [i % 4, i % 3] for i, user in enumerate(users)})
+        self.ordered_stats = list(PlayerStats.objects.select_related('user').order_by('-rating', 'user'))
+
+    def test_ranks_follow_the_leaderboard_order(self) -> None:
+        with self.assertNumQueries(0):
+            ranks = [get_user_rank(stats) for stats in self.ordered_stats]
+        self.assertEqual(ranks, list(range(1, 31)))
+
+        StatsWriter().write({self.ordered_stats[-1].pk: [10, 0]})
+        self.assertEqual(get_user_rank(self.ordered_stats[-1]), 1)
+        self.assertEqual(get_user_rank(self.ordered_stats[0]), 2)
+
+    def test_pages_by_cursor(self) -> None:
+        results, after = [], None
+        while True:
+            with self.assertNumQueries(1):
+                page = get_leaderboard_page(after)
+            self.assertEqual(page['count'], 30)
+            results.extend(page['results'])
+            if page['next'] is None:
+                break
+            rating, user_id = page['next'].split(':')
+            after = (int(rating), int(user_id))
+
+        self.assertEqual([(result['rank'], result['username']) for result in results],
+                         [(rank, stats.user.username) for rank, stats in enumerate(self.ordered_stats, 1)])
+
+    def test_rebuild(self) -> None:
+        get_ranking().clear()
+        self.assertIsNone(get_user_rank(self.ordered_stats[0]))
+        self.assertEqual(rebuild_ranking(batch_size=4), 30)
+        self.assertEqual([get_user_rank(stats) for stats in self.ordered_stats], list(range(1, 31)))
@@ -0,0 +1,28 @@
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import TransactionTestCase, override_settings
+
+from sea_battle_app.metrics import HandlerMetrics, REGISTRY, count_query
+from sea_battle_app.models import Battle
+
+
+@override_settings(METRICS={'ENABLED': True, 'SAMPLE_RATE': 1.0})
+class QueryCountingTest(TransactionTestCase):
+    """A connection that reconnects keeps a single query counting wrapper, so queries are not counted twice"""
+
+    def setUp(self) -> None:
+        self.metrics = HandlerMetrics('test_handler', 'Test calls', ('name',))
+
+    def tearDown(self) -> None:
+        for metric in (self.metrics.calls, self.metrics.duration, self.metrics.queries):
+            REGISTRY.remove(metric)
+
+    def test_reconnected_connection(self) -> None:
+        # The in-memory test database can't be closed, so the signal of the reconnection is sent directly
+        for _ in range(3):
+            connection_created.send(sender=connection.__class__, connection=connection)
+        self.assertEqual(connection.execute_wrappers.count(count_query), 1)
+
+        with self.metrics.measure('reconnected'):
+            Battle.objects.exists()
+        self.assertEqual(self.metrics.queries.values[('reconnected',)][-1], 1)
@@ -0,0 +1,40 @@
+from unittest import mock
+
+from channels.db import database_sync_to_async
+from django.db import DatabaseError
+from django.test import TransactionTestCase
+
+from sea_battle_app.models import Fleet, Move
+from sea_battle_app.move_log import MoveLogWriter
+
+
+class MoveLogFlushTest(TransactionTestCase):
+    """A flush writes every record it can: a bad record or a failed model doesn't drop the whole batch"""
+
+    @staticmethod
+    def create_moves(address: str, count: int) -> list[Move]:
+        return [Move(address=address, sequence=sequence, shooter=1, cell=sequence, result=0)
+                for sequence in range(1, count + 1)]
+
+    async def test_duplicate_records_are_skipped(self) -> None:
+        await database_sync_to_async(Move.objects.bulk_create)(self.create_moves('battle', 1))
+        writer = MoveLogWriter(batch_size=10000)
+        writer.extend([*self.create_moves('battle', 3), Fleet(address='battle', player=1, ships=[1])])
+        await writer.flush()
+
+        self.assertEqual(await database_sync_to_async(Move.objects.filter(address='battle').count)(), 3)
+        self.assertEqual(await database_sync_to_async(Fleet.objects.count)(), 1)
+        for task in writer.tasks:
+            task.cancel()
+
+    async def test_failed_model_is_logged(self) -> None:
+        writer = MoveLogWriter(batch_size=10000)
+        writer.extend([*self.create_moves('battle', 3), Fleet(address='battle', player=1, ships=[1])])
+        with mock.patch.object(Fleet.objects, 'bulk_create', side_effect=DatabaseError), \
+                self.assertLogs('sea_battle_app.move_log') as logs:
+            await writer.flush()
+
+        self.assertIn('1 records of Fleet are lost', logs.output[0])
+        self.assertEqual(await database_sync_to_async(Move.objects.count)(), 3)
+        for task in writer.tasks:
+            task.cancel()
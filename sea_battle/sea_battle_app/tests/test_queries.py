@@ -0,0 +1,171 @@
+from datetime import timedelta
+from typing import Any
+
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from sea_battle_app.battle_logic import generate_many_ships_coords
+from sea_battle_app.metrics import get_battles_by_state
+from sea_battle_app.models import Battle, Player
+from sea_battle_app.move_log import get_move_log_writer
+from sea_battle_app.player_slots import BattleRowSlots, get_player_slots
+from sea_battle_app.reaper import delete_stale_battles, get_stale_battles_filter
+from sea_battle_app.tests.utils import CapturedQueries, connect, receive_all, request
+from sea_battle_app.utils import create_battle_address
+
+BATTLES_COUNT = 5000
+
+
+@override_settings(REAPER={'UNJOINED_AFTER': 60, 'FINISHED_AFTER': 60, 'ABANDONED_AFTER': 3600, 'BATCH_SIZE': 100})
+class BattleQueriesTest(TestCase):
+    """
+    The hot queries of the battle table use its indexes and don't grow with the table
+
+    Most battles of the seeded table are in progress and young, like on a live server:
+    the reaper looks for a few stale battles among them
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        Battle.objects.create_many(BATTLES_COUNT, batch_size=500, first_token='first', second_token='second',
+                                   whose_move=1)
+        pks = list(Battle.objects.order_by('pk').values_list('pk', flat=True))
+        Battle.objects.filter(pk__in=pks[:30]).update(first_token=None, second_token=None, whose_move=None)
+        Battle.objects.filter(pk__in=pks[30:60]).update(who_win=1, whose_move=None)
+        Battle.objects.filter(pk__in=pks[:90]).update(datetime=timezone.now() - timedelta(hours=2))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertUsesIndexes(self, plan: str, *index_names: str) -> None:
+        for index_name in index_names:
+            self.assertIn(index_name, plan)
+
+    def test_address_lookup(self) -> None:
+        address = Battle.objects.order_by('-pk').values_list('address', flat=True)[0]
+        with self.assertNumQueries(1):
+            BattleRowSlots().get_battle(address=address)
+        # The unique index of the address is named by the database
+        self.assertRegex(Battle.objects.filter(address=address).explain(), r'(?i)index.*address')
+
+    def test_reaper_filter(self) -> None:
+        stale_battles = Battle.objects.filter(get_stale_battles_filter()).values_list('pk', 'address')[:100]
+        self.assertUsesIndexes(stale_battles.explain(), 'battle_unjoined_idx', 'battle_finished_idx',
+                               'battle_datetime_idx')
+
+        # The savepoint, the release and the SELECT and DELETE of the battles, the reaped battles have no player rows
+        with self.assertNumQueries(4):
+            self.assertEqual(len(delete_stale_battles(100)), 90)
+        self.assertEqual(Battle.objects.count(), BATTLES_COUNT - 90)
+
+    def test_state_counts(self) -> None:
+        with CaptureQueriesContext(connection) as queries:
+            battles_by_state = get_battles_by_state()
+        self.assertEqual(battles_by_state, {('preparation',): 30, ('progress',): BATTLES_COUNT - 60, ('is_over',): 30})
+        self.assertEqual(len(queries), 1)
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {queries[0]["sql"]}')
+            plan = '\n'.join(' '.join(map(str, row)) for row in cursor.fetchall())
+        self.assertUsesIndexes(plan, 'battle_state_idx')
+
+
+@override_settings(MOVE_LOG={'BATCH_SIZE': 10000, 'FLUSH_INTERVAL': 3600})
+class ConsumerQueriesTest(TransactionTestCase):
+    """
+    Every handler of the battle consumer makes a fixed number of queries, and they find the battle by an index
+
+    The counts include the queries of the opponent's consumer that handles the transition,
+    so the clients wait longer for the frames of the opponent
+    """
+
+    def setUp(self) -> None:
+        get_move_log_writer.cache_clear()
+        get_player_slots.cache_clear()
+        # Battles in progress have players of both kinds of slots, like on a live server
+        players = Player.objects.bulk_create([Player() for _ in range(BATTLES_COUNT * 2)], batch_size=500)
+        Battle.objects.bulk_create([Battle(address=create_battle_address(), first_player=first, second_player=second,
+                                           first_token='first', second_token='second', whose_move=1)
+                                    for first, second in zip(players[::2], players[1::2])], batch_size=500)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def tearDown(self) -> None:
+        get_move_log_writer.cache_clear()
+        get_player_slots.cache_clear()
+
+    @staticmethod
+    def explain(sql: str) -> str:
+        with connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}')
+            return '\n'.join(' '.join(map(str, row)) for row in cursor.fetchall())
+
+    async def assertQueries(self, queries: CapturedQueries, expected_counts: dict[str, int]) -> None:
+        """The method that checks the counts of the statements and that no statement scans a table"""
+
+        statements = [query['sql'] for query in queries.context.captured_queries
+                      if query['sql'].startswith(('SELECT', 'UPDATE', 'INSERT', 'DELETE'))]
+        self.assertEqual({statement: sum(sql.startswith(statement) for sql in statements)
+                          for statement in expected_counts}, expected_counts, statements)
+        self.assertEqual(len(statements), sum(expected_counts.values()), statements)
+
+        for sql in statements:
+            if sql.startswith('INSERT'):
+                continue
+            plan = await database_sync_to_async(self.explain)(sql)
+            # Lookups by an index are 'SEARCH' lines of the plan, 'SCAN' reads the whole table or index
+            self.assertNotRegex(plan, r'\bSCAN\b', sql)
+
+    async def play_handlers(self, connect_counts: list[dict[str, int]], disconnect_counts: dict[str, int]) -> None:
+        battle = await database_sync_to_async(Battle.objects.create)()
+        fleets = generate_many_ships_coords(2, seed=0)
+        players: list[WebsocketCommunicator] = []
+        for counts in connect_counts:
+            async with CapturedQueries() as queries:
+                players.append(await connect(battle.address))
+                await receive_all(players[0], timeout=0.1)
+            await self.assertQueries(queries, counts)
+        await receive_all(players[1])
+
+        async def send(player: WebsocketCommunicator, request_type: str, body: Any = None) -> CapturedQueries:
+            async with CapturedQueries() as queries:
+                await request(player, request_type, body)
+                for communicator in players:
+                    await receive_all(communicator, timeout=0.1)
+            return queries
+
+        # The fleet is kept in the store, the game start is the transition
+        await self.assertQueries(await send(players[0], 'load ships coordinates', fleets[0]), {})
+        await self.assertQueries(await send(players[1], 'load ships coordinates', fleets[1]), {'UPDATE': 1})
+
+        # A hit keeps the move, a miss passes it. The ship of 4 cells is the first one of the fleet
+        ship_cells = {tuple(cell) for ship in fleets[1] for cell in ship}
+        miss = next([x, y] for x in range(10) for y in range(10)
+                    if all((x + i, y + j) not in ship_cells for i in (-1, 0, 1) for j in (-1, 0, 1)))
+        await self.assertQueries(await send(players[0], 'take a shot', fleets[1][0][0]), {})
+        await self.assertQueries(await send(players[0], 'take a shot', miss), {'UPDATE': 1})
+
+        # The end of the game looks up the tournament match of the battle as well
+        await self.assertQueries(await send(players[1], 'surrender'), {'UPDATE': 1, 'SELECT': 1})
+
+        async with CapturedQueries() as queries:
+            await players[0].disconnect(1000)
+            await receive_all(players[1], timeout=0.1)
+        await self.assertQueries(queries, disconnect_counts)
+        await players[1].disconnect(1000)
+
+    @override_settings(PLAYER_SLOTS={'BACKEND': 'sea_battle_app.player_slots.BattleRowSlots'})
+    async def test_battle_row_slots(self) -> None:
+        # The battle, the conditional UPDATE of the slot, the refreshed battle and the refresh of the opponent's battle
+        await self.play_handlers([{'SELECT': 2, 'UPDATE': 1}, {'SELECT': 3, 'UPDATE': 1}],
+                                 {'UPDATE': 1, 'DELETE': 1, 'SELECT': 1})
+
+    @override_settings(PLAYER_SLOTS={'BACKEND': 'sea_battle_app.player_slots.PlayerRowSlots'})
+    async def test_player_row_slots(self) -> None:
+        # The battle, the locked battle, the player row and its slot, and the refresh of the opponent's battle.
+        # Deleting the player row collects the battles that refer to it as well
+        await self.play_handlers([{'SELECT': 2, 'INSERT': 1, 'UPDATE': 1}, {'SELECT': 3, 'INSERT': 1, 'UPDATE': 1}],
+                                 {'SELECT': 4, 'UPDATE': 1, 'DELETE': 1})
@@ -0,0 +1,41 @@
+import random
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from sea_battle_app.battle_logic import PlayerInfo, Bitboard, FIELD_SIZE, generate_many_fleet_masks, \
+    shot_is_valid, process_shot
+from sea_battle_app.simulation import BatchSimulator, play_random_games
+
+
+class BatchSimulatorTest(SimpleTestCase):
+    """The simulator is bit-identical to 'process_shot' on the same fleets and shots"""
+
+    def test_sampled_games(self) -> None:
+        rng = random.Random(0)
+        fleets = generate_many_fleet_masks(50, seed=0)
+        simulator = BatchSimulator(fleets)
+        players_info = [PlayerInfo(Bitboard(ships=list(ships))) for ships in fleets]
+
+        # Some coordinates are drawn out of the field, repeated shots at marked cells are incorrect as well
+        for _ in range(500):
+            shots = np.array([[rng.randrange(-2, FIELD_SIZE + 2) if rng.random() < 0.2 else rng.randrange(FIELD_SIZE)
+                               for _ in range(2)] for _ in fleets])
+            result = simulator.step(shots)
+            for game, player_info in enumerate(players_info):
+                shot = shots[game].tolist()
+                valid = bool(player_info.board.ships) and shot_is_valid(shot, player_info)
+                self.assertEqual(bool(result.valid[game]), valid)
+                if valid:
+                    self.assertEqual(bool(result.hit[game]), process_shot(shot, player_info))
+                self.assertEqual(bool(result.game_over[game]), not player_info.board.ships)
+
+        for game, player_info in enumerate(players_info):
+            self.assertEqual(simulator.cells[game].tolist(), player_info.field_as_int())
+            self.assertEqual(int(simulator.shots[game]), player_info.board.shots)
+            self.assertEqual(int(simulator.ships_left[game]), len(player_info.board.ships))
+        self.assertTrue(simulator.game_over.any())
+
+    def test_random_games_end(self) -> None:
+        shots = play_random_games(generate_many_fleet_masks(20, seed=1), seed=1)
+        self.assertTrue(((shots >= 20) & (shots <= FIELD_SIZE * FIELD_SIZE)).all())
@@ -0,0 +1,120 @@
+import json
+from datetime import timedelta
+from unittest import mock
+
+from channels.db import database_sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.throttling import ScopedRateThrottle
+
+from sea_battle_app.models import Battle, Tournament, TournamentMatch
+from sea_battle_app.reaper import delete_stale_battles
+from sea_battle_app.tournaments import create_tournament
+
+
+class TournamentBracketTest(TestCase):
+    """A match waits for its pair however the battles finish, only the last match of an odd round gets a bye"""
+
+    @staticmethod
+    def finish(tournament: Tournament, round_number: int, position: int, who_win: int = 1) -> None:
+        match = TournamentMatch.objects.get(tournament=tournament, round=round_number, position=position)
+        battle = Battle.objects.get(address=match.battle_address)
+        battle.who_win = who_win
+        battle.save(update_fields=['who_win'])
+
+    @staticmethod
+    def get_bracket(tournament: Tournament) -> dict[tuple[int, int], bool]:
+        """The method that returns whether every match is a bye"""
+
+        return {(match.round, match.position): match.battle_address is None
+                for match in TournamentMatch.objects.filter(tournament=tournament, round__gt=0)}
+
+    def test_out_of_order_finishes(self) -> None:
+        tournament = create_tournament(8)
+        for position in (5, 4, 1, 0):
+            self.finish(tournament, 0, position)
+        self.finish(tournament, 1, 2)
+        self.assertEqual(self.get_bracket(tournament), {(1, 0): False, (1, 2): False})
+
+        for position in (7, 6):
+            self.finish(tournament, 0, position)
+        self.finish(tournament, 1, 3, who_win=2)
+        self.assertEqual(self.get_bracket(tournament), {(1, 0): False, (1, 2): False, (1, 3): False, (2, 1): False})
+
+        for position in (3, 2):
+            self.finish(tournament, 0, position)
+        for round_number, position in ((1, 1), (1, 0), (2, 1), (2, 0)):
+            self.finish(tournament, round_number, position)
+        self.assertEqual(set(self.get_bracket(tournament)), {(1, 0), (1, 1), (1, 2), (1, 3), (2, 0), (2, 1), (3, 0)})
+        self.assertFalse(any(self.get_bracket(tournament).values()))
+
+    def test_byes_of_odd_rounds(self) -> None:
+        tournament = create_tournament(5)
+        self.finish(tournament, 0, 4)
+        self.assertEqual(self.get_bracket(tournament), {(1, 2): True, (2, 1): True})
+
+        for position in range(4):
+            self.finish(tournament, 0, position)
+        self.finish(tournament, 1, 1)
+        self.assertNotIn((2, 0), self.get_bracket(tournament))
+        self.finish(tournament, 1, 0)
+        self.finish(tournament, 2, 0)
+        self.assertEqual(self.get_bracket(tournament),
+                         {(1, 0): False, (1, 1): False, (1, 2): True, (2, 0): False, (2, 1): True, (3, 0): False})
+
+
+# The throttle reads the rates when it is imported
+@mock.patch.object(ScopedRateThrottle, 'THROTTLE_RATES', {'bulk_creation': '2/hour'})
+@override_settings(BULK_CREATION={'MAX_BATTLES': 10000, 'BATCH_SIZE': 3})
+class BulkCreationViewsTest(TransactionTestCase):
+    """Only admins create battles in bulk, by throttled POST requests, and the addresses are streamed by batches"""
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.admin = User.objects.create(username='admin', is_staff=True)
+
+    def test_admins_only(self) -> None:
+        self.assertEqual(self.client.post('/api/create-battles/', {'count': 5}).status_code, 403)
+        self.client.force_login(User.objects.create(username='player'))
+        self.assertEqual(self.client.post('/api/create-tournament/', {'battles': 5}).status_code, 403)
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get('/api/create-battles/?count=5').status_code, 405)
+        self.assertEqual(Battle.objects.count(), 0)
+
+    def test_throttling(self) -> None:
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.post('/api/create-tournament/', {'battles': 5}).status_code, 200)
+        self.assertEqual(self.client.post('/api/create-tournament/', {'battles': 0}).status_code, 400)
+        self.assertEqual(self.client.post('/api/create-tournament/', {'battles': 5}).status_code, 429)
+        self.assertEqual(Battle.objects.count(), 5)
+
+    async def test_streaming_in_event_loop(self) -> None:
+        await database_sync_to_async(self.async_client.force_login)(self.admin)
+        response = await self.async_client.post('/api/create-battles/', {'count': 7},
+                                                content_type='application/json')
+        addresses = json.loads(b''.join(response))['ws_addresses']
+        self.assertEqual(sorted(addresses), sorted(await database_sync_to_async(
+            lambda: list(Battle.objects.values_list('address', flat=True)))()))
+        self.assertEqual(len(addresses), 7)
+
+        tournament = await database_sync_to_async(create_tournament)(3)
+        response = await self.async_client.get(f'/api/tournaments/{tournament.pk}/')
+        self.assertEqual(len(json.loads(b''.join(response))['matches']), 3)
+
+
+@override_settings(REAPER={'UNJOINED_AFTER': 60, 'FINISHED_AFTER': 60, 'ABANDONED_AFTER': 3600, 'BATCH_SIZE': 100})
+class TournamentReapingTest(TestCase):
+    """Battles of a tournament wait for their players, the reaper deletes them only when they are abandoned"""
+
+    def test_unjoined_battles(self) -> None:
+        tournament = create_tournament(2)
+        Battle.objects.create()
+        Battle.objects.update(datetime=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(len(delete_stale_battles(100)), 1)
+        self.assertEqual(set(Battle.objects.values_list('address', flat=True)),
+                         set(TournamentMatch.objects.values_list('battle_address', flat=True)))
+
+        Battle.objects.update(datetime=timezone.now() - timedelta(hours=2))
+        self.assertEqual(len(delete_stale_battles(100)), 2)
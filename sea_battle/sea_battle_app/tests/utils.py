@@ -0,0 +1,89 @@
+import random
+from typing import Any, Optional, Sequence
+
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+from sea_battle_app.battle_logic import generate_many_ships_coords
+from sea_battle_app.channels.routing import websocket_urlpatterns
+
+application = URLRouter(websocket_urlpatterns)
+
+
+async def connect(address: str, query: str = '', subprotocols: Optional[list[str]] = None,
+                  user: Optional[User] = None) -> WebsocketCommunicator:
+    """The function that connects the client to the battle and fails the test if the connection is rejected"""
+
+    communicator = WebsocketCommunicator(application, f'/ws/battle/{address}/{f"?{query}" if query else ""}',
+                                         subprotocols=subprotocols)
+    if user is not None:
+        communicator.scope['user'] = user
+    connected, _ = await communicator.connect()
+    assert connected, f'the connection to {address} was rejected'
+    return communicator
+
+
+async def receive_all(communicator: WebsocketCommunicator, timeout: float = 0.01) -> list[Any]:
+    """The function that receives frames until the client gets nothing for 'timeout' seconds"""
+
+    messages = []
+    while not await communicator.receive_nothing(timeout):
+        messages.append(await communicator.receive_json_from())
+    return messages
+
+
+async def request(communicator: WebsocketCommunicator, request_type: str, body: Any = None) -> None:
+    await communicator.send_json_to({'type': request_type, 'body': body})
+
+
+async def start_battle(address: str, seed: int = 0,
+                       users: Sequence[Optional[User]] = (None, None)) -> tuple[list[WebsocketCommunicator], list[str]]:
+    """
+    The function that connects both players and loads random fleets, so the first player has the move
+
+    Returns the players and their reconnection tokens
+    """
+
+    players, tokens = [await connect(address, user=user) for user in users], []
+    for communicator, ships_coordinates in zip(players, generate_many_ships_coords(2, seed)):
+        frames = await receive_all(communicator)
+        tokens.append(next(frame['body'] for frame in frames if frame['type'] == 'reconnection token'))
+        await request(communicator, 'load ships coordinates', ships_coordinates)
+    for communicator in players:
+        await receive_all(communicator)
+    return players, tokens
+
+
+def get_shots(seed: int = 0) -> list[list[int]]:
+    """The function that returns all cells of the field in a random order"""
+
+    shots = [[x, y] for x in range(10) for y in range(10)]
+    random.Random(seed).shuffle(shots)
+    return shots
+
+
+class CapturedQueries:
+    """
+    The queries of the database connection that consumers use while the block runs
+
+    Consumers query the database in the thread that runs the test, not in the thread of its event loop,
+    so the connection of that thread is captured
+    """
+
+    context: CaptureQueriesContext
+
+    async def __aenter__(self) -> 'CapturedQueries':
+        self.context = await database_sync_to_async(
+            lambda: CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]).__enter__()
+        )()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await database_sync_to_async(self.context.__exit__)(*exc_info)
+
+    def count(self, statement: str) -> int:
+        return sum(query['sql'].startswith(statement) for query in self.context.captured_queries)
@@ -0,0 +1,104 @@
+import json
+from typing import Any, Iterable, Iterator
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from sea_battle_app.models import Battle, Tournament, TournamentMatch
+
+
+def create_battles(count: int) -> list[Battle]:
+    """The function that creates battles in one transaction by 'BULK_CREATION["BATCH_SIZE"]' battles per query"""
+
+    with transaction.atomic():
+        return Battle.objects.create_many(count, batch_size=settings.BULK_CREATION['BATCH_SIZE'])
+
+
+def iter_created_battles(count: int) -> Iterator[list[str]]:
+    """
+    The function that creates battles by 'BULK_CREATION["BATCH_SIZE"]' and yields the addresses of every batch
+
+    Every batch is committed before its addresses are yielded, so they can be used while the rest is created.
+    If the creation stops, the battles that nobody has joined are deleted by the reaper
+    """
+
+    batch_size = settings.BULK_CREATION['BATCH_SIZE']
+    for created in range(0, count, batch_size):
+        yield [battle.address for battle in Battle.objects.create_many(min(batch_size, count - created))]
+
+
+def create_tournament(battles_count: int) -> Tournament:
+    """The function that creates the tournament with 'battles_count' battles in the first round"""
+
+    with transaction.atomic():
+        tournament = Tournament.objects.create()
+        TournamentMatch.objects.bulk_create(
+            [TournamentMatch(tournament=tournament, round=0, position=position, battle_address=battle.address)
+             for position, battle in enumerate(create_battles(battles_count))],
+            batch_size=settings.BULK_CREATION['BATCH_SIZE']
+        )
+    return tournament
+
+
+def schedule_next_matches(tournament_id: int) -> list[TournamentMatch]:
+    """
+    The function that creates a next round match for every pair of matches that both have a winner
+
+    Sizes of the rounds follow from the first round, so only the last match of an odd round gives
+    its winner a bye, a pair that hasn't been created yet is waited for. Matches are scheduled
+    under the tournament row lock, so no match is created twice. Returns the created matches
+    """
+
+    with transaction.atomic():
+        Tournament.objects.select_for_update().filter(pk=tournament_id).first()
+        matches = {(match.round, match.position): match
+                   for match in TournamentMatch.objects.filter(tournament_id=tournament_id)}
+        rounds_sizes = [sum(round_number == 0 for round_number, _ in matches)]
+        while rounds_sizes[-1] > 1:
+            rounds_sizes.append((rounds_sizes[-1] + 1) // 2)
+
+        next_matches = []
+        for (round_number, position), match in matches.items():
+            next_key = (round_number + 1, position // 2)
+            if position % 2 or match.who_win is None or next_key[0] == len(rounds_sizes) or next_key in matches:
+                continue
+
+            pair = matches.get((round_number, position + 1))
+            if position + 1 == rounds_sizes[round_number]:
+                next_matches.append(TournamentMatch(tournament_id=tournament_id, round=next_key[0],
+                                                    position=next_key[1], who_win=1))
+            elif pair is not None and pair.who_win is not None:
+                next_matches.append(TournamentMatch(tournament_id=tournament_id, round=next_key[0],
+                                                    position=next_key[1]))
+
+        battles = iter(create_battles(sum(match.who_win is None for match in next_matches)))
+        for match in next_matches:
+            if match.who_win is None:
+                match.battle_address = next(battles).address
+        return TournamentMatch.objects.bulk_create(next_matches)
+
+
+@receiver(post_save, sender=Battle)
+def record_match_result(instance: Battle, update_fields: Any = None, **kwargs: Any) -> None:
+    """The receiver that copies the winner of the tournament battle into its match and schedules the next round"""
+
+    if instance.who_win is None or update_fields is None or 'who_win' not in update_fields:
+        return
+
+    tournament_ids = list(TournamentMatch.objects.filter(battle_address=instance.address, who_win__isnull=True)
+                          .values_list('tournament', flat=True))
+    if tournament_ids:
+        TournamentMatch.objects.filter(battle_address=instance.address).update(who_win=instance.who_win)
+        while schedule_next_matches(tournament_ids[0]):
+            pass
+
+
+def stream_json_list(key: str, items: Iterable[Any]) -> Iterator[str]:
+    """The function that streams '{key: [items]}' by one item, so a large response isn't built in memory"""
+
+    yield f'{{{json.dumps(key)}: ['
+    for number, item in enumerate(items):
+        yield f'{"," if number else ""}{json.dumps(item)}'
+    yield ']}'
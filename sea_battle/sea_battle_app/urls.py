@@ -1,8 +1,16 @@
 from django.urls import path
 
-from sea_battle_app.views import CreatingBattleView, WsDocsView
+from sea_battle_app.views import BulkCreatingBattlesView, CreatingBattleView, CreatingTournamentView, \
+    LeaderboardView, MatchmakingStatsView, MetricsView, PlayerStatsView, TournamentView, WsDocsView
 
 urlpatterns = [
     path('api/create-battle/', CreatingBattleView.as_view()),
+    path('api/create-battles/', BulkCreatingBattlesView.as_view()),
+    path('api/create-tournament/', CreatingTournamentView.as_view()),
+    path('api/tournaments/<int:pk>/', TournamentView.as_view()),
+    path('api/leaderboard/', LeaderboardView.as_view()),
+    path('api/leaderboard/<str:username>/', PlayerStatsView.as_view()),
+    path('api/matchmaking-stats/', MatchmakingStatsView.as_view()),
+    path('metrics', MetricsView.as_view()),
     path('api/ws-docs/', WsDocsView.as_view())
 ]
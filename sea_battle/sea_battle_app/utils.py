@@ -1,7 +1,147 @@
-import random
+import asyncio
+import itertools
+import os
+import secrets
 import string
+import time
+import zlib
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Coroutine, Generic, Iterator, Optional, Sized, TypeVar
+
+from channels.db import database_sync_to_async
+from django.db import connections
+from django.utils.module_loading import import_string
+
+ADDRESS_ALPHABET = string.digits + string.ascii_lowercase
+ADDRESS_LENGTH = 15
+ADDRESS_PROCESS_BITS = 13
+ADDRESS_COUNTER_BITS = 20
+
+BufferT = TypeVar('BufferT', bound=Sized)
+ItemT = TypeVar('ItemT')
+
+
+address_counter = itertools.count()
+address_process_bits = secrets.randbits(ADDRESS_PROCESS_BITS)
+
+
+def reset_address_process_bits() -> None:
+    """The function that gives a forked process its own bits, so its addresses differ from the parent's ones"""
+
+    global address_process_bits
+    address_process_bits = secrets.randbits(ADDRESS_PROCESS_BITS)
+
+
+os.register_at_fork(after_in_child=reset_address_process_bits)
 
 
 def create_battle_address() -> str:
-    alphabet = string.ascii_lowercase + string.digits
-    return ''.join(random.choices(alphabet, k=15))
+    """
+    The function that creates time-ordered battle address
+
+    The address is a base36 number: milliseconds since the epoch, random bits of the process and
+    the counter of the process. Addresses of one process never collide unless it creates 2^20 of them
+    in a millisecond, and new ones go to the end of the unique index
+    """
+
+    value = (time.time_ns() // 1_000_000) << ADDRESS_PROCESS_BITS + ADDRESS_COUNTER_BITS \
+        | address_process_bits << ADDRESS_COUNTER_BITS | next(address_counter) % (1 << ADDRESS_COUNTER_BITS)
+    chars = []
+    for _ in range(ADDRESS_LENGTH):
+        value, remainder = divmod(value, len(ADDRESS_ALPHABET))
+        chars.append(ADDRESS_ALPHABET[remainder])
+    return ''.join(reversed(chars))
+
+
+def get_shard_index(address: str, shards_count: int) -> int:
+    """
+    The function that maps the battle address to the shard index
+
+    Unlike 'hash', it is the same in all processes. Changing the shards count moves battles between shards,
+    so it must be done without battles in progress
+    """
+
+    return zlib.crc32(address.encode()) % shards_count
+
+
+def iterate_in_thread(items: Iterator[ItemT]) -> Iterator[ItemT]:
+    """
+    The function that takes the items in a dedicated thread if they are iterated in the event loop
+
+    Django 4.1 iterates a streaming response in the event loop under ASGI, where the database can't be used.
+    The loop waits for every item, so the items should be batches that are produced quickly
+    """
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        yield from items
+        return
+
+    exhausted = object()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        try:
+            while True:
+                item = executor.submit(lambda: next(items, exhausted)).result()
+                if item is exhausted:
+                    return
+                yield item  # type: ignore
+        finally:
+            # A generator is closed and the connection of the thread is closed in the thread itself
+            if hasattr(items, 'close'):
+                executor.submit(items.close).result()
+            executor.submit(connections.close_all).result()
+
+
+def create_backend(config: dict[str, Any]) -> Any:
+    """The function that creates the backend from the setting like '{"BACKEND": path, "CONFIG": kwargs}'"""
+
+    return import_string(config['BACKEND'])(**config.get('CONFIG', {}))
+
+
+class BufferedWriter(ABC, Generic[BufferT]):
+    """
+    The process-wide buffer that is written to the database in batches
+
+    Consumers add to the buffer without awaiting and call 'schedule_flush'. The buffer is written
+    when it has 'batch_size' items or every 'flush_interval' seconds, so items that haven't been flushed yet
+    are lost if the process crashes
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float) -> None:
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer = self.create_buffer()
+        self.tasks: set[asyncio.Task] = set()
+        self.periodic_task: Optional[asyncio.Task] = None
+
+    @abstractmethod
+    def create_buffer(self) -> BufferT:
+        """The method that returns a new empty buffer"""
+
+    @abstractmethod
+    def write(self, buffer: BufferT) -> None:
+        """The method that writes the buffer. It runs by 'database_sync_to_async' in a task that nobody awaits"""
+
+    def schedule_flush(self) -> None:
+        if len(self.buffer) >= self.batch_size:
+            self._run(self.flush())
+        if self.periodic_task is None or self.periodic_task.done():
+            self.periodic_task = self._run(self._flush_periodically())
+
+    async def flush(self) -> None:
+        buffer, self.buffer = self.buffer, self.create_buffer()
+        if buffer:
+            await database_sync_to_async(self.write)(buffer)
+
+    def _run(self, coroutine: Coroutine[Any, Any, None]) -> asyncio.Task:
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def _flush_periodically(self) -> None:
+        while self.buffer:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
@@ -1,9 +1,33 @@
+import re
+from typing import Optional, Union
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from django.views.generic import TemplateView
+from rest_framework import status
+from rest_framework.permissions import IsAdminUser
 from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.throttling import ScopedRateThrottle
 from rest_framework.views import APIView
 
-from sea_battle_app.models import Battle
+from sea_battle_app.matchmaking import get_matchmaking_queue
+from sea_battle_app.metrics import collect_metrics
+from sea_battle_app.leaderboard import get_leaderboard_page, get_user_rank, serialize_stats
+from sea_battle_app.models import Battle, PlayerStats, Tournament, TournamentMatch
+from sea_battle_app.tournaments import create_tournament, iter_created_battles, stream_json_list
+from sea_battle_app.utils import iterate_in_thread
+
+
+def get_count(request: Request, name: str) -> Optional[int]:
+    """The function that gets the count parameter between 1 and 'BULK_CREATION["MAX_BATTLES"]' from the body"""
+
+    count = str(request.data.get(name, ''))
+    if not count.isdigit() or not 0 < int(count) <= settings.BULK_CREATION['MAX_BATTLES']:
+        return None
+    return int(count)
 
 
 class CreatingBattleView(APIView):
@@ -15,6 +39,98 @@ class CreatingBattleView(APIView):
         return Response({'ws_address': battle.address})
 
 
+class BulkCreatingView(APIView):
+    """The base view of the creation of many battles by an admin, the requests are throttled by 'bulk_creation' rate"""
+
+    permission_classes = [IsAdminUser]
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = 'bulk_creation'
+
+
+class BulkCreatingBattlesView(BulkCreatingView):
+    """The view that creates 'count' battles and streams the addresses of every batch once it is created"""
+
+    @staticmethod
+    def post(request: Request) -> Union[Response, StreamingHttpResponse]:
+        count = get_count(request, 'count')
+        if count is None:
+            return Response({'error': f'count must be from 1 to {settings.BULK_CREATION["MAX_BATTLES"]}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        addresses = (address for addresses in iterate_in_thread(iter_created_battles(count)) for address in addresses)
+        return StreamingHttpResponse(stream_json_list('ws_addresses', addresses), content_type='application/json')
+
+
+class CreatingTournamentView(BulkCreatingView):
+    """The view that creates the single-elimination tournament with 'battles' battles in the first round"""
+
+    @staticmethod
+    def post(request: Request) -> Response:
+        battles_count = get_count(request, 'battles')
+        if battles_count is None:
+            return Response({'error': f'battles must be from 1 to {settings.BULK_CREATION["MAX_BATTLES"]}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({'id': create_tournament(battles_count).pk})
+
+
+class TournamentView(APIView):
+    """The view that streams the matches of the tournament bracket by rounds"""
+
+    @staticmethod
+    def get(request: Request, pk: int) -> StreamingHttpResponse:
+        tournament = get_object_or_404(Tournament, pk=pk)
+        matches = TournamentMatch.objects.filter(tournament=tournament).order_by('round', 'position') \
+            .values('round', 'position', 'battle_address', 'who_win').iterator()
+        matches = iterate_in_thread(matches)
+        return StreamingHttpResponse(
+            stream_json_list('matches', ({'round': match['round'], 'position': match['position'],
+                                          'ws_address': match['battle_address'], 'who_win': match['who_win']}
+                                         for match in matches)),
+            content_type='application/json'
+        )
+
+
+class MatchmakingStatsView(APIView):
+    """The view that shows matchmaking queue depth and wait time metrics"""
+
+    @staticmethod
+    def get(request: Request) -> Response:
+        return Response(async_to_sync(get_matchmaking_queue().get_stats)())
+
+
+class LeaderboardView(APIView):
+    """The view that shows the page of users ordered by rating, the next page starts after the 'next' cursor"""
+
+    @staticmethod
+    def get(request: Request) -> Response:
+        after = request.query_params.get('after')
+        if after is None:
+            return Response(get_leaderboard_page())
+        if not re.fullmatch(r'-?\d+:\d+', after):
+            return Response({'error': 'after must be the next cursor of the previous page'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        rating, user_id = after.split(':')
+        return Response(get_leaderboard_page((int(rating), int(user_id))))
+
+
+class PlayerStatsView(APIView):
+    """The view that shows the stats and the rank of the user"""
+
+    @staticmethod
+    def get(request: Request, username: str) -> Response:
+        stats = get_object_or_404(PlayerStats.objects.select_related('user'), user__username=username)
+        return Response(serialize_stats(stats, get_user_rank(stats)))
+
+
+class MetricsView(APIView):
+    """The view that exports the metrics of this process in the Prometheus text format"""
+
+    @staticmethod
+    def get(request: Request) -> HttpResponse:
+        return HttpResponse(collect_metrics(), content_type='text/plain; version=0.0.4')
+
+
 class WsDocsView(TemplateView):
     """The view that processes showing of the documentation"""
 